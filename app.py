@@ -8,5 +8,187 @@ migrate = Migrate(app, db)
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def find_duplicate_people():
+    """ Find people who are probably duplicates, for admins to merge. """
+    from dexter.analysis import DuplicatePeopleFinder
+
+    count = DuplicatePeopleFinder().run()
+    db.session.commit()
+    print "Found %d possible duplicates" % count
+
+
+@manager.option('-b', '--bundle', dest='bundle', required=True, help='directory to record into')
+@manager.option('-d', '--day', dest='day', required=True, help='day of the feed to record, such as 2014-09-07')
+@manager.option('-l', '--limit', dest='limit', type=int, default=None, help='maximum number of items to record')
+def record_ingestion(bundle, day, limit=None):
+    """ Record the responses for a day's feed items into a bundle, for benchmark_ingestion.
+    This fetches each item's text and OpenCalais results, even for documents that are
+    already in the database, but doesn't store any documents. """
+    from dateutil.parser import parse
+    from dexter.processing import DocumentProcessorNT
+    from dexter.processing.replay import FixtureBundle, recording, record_feed_item
+
+    bundle = FixtureBundle(bundle)
+    with recording(bundle):
+        dp = DocumentProcessorNT()
+        for i, item in enumerate(dp.fetch_daily_feed_items(parse(day))):
+            if limit and i >= limit:
+                break
+            try:
+                record_feed_item(dp, item)
+            except Exception as e:
+                print "Error processing %s: %s" % (item['url'], e)
+
+    print "Recorded %d responses" % len(bundle)
+
+
+@manager.option('-b', '--bundle', dest='bundle', required=True, help='directory of recorded responses')
+@manager.option('-d', '--day', dest='day', required=True, help='day of the recorded feed, such as 2014-09-07')
+@manager.option('-l', '--limit', dest='limit', type=int, default=None, help='maximum number of items to process')
+@manager.option('--latency', dest='latency', type=float, default=0.05, help='seconds to delay each response')
+@manager.option('--keep', dest='keep', action='store_true', default=False, help="don't delete the new documents")
+def benchmark_ingestion(bundle, day, limit=None, latency=0.05, keep=False):
+    """ Benchmark ingestion of a recorded day's feed. Use a scratch database. """
+    from dateutil.parser import parse
+    from dexter.processing import DocumentProcessorNT
+    from dexter.processing.extractors import CalaisExtractor
+    from dexter.processing.benchmark import IngestionBenchmark
+    from dexter.processing.replay import FixtureBundle, replaying
+
+    # the replay server doesn't check credentials
+    DocumentProcessorNT.FEED_PASSWORD = DocumentProcessorNT.FEED_PASSWORD or 'replay'
+    CalaisExtractor.API_KEY = CalaisExtractor.API_KEY or 'replay'
+
+    with replaying(FixtureBundle(bundle), latency=latency):
+        bench = IngestionBenchmark()
+        try:
+            bench.run(parse(day), limit=limit)
+        finally:
+            if not keep:
+                bench.cleanup()
+
+    print bench.format_report()
+
+
+@manager.option('-d', '--day', dest='day', required=True, help='day of the feed, such as 2014-09-07')
+@manager.option('-u', '--url', dest='url', default=None, help='url of the feed item to profile; defaults to the first item')
+def profile_feed_item(day, url=None):
+    """ Queue a feed item to be processed and profiled by a worker. The profile is
+    saved into the worker's PROFILES_DIR, see dexter.profiling. """
+    from dateutil.parser import parse
+    from dexter.processing import DocumentProcessorNT
+    from dexter.tasks import get_feed_item
+
+    for item in DocumentProcessorNT().fetch_daily_feed_items(parse(day)):
+        if url is None or item['url'] == url:
+            get_feed_item.delay(item, profile=True)
+            print "Queued %s for profiling" % item['url']
+            return
+
+    print "No feed item for %s on %s" % (url, day)
+
+
+@manager.option('-f', '--file', dest='path', required=True, help='JSONL or CSV archive of documents to import')
+@manager.option('-c', '--checkpoint', dest='checkpoint', default=None, help='file to record progress in, to resume an interrupted import')
+@manager.option('-b', '--batch', dest='batch', type=int, default=200, help='number of documents to store at a time')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None, help='number of worker processes; defaults to the number of CPUs')
+@manager.option('-l', '--limit', dest='limit', type=int, default=None, help='maximum number of items to import')
+def bulk_import(path, checkpoint=None, batch=200, workers=None, limit=None):
+    """ Import an archive of historical documents, see dexter.processing.bulk_import. """
+    from dexter.processing.bulk_import import BulkImporter
+
+    importer = BulkImporter(batch_size=batch, workers=workers, checkpoint=checkpoint)
+    importer.run(path, limit=limit)
+    print importer.format_report()
+
+
+@manager.option('-a', '--aspects', dest='aspects', required=True, help='comma-separated aspects to re-extract: entities, taxonomies, sources, places')
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true', default=False, help="report what would change, without changing anything")
+@manager.option('-c', '--checkpoint', dest='checkpoint', default=None, help='file to record progress in, to resume an interrupted run')
+@manager.option('-b', '--batch', dest='batch', type=int, default=100, help='number of documents to re-extract at a time')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None, help='number of worker processes; defaults to the number of CPUs')
+@manager.option('--min-id', dest='min_id', type=int, default=None, help='first document id')
+@manager.option('--max-id', dest='max_id', type=int, default=None, help='last document id')
+def reextract(aspects, dry_run=False, checkpoint=None, batch=100, workers=None, min_id=None, max_id=None):
+    """ Re-run extractors over stored documents, see dexter.processing.reextract. """
+    from dexter.processing.reextract import ReextractionEngine
+
+    engine = ReextractionEngine([a.strip() for a in aspects.split(',')], dry_run=dry_run, batch_size=batch,
+                                workers=workers, checkpoint=checkpoint, min_id=min_id, max_id=max_id)
+    engine.run()
+    print engine.format_report()
+
+
+@manager.option('-d', '--dir', dest='summary_dir', default=None, help='directory of SQL profiles')
+def sql_profile(summary_dir=None):
+    """ Print the per-endpoint SQL profile, as JSON, for all processes. """
+    import json
+    from dexter.profiling import collect_summaries
+
+    summary_dir = summary_dir or app.config.get('SQL_PROFILING_DIR', '/tmp/dexter-sql-profile')
+    print json.dumps(collect_summaries(summary_dir), indent=2, sort_keys=True)
+
+
+
+@manager.command
+def check_views():
+    """ Check that the columns declared in dexter.models.views match the database,
+    and show how long reflecting them would take. """
+    import time
+    from dexter.models.views import check_views as check
+
+    start = time.time()
+    differences = check(db.engine)
+    print "Reflected views in %.2fs" % (time.time() - start)
+
+    for name, declared, actual in differences:
+        print "%s differs:\n  declared: %s\n  database: %s" % (name, ', '.join(declared), ', '.join(actual))
+    if not differences:
+        print "All views match"
+
+
+@manager.option('-b', '--batch', dest='batch', type=int, default=10000, help='number of documents to update at a time')
+def backfill_problems(batch=10000):
+    """ Recompute the analysis problems bitmask of all documents. """
+    from sqlalchemy import func
+    from dexter.models import Document
+    from dexter.models.problems import DocumentAnalysisProblem
+
+    max_id = db.session.query(func.max(Document.id)).scalar() or 0
+    count = 0
+    for start in xrange(0, max_id + 1, batch):
+        count += DocumentAnalysisProblem.update_documents(db.session.connection(), min_id=start, max_id=start + batch - 1)
+        db.session.commit()
+        print "Updated documents up to id %d" % min(max_id, start + batch - 1)
+
+    print "Recomputed problems for %d documents" % count
+
+
+@manager.option('-d', '--day', dest='day', default=None, help='day to count back from, such as 2014-09-07; defaults to yesterday')
+def snapshot_mine(day=None):
+    """ Precompute the Dexter Mine analyses. """
+    from datetime import datetime
+    from dexter.analysis.mine import build_snapshots
+
+    yesterday = datetime.strptime(day, '%Y-%m-%d').date() if day else None
+    build_snapshots(yesterday)
+    print "Built mine snapshots"
+
+
+@manager.option('-m', '--module', dest='module', default='dexter.worker', help='module to import, such as dexter.worker or dexter.core')
+@manager.option('-b', '--budget', dest='budget', type=float, default=None, help='fail if importing takes longer than this many seconds')
+def import_times(module='dexter.worker', budget=None):
+    """ Show how long importing a module takes in a fresh process, and its slowest imports. """
+    import subprocess
+    import sys
+
+    cmd = [sys.executable, '-m', 'dexter.importtime', module]
+    if budget is not None:
+        cmd.extend(['--budget', str(budget)])
+    sys.exit(subprocess.call(cmd))
+
+
 if __name__ == '__main__':
     manager.run()
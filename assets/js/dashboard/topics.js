@@ -11,14 +11,34 @@
       self.dirn = 1;
 
       $('.topics-container')
-        .on('change', '.sort-buttons input', self.sortButtonClick)
-        .load('/activity/topics/detail' + window.location.search, function(text, status, req) {
-          if (status === 'error') {
-            $('.topics-container .loading-indicator').html("<h3>Something went wrong :(</h3><h3>We can't yet find topics for more than about 8000 documents at a time.</h3>");
+        .on('change', '.sort-buttons input', self.sortButtonClick);
+
+      self.loadTopics(false);
+    };
+
+    // Topics are clustered in the background. Until they're ready, the
+    // server responds with a 202 and the progress so far, so we poll.
+    self.loadTopics = function(poll) {
+      var url = '/activity/topics/detail' + window.location.search;
+      if (poll) {
+        url = url + (window.location.search ? '&' : '?') + 'poll=1';
+      }
+
+      $.ajax({
+        url: url,
+        success: function(data, status, req) {
+          if (req.status == 202) {
+            $('.topics-container .progress-bar').css('width', data.progress + '%');
+            setTimeout(function() { self.loadTopics(true); }, 3000);
           } else {
+            $('.topics-container').html(data);
             $('*[data-sparkline]').sparkline();
           }
-        });
+        },
+        error: function() {
+          $('.topics-container .loading-indicator').html("<h3>Something went wrong :(</h3><h3>We can't yet find topics for more than about 8000 documents at a time.</h3>");
+        }
+      });
     };
 
     self.sortButtonClick = function(e) {
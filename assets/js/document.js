@@ -34,6 +34,16 @@
         .on('click', '.show-text', self.showArticleText)
         .on('click', '.attachment', self.showAttachment);
 
+      // keep checking on attachments that are still being processed
+      $('.attachment-list li.pending').each(function() {
+        var li = $(this);
+        self.showAttachmentThumbnail(li, {
+          id: li.data('id'),
+          status: 'pending',
+          download_url: $('a.download', li).attr('href'),
+        });
+      });
+
       // setup the offset adjustments for hilighting portions of the article
       self.$articleText = $('.document-container .article-text');
       self.originalText = self.$articleText.data('original') || '';
@@ -177,6 +187,54 @@
       L.imageOverlay($attachment.data('url'), bounds).addTo(map);
     };
 
+    // attachments are processed in the background, so poll
+    // pending attachments until they're done, giving up after
+    // about five minutes in case the task has been lost
+    self.maxAttachmentPolls = 150;
+
+    self.showAttachmentThumbnail = function(li, attachment, polls) {
+      polls = polls || 0;
+      $('a.download', li).attr('href', attachment.download_url);
+
+      if (attachment.status == 'pending' && polls < self.maxAttachmentPolls) {
+        $('img', li).hide();
+        if ($('.processing', li).length === 0) {
+          $('<i class="fa fa-spinner fa-spin fa-2x processing">').appendTo(li);
+        }
+
+        window.setTimeout(function() {
+          $.getJSON('/articles/attachments/' + attachment.id)
+            .done(function(data) {
+              self.showAttachmentThumbnail(li, data.attachment, polls + 1);
+            })
+            .fail(function() {
+              self.showAttachmentThumbnail(li, attachment, polls + 1);
+            });
+        }, 2000);
+        return false;
+      }
+
+      li.removeClass('pending');
+      $('.processing', li).remove();
+
+      if (attachment.status == 'pending') {
+        $('img', li).replaceWith('<i class="fa fa-exclamation-triangle fa-2x" title="This attachment is taking too long to process, try reloading the page">');
+        return false;
+      }
+
+      if (attachment.status == 'failed') {
+        $('img', li).replaceWith('<i class="fa fa-exclamation-triangle fa-2x" title="This attachment couldn\'t be processed">');
+        return false;
+      }
+
+      $('img', li)
+        .attr('src', attachment.thumbnail_url)
+        .data('url', attachment.url)
+        .data('size', attachment.size)
+        .show();
+      return true;
+    };
+
     self.getAttachmentMap = function() {
       if (!self.attachmentMap) {
         self.attachmentMap = L.map('attachment-slippy', {
@@ -305,7 +363,7 @@
         .on('addedfile', function(e) { $('#dropzone .dz-preview:last-child').append('<i class="fa fa-spinner fa-spin fa-4x">'); });
 
       // show the first attachment, if any
-      $('.attachment-list li:not(.template) .attachment').first().click();
+      $('.attachment-list li:not(.template):not(.pending) .attachment').first().click();
 
       // attachment viewer
       $('.attachment-list')
@@ -331,14 +389,9 @@
         .val(attachment.id)
         .appendTo(li);
 
-      $('a.download', li)
-        .attr('href', attachment.download_url);
-
-      $('img', li)
-        .attr('src', attachment.thumbnail_url)
-        .data('url', attachment.url)
-        .data('size', attachment.size)
-        .click();
+      if (Dexter.documentView.showAttachmentThumbnail(li, attachment)) {
+        $('img', li).click();
+      }
     };
 
     self.deleteAttachment = function(e) {
@@ -350,7 +403,7 @@
       if (confirm('Really delete this attachment?')) {
         $(this).closest('li').remove();
 
-        var attachments = $('.attachment-list li:not(.template) .attachment');
+        var attachments = $('.attachment-list li:not(.template):not(.pending) .attachment');
         if (attachments.length > 0) {
           attachments.first().click();
         } else {
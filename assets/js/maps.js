@@ -57,7 +57,7 @@
         })
         .setRadius(radius)
         .addTo(self.map)
-        .bindPopup(place.full_name + " (" + place.documents.length + ")");
+        .bindPopup(place.full_name + " (" + place.document_count + ")");
     };
 
     self.drawPlaces = function(data) {
@@ -66,10 +66,10 @@
       _.each(data.mentions, function(place) {
         // radius is between 5 and 25, based on the %age of all documents
         // this place relates to
-        var radius = 5 + 30 * (place.documents.length / total);
+        var radius = 5 + 30 * (place.document_count / total);
 
-        if (place.type == 'point') {
-          // it's a point
+        if (place.coordinates) {
+          // it's a point, or a region with a known centroid
           self.drawPlaceMarker(place, place.coordinates, radius);
         } else {
           // it's a region, get the centroid
@@ -1,8 +1,12 @@
-from flask.ext.admin import Admin, expose, AdminIndexView
+import os
+import datetime
+
+from flask.ext.admin import Admin, expose, AdminIndexView, BaseView
 from flask.ext.admin.contrib.sqla import ModelView
 from flask.ext.admin.model.template import macro
+from flask.ext.admin.actions import action
 from wtforms.fields import SelectField, TextAreaField
-from flask import abort
+from flask import abort, flash, send_from_directory
 from flask.ext.security import current_user
 
 from sqlalchemy import desc, func
@@ -295,6 +299,68 @@ class AnalysisNatureView(MyModelView):
         form.topics.query = Topic.all()
 
 
+class PersonMergeCandidateView(MyModelView):
+    can_create = False
+    can_edit = False
+    can_delete = True
+    column_list = (
+        'person',
+        'duplicate',
+        'score',
+        'created_at',
+    )
+    column_labels = dict(
+        person='Keep',
+        duplicate='Merge in',
+        created_at='Found',
+        )
+    column_sortable_list = (
+        'score',
+        'created_at',
+    )
+    column_default_sort = ('score', True)
+    column_formatters = dict(
+        person=lambda v, c, m, p: m.person.name,
+        duplicate=lambda v, c, m, p: m.duplicate.name,
+        )
+
+    @action('merge', 'Merge', 'Merge the selected people? This cannot be undone.')
+    def action_merge(self, ids):
+        candidates = PersonMergeCandidate.query.filter(PersonMergeCandidate.id.in_(ids)).all()
+        count = Person.merge_people([(c.duplicate_id, c.person_id) for c in candidates])
+        db.session.commit()
+        flash('Merged %d people.' % count)
+
+
+class ProfilesView(BaseView):
+    """ Lists the profiles saved by admins with ?_profile=1, see dexter.profiling. """
+    def is_accessible(self):
+        return current_user.is_authenticated() and current_user.admin
+
+    @expose('/')
+    def index(self):
+        import dexter.profiling
+
+        profiles_dir = dexter.profiling.PROFILES_DIR
+        profiles = []
+        if profiles_dir and os.path.exists(profiles_dir):
+            for fname in sorted(os.listdir(profiles_dir), reverse=True):
+                path = os.path.join(profiles_dir, fname)
+                profiles.append({
+                    'name': fname,
+                    'size': os.path.getsize(path),
+                    'modified': datetime.datetime.fromtimestamp(os.path.getmtime(path)),
+                })
+
+        return self.render('admin/profiles.html', profiles=profiles, profiles_dir=profiles_dir,
+                           gevent=dexter.profiling.gevent_active())
+
+    @expose('/<string:fname>')
+    def show(self, fname):
+        import dexter.profiling
+        return send_from_directory(dexter.profiling.PROFILES_DIR, fname, mimetype='text/plain')
+
+
 admin_instance = Admin(url='/admin', base_template='admin/custom_master.html', name="Dexter Admin", index_view=MyIndexView(), template_mode='bootstrap3')
 admin_instance.add_view(UserView(User, db.session, name="Users", endpoint='user'))
 admin_instance.add_view(CountryView(Country, db.session, name="Countries", endpoint='country'))
@@ -314,3 +380,6 @@ admin_instance.add_view(AffiliationView(Affiliation, db.session, name="Affiliati
 admin_instance.add_view(MyModelView(AuthorType, db.session, name="Authors", endpoint="authortypes", category='Source Information'))
 admin_instance.add_view(MyModelView(SourceAge, db.session, name="Ages", endpoint="ages", category='Source Information'))
 admin_instance.add_view(SourceRoleView(SourceRole, db.session, name="Roles", endpoint="roles", category='Source Information'))
+admin_instance.add_view(PersonMergeCandidateView(PersonMergeCandidate, db.session, name="Duplicate People", endpoint="merge-candidates", category='Source Information'))
+
+admin_instance.add_view(ProfilesView(name="Profiles", endpoint="profiles"))
@@ -5,4 +5,5 @@ from topics import TopicAnalyser
 from xlsx_export import XLSXExportBuilder
 from ratings import ChildrenRatingExport, MediaDiversityRatingExport
 from fdi_xlsx_export import FDIExportBuilder
+from people import DuplicatePeopleFinder
 
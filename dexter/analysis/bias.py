@@ -1,80 +1,137 @@
 from __future__ import division
 from collections import defaultdict
-from itertools import groupby
 import logging
 
-from sqlalchemy.orm import joinedload, lazyload
+from sqlalchemy.sql import func, case
 
-from ..models import Document
+from ..models import db, Document, DocumentSource, DocumentFairness, Fairness, Medium, Affiliation
 from dexter.analysis.utils import calculate_entropy
 
 class BiasCalculator:
     """
     Helper class for running bias calculations across
     documents.
+
+    The per-document counts are done in the database, grouped by medium,
+    so no documents are loaded. Media are then grouped by a key function,
+    such as `lambda m: m.group_name()`, in Python.
     """
     log = logging.getLogger(__name__)
 
     def get_query(self):
-        return Document.query\
-            .options(
-                joinedload(Document.sources),
-                joinedload(Document.fairness),
-                joinedload(Document.medium),
-                lazyload('sources.person'),
-                lazyload('sources.unnamed_gender'),
-                lazyload('sources.unnamed_race'))
+        """ A query for the ids of the documents to include. Filter it and
+        pass it to `calculate_bias_scores`. """
+        return db.session.query(Document.id)
 
 
-    def calculate_bias_scores(self, docs, key):
+    def calculate_bias_scores(self, query, key):
         """
-        Return a list of BiasScore instances for +docs+, where groups are calculated
-        by grouping by the +key+ function.
+        Return a list of BiasScore instances for the documents in +query+, sorted by
+        group, where groups are calculated by grouping the documents' media by the
+        +key+ function.
         """
-        docs.sort(key=key)
-        entropy = calculate_entropy(self.count_sources(docs, key))
+        doc_ids = self.doc_ids_subquery(query)
 
-        return [self.calculate_bias(k, list(group), entropy) for k, group in groupby(docs, key)]
+        media = dict((m.id, key(m)) for m in Medium.query.all())
 
+        scores = {}
+        for medium_id, count, fair, favour, oppose in self.count_fairness(doc_ids):
+            group = media[medium_id]
+            score = scores.get(group)
+            if score is None:
+                score = scores[group] = BiasScore()
+                score.group = group
 
-    def calculate_bias(self, group, docs, entropy):
-        """
-        Calculate the bias for +docs+.
-        """
-        score = BiasScore()
-        score.group = group
-        score.count = len(docs)
+            score.count += count
+            # number of docs that are fair, we make it a fraction below
+            score.fair += fair
+            score.favour += favour
+            score.oppose += oppose
 
-        score.parties = entropy.get(group, 0)
+        entropy = calculate_entropy(self.count_sources(doc_ids, media))
 
-        # fraction of docs that are fair
-        score.fair = sum(1 if d.is_fair() else 0 for d in docs)/score.count
+        scores = [scores[group] for group in sorted(scores.iterkeys())]
+        for score in scores:
+            score.parties = entropy.get(score.group, 0)
+            score.fair = score.fair / score.count
 
-        # how many items (dis)favoured?
-        for d in docs:
-            for df in d.fairness:
-                if df.bias_favour:
-                    score.favour += 1
-                if df.bias_oppose:
-                    score.oppose += 1
+        return scores
 
-        return score
 
+    def doc_ids_subquery(self, query):
+        """ A subquery of the distinct ids, as doc_id, of the documents in +query+. """
+        return query.with_entities(Document.id.label('doc_id')).distinct().subquery()
 
-    def count_sources(self, docs, key):
-        """ Group docs by +key+ function and count the
-        source affiliations. Returns a map from keys
-        to counts by affiliation. """
+
+    def count_fairness(self, doc_ids):
+        """
+        Count documents, fair documents and (dis)favoured items per medium,
+        for the documents whose ids are in the +doc_ids+ subquery.
+        Returns a list of (medium_id, count, fair, favour, oppose) tuples.
+        """
+        fair_ids = [f.id for f in Fairness.query.all() if f.name == 'Fair']
+
+        # per-document fairness counts
+        fairness = db.session\
+            .query(
+                DocumentFairness.doc_id.label('doc_id'),
+                func.count(1).label('items'),
+                func.sum(case([(DocumentFairness.fairness_id.in_(fair_ids), 1)], else_=0)).label('fair'),
+                func.count(DocumentFairness.bias_favour_affiliation_id).label('favour'),
+                func.count(DocumentFairness.bias_oppose_affiliation_id).label('oppose'))\
+            .join(doc_ids, doc_ids.c.doc_id == DocumentFairness.doc_id)\
+            .group_by(DocumentFairness.doc_id)\
+            .subquery()
+
+        # a document is fair if it has no fairness items, or only a single 'Fair' one
+        is_fair = case([
+            (fairness.c.items == None, 1),
+            ((fairness.c.items == 1) & (fairness.c.fair == 1), 1),
+        ], else_=0)
+
+        rows = db.session\
+            .query(
+                Document.medium_id,
+                func.count(1),
+                func.sum(is_fair),
+                func.sum(func.ifnull(fairness.c.favour, 0)),
+                func.sum(func.ifnull(fairness.c.oppose, 0)))\
+            .join(doc_ids, doc_ids.c.doc_id == Document.id)\
+            .outerjoin(fairness, fairness.c.doc_id == Document.id)\
+            .group_by(Document.medium_id)\
+            .all()
+
+        # MySQL sums are decimals
+        return [(medium_id, int(count), int(fair), int(favour), int(oppose))
+                for medium_id, count, fair, favour, oppose in rows]
+
+
+    def count_sources(self, doc_ids, media):
+        """ Count the political party affiliations of sources in the documents
+        whose ids are in the +doc_ids+ subquery, grouped by the
+        +media+ map from medium ids to groups. Returns a map from
+        groups to counts by affiliation. """
         counts = defaultdict(lambda: defaultdict(int))
 
-        self.log.debug("Counting sources for %d docs" % len(docs))
+        self.log.debug("Counting sources")
+
+        # 4. are the political parties
+        affiliations = dict((a.id, a.name) for a in Affiliation.query.all() if a.code.startswith('4.'))
+        if not affiliations:
+            return counts
 
-        for doc in docs:
-            for source in doc.sources:
-                # 4. are the political parties
-                if source.affiliation and source.affiliation.code.startswith('4.'):
-                    k = key(doc)
-                    counts[key(doc)][source.affiliation.name] += 1
+        rows = db.session\
+            .query(
+                Document.medium_id,
+                DocumentSource.affiliation_id,
+                func.count(1))\
+            .join(doc_ids, doc_ids.c.doc_id == Document.id)\
+            .join(DocumentSource, DocumentSource.doc_id == Document.id)\
+            .filter(DocumentSource.affiliation_id.in_(affiliations.keys()))\
+            .group_by(Document.medium_id, DocumentSource.affiliation_id)
+
+        for medium_id, affiliation_id, count in rows:
+            counts[media[medium_id]][affiliations[affiliation_id]] += count
 
         self.log.debug("Done")
 
@@ -82,6 +139,7 @@ class BiasCalculator:
 
 
 class BiasScore:
+    group       = None
     parties     = 0
     fair        = 0
     count       = 0
@@ -114,4 +172,3 @@ class BiasScore:
                 "oppose"      : self.oppose,
             }
         }
-
@@ -11,6 +11,7 @@ from sqlalchemy.types import Integer
 
 from ..analysis import BiasCalculator
 from ..models import Document, AnalysisNature, db, Investment
+from ..models.views import DocumentsView, InvestmentsView
 
 
 class FDIExportBuilder:
@@ -40,8 +41,6 @@ class FDIExportBuilder:
         return output.read()
 
     def investments_worksheet(self, wb):
-        from dexter.models.views import InvestmentsView, DocumentsView
-
         ws = wb.add_worksheet('investments')
 
         tables = OrderedDict()
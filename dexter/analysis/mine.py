@@ -0,0 +1,235 @@
+"""
+Nightly snapshots of the Dexter Mine analyses.
+
+The mine shows the same few periods -- the last 7, 30 and 90 days -- to
+every user in a country, so `build_snapshots` runs the media and source
+analysers for each country and period once a night, and stores just the ids
+and numbers the mine pages need in a `MineSnapshot`. The pages then load
+the snapshot instead of re-running the analysers, unless they're filtered
+by keywords or a person.
+"""
+
+import logging
+from datetime import date, timedelta
+
+from dexter.analysis.media import MediaAnalyser, AnalysedMedium
+from dexter.analysis.sources import SourceAnalyser, AnalysedSource, AnalysedUtterance
+from dexter.models import db, Document, Medium, Country, AnalysisNature, Utterance, MineSnapshot
+
+from sqlalchemy.orm import joinedload
+
+log = logging.getLogger(__name__)
+
+# periods that are snapshotted, in days
+PERIODS = (7, 30, 90)
+
+# how long to keep old snapshots, in days
+KEEP_DAYS = 7
+
+
+class MineWindow(object):
+    """
+    The documents for a country that the mine analyses, published in
+    the +days+ days up to the day before +yesterday+.
+    """
+    nature_id = AnalysisNature.ANCHOR_ID
+
+    def __init__(self, country, days=7, yesterday=None):
+        self.country = country
+        self.days = days
+        self.yesterday = yesterday or (date.today() - timedelta(days=1))
+
+    @property
+    def published_from(self):
+        return (self.yesterday - timedelta(days=self.days)).strftime('%Y-%m-%d 00:00:00')
+
+    @property
+    def published_to(self):
+        return (self.yesterday - timedelta(days=1)).strftime('%Y-%m-%d 23:59:59')
+
+    def filter_query(self, query, medium=None):
+        query = query.filter(
+            Document.analysis_nature_id == self.nature_id,
+            Document.country == self.country,
+            Document.published_at >= self.published_from,
+            Document.published_at <= self.published_to)
+
+        if medium:
+            query = query.filter(Document.medium == medium)
+
+        return query
+
+    def document_ids(self, medium=None):
+        return [d[0] for d in self.filter_query(db.session.query(Document.id), medium=medium).all()]
+
+
+def build_snapshots(yesterday=None):
+    """ Build snapshots for all countries and periods. """
+    for country in Country.all():
+        for days in PERIODS:
+            build_window_snapshots(MineWindow(country, days, yesterday))
+            # don't hold all the snapshots in one transaction
+            db.session.commit()
+
+    yesterday = yesterday or (date.today() - timedelta(days=1))
+    MineSnapshot.query\
+        .filter(MineSnapshot.yesterday < yesterday - timedelta(days=KEEP_DAYS))\
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+
+def build_window_snapshots(window):
+    """ Build the snapshots for a window: one for all media, and one for
+    each of the media listed on the mine page. """
+    log.info("Building mine snapshots for %s, %d days" % (window.country.name, window.days))
+
+    doc_ids = window.document_ids()
+    ma = MediaAnalyser(doc_ids=doc_ids)
+    ma.analyse()
+
+    overview = snapshot_sources(doc_ids)
+    overview['media'] = [[m.medium.id, m.count] for m in ma.media]
+    media = [(m.medium, snapshot_sources(window.document_ids(m.medium))) for m in ma.media]
+
+    # replace the old snapshots only once the analysis, which may read
+    # from a replica, is done
+    MineSnapshot.query.filter(
+        MineSnapshot.country_id == window.country.id,
+        MineSnapshot.days == window.days,
+        MineSnapshot.yesterday == window.yesterday).delete(synchronize_session=False)
+
+    add_snapshot(window, None, overview)
+    for medium, data in media:
+        add_snapshot(window, medium, data)
+
+
+def add_snapshot(window, medium, data):
+    snapshot = MineSnapshot()
+    snapshot.country_id = window.country.id
+    snapshot.days = window.days
+    snapshot.medium_id = medium.id if medium else None
+    snapshot.yesterday = window.yesterday
+    snapshot.data = data
+    db.session.add(snapshot)
+    return snapshot
+
+
+def snapshot_sources(doc_ids):
+    """ Run the source analyser over +doc_ids+ and return the results
+    as a json-friendly dict. """
+    sa = SourceAnalyser(doc_ids=doc_ids)
+    sa.analyse()
+    sa.load_utterances()
+
+    # most quoted first, with per-day counts stored sparsely
+    people = sorted(sa.analysed_people.itervalues(), key=lambda s: s.source_counts_total, reverse=True)
+    people = [[
+        s.person.id,
+        s.source_counts_total,
+        s.source_counts_normalised,
+        [[i, round(n, 2)] for i, n in enumerate(s.source_counts) if n],
+    ] for s in people]
+
+    utterances = {}
+    for person_id, analysed in sa.person_utterances.iteritems():
+        utterances[str(person_id)] = [
+            [au.count, au.utterances.index(au.sample), [u.id for u in au.utterances]]
+            for au in analysed]
+
+    return {
+        'n_documents': sa.n_documents,
+        'days': sa.days,
+        'top_people': [s.person.id for s in sa.top_people],
+        'people': people,
+        'utterances': utterances,
+    }
+
+
+class SnapshotMediaAnalyser(MediaAnalyser):
+    """ A MediaAnalyser with results loaded from a snapshot. """
+    def __init__(self, data):
+        self.media = []
+
+        media = dict((m.id, m) for m in Medium.query.all())
+        for medium_id, count in data['media']:
+            if medium_id in media:
+                m = AnalysedMedium()
+                m.medium = media[medium_id]
+                m.count = count
+                self.media.append(m)
+
+        if self.media:
+            biggest = max(m.count for m in self.media)
+            for m in self.media:
+                m.normalised_count = m.count * 1.0 / biggest
+
+
+class SnapshotSourceAnalyser(SourceAnalyser):
+    """
+    A SourceAnalyser with results loaded from a snapshot. Only the top people
+    are loaded up front, use `source_for` for others.
+
+    `doc_ids` isn't known, so set it before calling `load_utterances`.
+    """
+    def __init__(self, data):
+        self.doc_ids = None
+        self.n_documents = data['n_documents']
+        self.days = data['days']
+        self.people_data = dict((p[0], p) for p in data['people'])
+
+        top_ids = data['top_people']
+        people = self._lookup_people(top_ids)
+        self.top_people = [self.analysed_source(people[i]) for i in top_ids if i in people]
+        self.person_utterances = self.restore_utterances(data['utterances'])
+
+    def source_for(self, person):
+        """ The AnalysedSource for +person+, or None if they're not a source
+        in these documents. """
+        if person.id in self.people_data:
+            return self.analysed_source(person)
+
+    def analysed_source(self, person):
+        person_id, total, normalised, counts = self.people_data[person.id]
+
+        src = AnalysedSource()
+        src.person = person
+        src.source_counts_total = total
+        src.source_counts_normalised = normalised
+        src.source_counts = [0] * (self.days + 1)
+        for i, n in counts:
+            src.source_counts[i] = n
+        return src
+
+    def load_people_sources(self):
+        self.people = self._lookup_people(self.people_data.keys())
+
+    def restore_utterances(self, data):
+        ids = set()
+        for analysed in data.itervalues():
+            for count, sample, utterance_ids in analysed:
+                ids.update(utterance_ids)
+
+        utterances = {}
+        if ids:
+            query = Utterance.query\
+                .options(joinedload(Utterance.document))\
+                .options(joinedload('document.medium'))\
+                .filter(Utterance.id.in_(ids))
+            utterances = dict((u.id, u) for u in query)
+
+        person_utterances = {}
+        for person_id, analysed in data.iteritems():
+            for_person = person_utterances[int(person_id)] = []
+            for count, sample, utterance_ids in analysed:
+                if not all(i in utterances for i in utterance_ids):
+                    # deleted since the snapshot was taken
+                    continue
+
+                au = AnalysedUtterance()
+                au.count = count
+                au.utterances = [utterances[i] for i in utterance_ids]
+                au.quote = au.utterances[0].quote
+                au.sample = au.utterances[sample]
+                for_person.append(au)
+
+        return person_utterances
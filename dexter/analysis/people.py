@@ -0,0 +1,127 @@
+from collections import defaultdict
+from itertools import combinations
+import logging
+import re
+
+from unidecode import unidecode
+from sqlalchemy.sql import func
+
+from dexter.models import db, Person, PersonMergeCandidate, DocumentSource
+from dexter.processing.extractors.sources import SourcesExtractor
+from dexter.utils import levenshtein, soundex
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class DuplicatePeopleFinder(object):
+    """
+    Finds people who are probably duplicates of each other, such as
+    "Jacob Zuma", "Jacob G. Zuma" and "President Zuma".
+
+    Comparing every pair of people is too slow, so people are first put into
+    blocks that share a name token or the same first initial and sounding
+    surname, and only people in the same block are compared.
+
+        >>> finder = DuplicatePeopleFinder()
+        >>> finder.run()
+        12
+    """
+    log = logging.getLogger(__name__)
+
+    # pairs of names at least this similar are candidates for merging
+    threshold = 0.85
+    # score for names where one is a subset of the other, with the same surname
+    subset_score = 0.9
+    # ignore blocks larger than this, such as common first names
+    max_block_size = 100
+
+    def __init__(self, threshold=None):
+        if threshold is not None:
+            self.threshold = threshold
+        self.extractor = SourcesExtractor()
+
+    def run(self):
+        """ Find candidates and replace the existing merge candidates with them.
+        Returns the number of candidates found. """
+        candidates = self.find()
+        self.save(candidates)
+        return len(candidates)
+
+    def find(self):
+        """ Return a list of (person_id, duplicate_id, score) tuples, most similar first.
+        The person with more sources is the one that the duplicate would be merged into.
+        """
+        self.log.info("Finding duplicate people")
+
+        counts = dict(db.session
+                      .query(DocumentSource.person_id, func.count(1))
+                      .filter(DocumentSource.person_id != None)  # noqa
+                      .group_by(DocumentSource.person_id)
+                      .all())
+
+        tokens = {}
+        blocks = defaultdict(list)
+        for person_id, name in db.session.query(Person.id, Person.name).yield_per(1000):
+            words = self.normalise(name)
+            if words:
+                tokens[person_id] = words
+                for key in self.blocking_keys(words):
+                    blocks[key].append(person_id)
+
+        seen = set()
+        candidates = []
+        for key, ids in blocks.iteritems():
+            if len(ids) > self.max_block_size:
+                self.log.debug("Skipping block %s with %d people" % (key, len(ids)))
+                continue
+
+            for pair in combinations(sorted(ids), 2):
+                if pair in seen:
+                    continue
+                seen.add(pair)
+
+                a, b = pair
+                score = self.score(tokens[a], tokens[b])
+                if score >= self.threshold:
+                    # keep the person with more sources, or the oldest
+                    if counts.get(b, 0) > counts.get(a, 0):
+                        a, b = b, a
+                    candidates.append((a, b, score))
+
+        candidates.sort(key=lambda c: (-c[2], c[0], c[1]))
+
+        self.log.info("Found %d candidates from %d pairs" % (len(candidates), len(seen)))
+        return candidates
+
+    def save(self, candidates):
+        PersonMergeCandidate.query.delete()
+
+        table = PersonMergeCandidate.__table__
+        for i in xrange(0, len(candidates), 1000):
+            db.session.execute(table.insert(), [
+                {'person_id': a, 'duplicate_id': b, 'score': score}
+                for a, b, score in candidates[i:i + 1000]])
+
+    def normalise(self, name):
+        """ A list of the lowercase words in a name, without titles or initials. """
+        name = self.extractor.clean_name(name)
+        return [w for w in WORD_RE.findall(unidecode(name).lower()) if len(w) > 1]
+
+    def blocking_keys(self, words):
+        keys = set('t:' + w for w in words if len(w) > 2)
+        keys.add('p:%s%s' % (words[0][0], soundex(words[-1])))
+        return keys
+
+    def score(self, words1, words2):
+        """ Similarity of two normalised names, from 0 to 1. """
+        if words1 == words2:
+            return 1.0
+
+        score = levenshtein(' '.join(words1), ' '.join(words2))
+
+        # "zuma" and "jacob zuma"
+        set1, set2 = set(words1), set(words2)
+        if words1[-1] == words2[-1] and (set1 < set2 or set2 < set1):
+            score = max(score, self.subset_score)
+
+        return score
@@ -8,6 +8,7 @@ from sqlalchemy.sql import func
 
 from .utils import calculate_entropy
 from ..models import *  # noqa
+from ..models.views import DocumentSourcesView, DocumentPlacesView, DocumentTaxonomiesView
 
 
 class ChildrenRatingExport:
@@ -222,7 +223,6 @@ class ChildrenRatingExport:
 
     def child_gender_scores(self, row):
         """ Counts of genders of child sources """
-        from dexter.models.views import DocumentSourcesView
 
         # QUOTED child genders
         self.scores_ws.write(row, 0, 'Quoted Child Genders')
@@ -920,7 +920,6 @@ class MediaDiversityRatingExport(ChildrenRatingExport):
 
     def taxonomy_scores(self, row):
         """ Counts of document taxonomies per medium, and their entropy. """
-        from dexter.models.views import DocumentTaxonomiesView
 
         self.scores_ws.write(row, 0, 'Topic')
 
@@ -972,7 +971,6 @@ class MediaDiversityRatingExport(ChildrenRatingExport):
 
     def region_scores(self, row):
         """ Counts of document regions per medium, and their entropy. """
-        from dexter.models.views import DocumentPlacesView
 
         self.scores_ws.write(row, 0, 'Region')
 
@@ -998,7 +996,6 @@ class MediaDiversityRatingExport(ChildrenRatingExport):
 
     def sources_scores(self, row):
         """ Counts of genders of sources """
-        from dexter.models.views import DocumentSourcesView
         self.scores_ws.write(row, 0, 'Sources')
 
         # source affiliations
@@ -7,6 +7,7 @@ from dateutil.parser import parse
 
 from dexter.analysis.base import BaseAnalyser, moving_weighted_avg_zscore
 from dexter.models import db, Document, DocumentSource, Person, Utterance, Entity
+from dexter.minhash import NearDuplicateGrouper
 
 from sqlalchemy.sql import func, distinct, or_, desc
 from sqlalchemy.orm import joinedload
@@ -25,6 +26,9 @@ class SourceAnalyser(BaseAnalyser):
     Helper that runs analyses on document sources.
     """
 
+    # estimated Jaccard similarity above which quotations are considered the same
+    quote_similarity_threshold = 0.6
+
     def __init__(self, doc_ids=None, start_date=None, end_date=None):
         super(SourceAnalyser, self).__init__(doc_ids, start_date, end_date)
         self.top_people = None
@@ -58,29 +62,26 @@ class SourceAnalyser(BaseAnalyser):
 
         self.person_utterances = {}
         for person_id, group in groupby(utterances, lambda u: u.entity.person_id):
+            # group syndicated or slightly edited versions of the same quotation
+            grouper = NearDuplicateGrouper(self.quote_similarity_threshold, shingle_size=2)
             for_person = []
 
             for utterance in group:
-                # are any ones we already have similar?
-                dup = False
-                for au in for_person:
-                    # checking levenshtein similarity is too slow, just see if they
-                    # match directly
-                    if au.quote == utterance.quote:
-                        # it's similar
-                        dup = True
-                        au.count += 1
-                        # collect the documents that have it, one from each medium
-                        if not any(u.document.medium == utterance.document.medium for u in au.utterances):
-                            au.utterances.append(utterance)
-                        break
-
-                if not dup:
+                i = grouper.add(utterance.quote)
+
+                if i == len(for_person):
                     au = AnalysedUtterance()
                     au.quote = utterance.quote
                     au.count = 1
                     au.utterances = [utterance]
                     for_person.append(au)
+                else:
+                    # it's similar
+                    au = for_person[i]
+                    au.count += 1
+                    # collect the documents that have it, one from each medium
+                    if not any(u.document.medium == utterance.document.medium for u in au.utterances):
+                        au.utterances.append(utterance)
 
             # best first
             for_person.sort(key=lambda au: au.count, reverse=True)
@@ -103,6 +104,12 @@ class SourceAnalyser(BaseAnalyser):
             self.person_utterances[person_id] = for_person
 
 
+    def source_for(self, person):
+        """ The AnalysedSource for +person+, or None if they're not a source
+        in these documents. """
+        return self.analysed_people.get(person.id)
+
+
     def load_people_sources(self):
         """
         Load all people source data for this period.
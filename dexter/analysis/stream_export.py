@@ -0,0 +1,189 @@
+"""
+Streaming bulk exports of documents, sources, utterances, places and taxonomies
+as CSV or newline-delimited JSON.
+
+Rather than building the whole export in memory, `StreamExporter` fetches
+the documents a chunk at a time, in order of document id, and yields the
+encoded rows as it goes. A chunk is found by seeking past the last document
+id of the previous chunk, so each query is cheap no matter how far into the
+export it is.
+
+Rows are ordered by document_id. To resume an interrupted export, discard the
+rows for the last document_id received and repeat the request with that
+document_id as the +resume+ id.
+"""
+
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from StringIO import StringIO
+
+from sqlalchemy import select
+
+from ..models import db
+from ..models.views import DocumentsView, DocumentSourcesView, PersonUtterancesView, DocumentPlacesView, DocumentTaxonomiesView
+
+
+# dataset name -> view
+DATASETS = {
+    'documents': DocumentsView,
+    'sources': DocumentSourcesView,
+    'utterances': PersonUtterancesView,
+    'places': DocumentPlacesView,
+    'taxonomies': DocumentTaxonomiesView,
+}
+
+# format -> content type
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class StreamExporter(object):
+    """
+    Streams the rows of a dataset for the documents in a country published
+    between +start_date+ and +end_date+.
+
+        >>> exporter = StreamExporter('sources', 'csv', start_date, end_date, country)
+        >>> for data in exporter.stream():
+        ...     out.write(data)
+    """
+    # number of documents to fetch at a time
+    chunk_size = 500
+
+    def __init__(self, dataset, format, start_date, end_date, country, resume=None):
+        if dataset not in DATASETS:
+            raise ValueError("Unknown dataset: %s" % dataset)
+        if format not in FORMATS:
+            raise ValueError("Unknown format: %s" % format)
+
+        self.view = DATASETS[dataset]
+        self.format = format
+        self.start_date = start_date
+        self.end_date = end_date
+        self.country = country
+        self.resume = resume
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format]
+
+    @property
+    def columns(self):
+        return [c.name for c in self.view.columns]
+
+    def stream(self, compress=False):
+        """ Yield the export as a series of strings, gzipped if +compress+ is True. """
+        chunks = self.encoded_chunks()
+        if compress:
+            chunks = gzip_chunks(chunks)
+        return chunks
+
+    def encoded_chunks(self):
+        if self.format == 'csv':
+            encode = CSVEncoder(self.columns)
+            yield encode.header()
+        else:
+            encode = NDJSONEncoder(self.columns)
+
+        for rows in self.row_chunks():
+            yield encode(rows)
+
+    def row_chunks(self):
+        """ Yield lists of rows, one list per chunk of documents. """
+        last_id = None
+        if self.resume is not None:
+            # the resumed document is included
+            last_id = self.resume - 1
+
+        while True:
+            doc_ids = self.next_document_ids(last_id)
+            if not doc_ids:
+                break
+            last_id = doc_ids[-1]
+
+            query = select(self.view.columns)\
+                .where(self.view.c.document_id.in_(doc_ids))\
+                .order_by(self.view.c.document_id)
+            rows = db.session.execute(query).fetchall()
+            if rows:
+                yield rows
+
+            if len(doc_ids) < self.chunk_size:
+                break
+
+    def next_document_ids(self, last_id=None):
+        """ The ids of the next chunk of documents after +last_id+. """
+        query = select([DocumentsView.c.document_id])\
+            .where(DocumentsView.c.published_at >= self.start_date)\
+            .where(DocumentsView.c.published_at <= self.end_date)\
+            .where(DocumentsView.c.country == self.country.name)\
+            .order_by(DocumentsView.c.document_id)\
+            .limit(self.chunk_size)
+
+        if last_id is not None:
+            query = query.where(DocumentsView.c.document_id > last_id)
+
+        return [r[0] for r in db.session.execute(query)]
+
+
+def format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CSVEncoder(object):
+    """ Encodes rows as utf-8 CSV lines. """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def header(self):
+        return self.encode([self.columns])
+
+    def __call__(self, rows):
+        return self.encode(rows)
+
+    def encode(self, rows):
+        out = StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow([self.encode_value(v) for v in row])
+        return out.getvalue()
+
+    def encode_value(self, value):
+        value = format_value(value)
+        if value is None:
+            return ''
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+
+class NDJSONEncoder(object):
+    """ Encodes rows as JSON objects, one per line. """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __call__(self, rows):
+        lines = []
+        for row in rows:
+            obj = dict((c, format_value(v)) for c, v in zip(self.columns, row))
+            lines.append(json.dumps(obj, separators=(',', ':')))
+            lines.append('\n')
+        return ''.join(lines)
+
+
+def gzip_chunks(chunks):
+    """ Gzip a series of strings on the fly. """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        # flush each chunk so that the client isn't left waiting on
+        # data sitting in the compressor
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,13 +1,15 @@
 import collections
+import logging
 import math
 from itertools import groupby
 from dateutil.parser import parse
 
 from dexter.analysis.base import BaseAnalyser, moving_weighted_avg_zscore
-from dexter.models import db, Document, DocumentEntity, Entity, Cluster, ClusteredDocument
+from dexter.models import db, Document, DocumentEntity, Entity, Cluster, ClusteredDocument, Medium, TopicClustering
 
 from sqlalchemy.sql import func, distinct
-from sqlalchemy.orm import subqueryload
+
+log = logging.getLogger(__name__)
 
 
 class AnalysedMention(object):
@@ -135,7 +137,7 @@ class TopicAnalyser(BaseAnalyser):
 
         return freqs
 
-    def find_topics(self):
+    def find_topics(self, progress=None):
         """
         Run clustering on these documents and identify common topics.
 
@@ -151,6 +153,9 @@ class TopicAnalyser(BaseAnalyser):
 
         The results are stored in `clustered_topics`.
 
+        :param progress: optional function called with the percentage complete
+                         as the clustering progresses.
+
         See also: https://github.com/ariddell/lda
         """
         from sklearn.feature_extraction import DictVectorizer
@@ -158,36 +163,43 @@ class TopicAnalyser(BaseAnalyser):
 
         # TODO: factor people into cluster calcs
 
+        progress = progress or (lambda pct: None)
         self.clustered_topics = []
 
-        # load documents and their entities
-        docs = Document.query\
-            .options(subqueryload('entities'),
-                     subqueryload('medium'))\
+        # (id, published_at, medium_id) tuples for each document, in id order
+        docs = db.session.query(Document.id, Document.published_at, Document.medium_id)\
             .filter(Document.id.in_(self.doc_ids))\
+            .order_by(Document.id)\
             .all()
 
         if not docs:
             return
 
+        progress(10)
+
         # guess at the number of topics, between 1 and 50
         n_topics = max(min(50, len(docs)/5), 1)
 
         # list of entity maps for each document, from entity name to occurrence count
-        entities = [dict(('%s-%s' % (de.entity.group, de.entity.name), de.count or 1)
-                         for de in d.entities) for d in docs]
-        vec = DictVectorizer(sparse=True)
+        entities = self._load_entity_counts([d[0] for d in docs])
+        progress(20)
 
-        # TODO: we should ideally use sparse, but it causes the lda library to fail
+        # lda needs integer counts, and works directly with the sparse matrix
+        vec = DictVectorizer(sparse=True, dtype=numpy.int64)
         entity_vector = vec.fit_transform(entities)
         features = numpy.array(vec.feature_names_)
+        del entities
+        progress(30)
 
         clusters, lda_model = self._run_lda(entity_vector, n_topics)
         del entity_vector
         del vec
+        progress(90)
+
+        media = dict((m.id, m) for m in Medium.query.all())
 
         # for normalising histograms
-        day_counts = self.date_histogram(d.published_at for d in docs)
+        day_counts = self.date_histogram(d[1] for d in docs)
 
         # generate topic info
         for i, clustering in clusters.iteritems():
@@ -200,7 +212,7 @@ class TopicAnalyser(BaseAnalyser):
             clustering.sort(key=lambda p: p[1], reverse=True)
             cluster_docs = [docs[p[0]] for p in clustering]
 
-            cluster = Cluster.find_or_create(docs=cluster_docs)
+            cluster = Cluster.find_or_create(doc_ids=[d[0] for d in cluster_docs])
 
             # top 8 features for this cluster as (feature, weight) pairs
             indexes = numpy.argsort(lda_model.components_[i])[:-8:-1]
@@ -218,11 +230,11 @@ class TopicAnalyser(BaseAnalyser):
             cluster.stars = math.ceil((cluster.score - self.topic_score_threshold) / ((1.0 - self.topic_score_threshold) / 3.0))
 
             # media counts
-            media = dict(collections.Counter([d.medium for d in cluster_docs]))
-            cluster.media_counts = sorted(media.items(), key=lambda p: p[1], reverse=True)
+            counts = collections.Counter([media[d[2]] for d in cluster_docs])
+            cluster.media_counts = sorted(counts.items(), key=lambda p: p[1], reverse=True)
 
             # publication dates
-            cluster.histogram = self.date_histogram((d.published_at for d in cluster_docs))
+            cluster.histogram = self.date_histogram((d[1] for d in cluster_docs))
             cluster.trend = moving_weighted_avg_zscore(cluster.histogram)
             cluster.histogram = self.normalise_histogram(cluster.histogram, day_counts)
 
@@ -231,6 +243,26 @@ class TopicAnalyser(BaseAnalyser):
         # sort clusters by size
         self.clustered_topics.sort(key=lambda t: t.score, reverse=True)
 
+    def _load_entity_counts(self, doc_ids):
+        """
+        Load the entities mentioned in each document, without loading
+        documents or entities into the session.
+
+        :param doc_ids: sorted list of document ids
+        :return: list of dicts from entity key to mention count, one for each document.
+        """
+        rows = db.session.query(DocumentEntity.doc_id, Entity.group, Entity.name, DocumentEntity.count)\
+            .join(Entity, DocumentEntity.entity_id == Entity.id)\
+            .filter(DocumentEntity.doc_id.in_(doc_ids))\
+            .order_by(DocumentEntity.doc_id)\
+            .yield_per(5000)
+
+        counts = dict((doc_id, {}) for doc_id in doc_ids)
+        for doc_id, group, name, count in rows:
+            counts[doc_id]['%s-%s' % (group, name)] = count or 1
+
+        return [counts[doc_id] for doc_id in doc_ids]
+
     def _run_lda(self, data, n_topics):
         """
         Run LDA algorithm.
@@ -254,6 +286,47 @@ class TopicAnalyser(BaseAnalyser):
 
         return clusters, lda_model
 
+    def topics_as_dict(self):
+        """
+        The clustered topics, in a form that can be serialised. The clusters
+        must have been saved, since they're referenced by id.
+        """
+        return {
+            'topics': [{
+                'cluster_id': t.id,
+                'features': [[f, float(w)] for f, w in t.features],
+                'score': float(t.score),
+                'stars': t.stars,
+                'media_counts': [[m.id, n] for m, n in t.media_counts],
+                'histogram': t.histogram,
+                'trend': float(t.trend),
+            } for t in self.clustered_topics]
+        }
+
+    def load_topics(self, data):
+        """
+        Load clustered topics previously serialised with `topics_as_dict`.
+        """
+        topics = data['topics']
+        clusters = {}
+        if topics:
+            clusters = dict((c.id, c) for c in Cluster.query.filter(Cluster.id.in_(t['cluster_id'] for t in topics)))
+        media = dict((m.id, m) for m in Medium.query.all())
+
+        self.clustered_topics = []
+        for t in topics:
+            cluster = clusters.get(t['cluster_id'])
+            if cluster is None:
+                continue
+
+            cluster.features = t['features']
+            cluster.score = t['score']
+            cluster.stars = t['stars']
+            cluster.media_counts = [(media[m], n) for m, n in t['media_counts']]
+            cluster.histogram = t['histogram']
+            cluster.trend = t['trend']
+            self.clustered_topics.append(cluster)
+
     def date_histogram(self, dates):
         """
         Bucketize an iterable of datetime instances across the period
@@ -273,3 +346,35 @@ class TopicAnalyser(BaseAnalyser):
             if n > 0:
                 histo[i] = float(histo[i]) / n
         return histo
+
+
+def cluster_topics(clustering):
+    """
+    Run the topic clustering described by a TopicClustering, recording progress
+    as it goes and the results when it's done. This commits the session.
+    """
+    log.info("Clustering topics for %s" % clustering)
+
+    def progress(pct):
+        clustering.progress = pct
+        db.session.commit()
+
+    try:
+        clustering.status = TopicClustering.RUNNING
+        progress(0)
+
+        ta = TopicAnalyser(doc_ids=clustering.doc_ids)
+        ta.find_topics(progress=progress)
+        ta.save()
+        db.session.flush()
+
+        clustering.result = ta.topics_as_dict()
+        clustering.status = TopicClustering.DONE
+        progress(100)
+    except:
+        db.session.rollback()
+        clustering.status = TopicClustering.FAILED
+        db.session.commit()
+        raise
+
+    log.info("Clustered topics for %s" % clustering)
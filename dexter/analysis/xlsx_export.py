@@ -11,6 +11,7 @@ from sqlalchemy.types import Integer
 
 from ..analysis import BiasCalculator
 from ..models import Document, AnalysisNature, db
+from ..models.views import DocumentsView, DocumentSourcesView, PersonUtterancesView, DocumentFairnessView, DocumentKeywordsView, DocumentPlacesView, DocumentPrinciplesView, DocumentChildrenView, DocumentIssuesView, DocumentTaxonomiesView
 
 
 class XLSXExportBuilder:
@@ -122,15 +123,11 @@ class XLSXExportBuilder:
         ws.write('B16', self.filter(Document.query).count())
 
     def documents_worksheet(self, wb):
-        from dexter.models.views import DocumentsView
-
         ws = wb.add_worksheet('raw_documents')
         docs = self.filter(db.session.query(DocumentsView).join(Document)).all()
         self.write_table(ws, 'Documents', docs)
 
     def sources_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentSourcesView
-
         ws = wb.add_worksheet('raw_sources')
 
         tables = OrderedDict()
@@ -144,16 +141,12 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Sources', rows)
 
     def utterances_worksheet(self, wb):
-        from dexter.models.views import PersonUtterancesView
-
         ws = wb.add_worksheet('quotations')
 
         rows = self.filter(db.session.query(PersonUtterancesView).join(Document)).all()
         self.write_table(ws, 'Quotations', rows)
 
     def issues_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentIssuesView
-
         ws = wb.add_worksheet('issues')
 
         tables = OrderedDict()
@@ -169,7 +162,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Issues', rows)
 
     def keywords_worksheet(self, wb):
-        from dexter.models.views import DocumentKeywordsView
         from dexter.models import DocumentKeyword
 
         ws = wb.add_worksheet('raw_keywords')
@@ -190,8 +182,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Keywords', rows)
 
     def taxonomies_worksheet(self, wb):
-        from dexter.models.views import DocumentTaxonomiesView, DocumentsView
-
         ws = wb.add_worksheet('raw_taxonomies')
 
         tables = OrderedDict()
@@ -207,8 +197,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Taxonomies', rows)
 
     def fairness_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentFairnessView
-
         ws = wb.add_worksheet('fairness')
 
         tables = OrderedDict()
@@ -222,8 +210,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Fairness', rows)
 
     def principles_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentPrinciplesView
-
         ws = wb.add_worksheet('principles')
 
         # supported
@@ -265,8 +251,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Principles', rows)
 
     def origin_worksheet(self, wb):
-        from dexter.models.views import DocumentsView
-
         ws = wb.add_worksheet('origins')
 
         query = db.session.query(
@@ -288,8 +272,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'OriginGroups', rows, rownum=rownum)
 
     def topic_worksheet(self, wb):
-        from dexter.models.views import DocumentsView
-
         ws = wb.add_worksheet('topics')
 
         # topic groups
@@ -313,8 +295,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Topics', rows, rownum=rownum)
 
     def children_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentChildrenView
-
         ws = wb.add_worksheet('raw_children')
 
         tables = OrderedDict()
@@ -328,8 +308,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Children', rows)
 
     def child_victimisation_worksheet(self, wb):
-        from dexter.models.views import DocumentChildrenView
-
         ws = wb.add_worksheet('child_secondary_victimisation')
 
         rows = self.filter(
@@ -355,8 +333,6 @@ class XLSXExportBuilder:
         })
 
     def child_focus_worksheet(self, wb):
-        from dexter.models.views import DocumentChildrenView
-
         query = db.session.query(
             DocumentChildrenView.c.child_focused,
             func.count(1).label('count')
@@ -374,7 +350,6 @@ class XLSXExportBuilder:
         those children. All reports are source focused, providing counts
         of *sources* in each category.
         """
-        from dexter.models.views import DocumentsView, DocumentSourcesView
 
         # genders
         query = db.session.query(
@@ -468,7 +443,6 @@ class XLSXExportBuilder:
         those children. All reports are source focused, providing counts
         of *sources* in each category.
         """
-        from dexter.models.views import DocumentsView, DocumentSourcesView
 
         # races
         rows = self.filter(
@@ -499,8 +473,6 @@ class XLSXExportBuilder:
         self.write_summed_table(ws, 'RaceTopics', query, rownum=rownum)
 
     def child_context_worksheet(self, wb):
-        from dexter.models.views import DocumentChildrenView
-
         rows = self.filter(
             db.session.query(
                 func.sum(DocumentChildrenView.c.basic_context == 'basic-context', type_=Integer).label('basic_context'),
@@ -570,8 +542,6 @@ class XLSXExportBuilder:
         return len(data) + 2
 
     def places_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentPlacesView
-
         ws = wb.add_worksheet('raw_places')
 
         tables = OrderedDict()
@@ -586,8 +556,6 @@ class XLSXExportBuilder:
         self.write_table(ws, 'Places', rows)
 
     def everything_worksheet(self, wb):
-        from dexter.models.views import DocumentsView, DocumentSourcesView, DocumentFairnessView, DocumentPlacesView
-
         ws = wb.add_worksheet('raw_everything')
 
         tables = OrderedDict()
@@ -609,8 +577,7 @@ class XLSXExportBuilder:
         ws = wb.add_worksheet('bias')
 
         calc = BiasCalculator()
-        docs = self.filter(calc.get_query()).all()
-        scores = calc.calculate_bias_scores(docs, key=lambda d: d.medium.group_name())
+        scores = calc.calculate_bias_scores(self.filter(calc.get_query()), key=lambda m: m.group_name())
 
         ws.write(1, 0, 'oppose')
         ws.write(2, 0, 'favour')
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta
 from dateutil.parser import parse
 log = logging.getLogger(__name__)
 
-from flask import request, url_for, redirect, jsonify, abort
+from flask import request, url_for, redirect, jsonify, abort, make_response, Response, stream_with_context
 from flask.ext.security import roles_accepted, current_user, login_required
 from flask.ext import htauth
 from flask_cors import cross_origin
@@ -15,6 +15,10 @@ from sqlalchemy.sql import func
 from .app import app
 from .models import db, Author, Person, Entity, Document, DocumentSource, Medium, Location, Topic, Affiliation, DocumentPlace, Place, Country
 from .analysis import BiasCalculator
+from .analysis.stream_export import StreamExporter, DATASETS, FORMATS
+from .models.views import DocumentsView, DocumentSourcesView, DocumentPlacesView
+from .processing.metrics import IngestionMetrics
+from .replica import uses_replica, replica_iter
 
 @app.route('/api/authors')
 @login_required
@@ -71,7 +75,6 @@ def api_people_sourced(name):
     """
     Returns the documents where a person has been sourced.
     """
-    from dexter.models.views import DocumentsView
 
     start_date, end_date = api_date_range(request)
     name = urllib.unquote_plus(name)
@@ -144,6 +147,7 @@ def api_group_entities(group):
 # THIS IS A PUBLIC API!
 @app.route('/api/feeds/sources/people')
 @cross_origin()
+@uses_replica
 def api_feed_people():
     start_date, end_date = api_date_range(request)
 
@@ -156,6 +160,7 @@ def api_feed_people():
 @app.route('/api/feeds/sources')
 @app.route('/api/feeds/sources/<string:group>')
 @htauth.authenticated
+@uses_replica
 def api_feed_sources(group=None):
     start_date, end_date = api_date_range(request)
     keys = request.args.get('keys', '').strip()
@@ -167,8 +172,8 @@ def api_feed_sources(group=None):
 
 @app.route('/api/feeds/topics')
 @htauth.authenticated
+@uses_replica
 def api_feed_topics():
-    from dexter.models.views import DocumentSourcesView, DocumentsView, DocumentPlacesView
 
     start_date, end_date = api_date_range(request)
 
@@ -208,8 +213,8 @@ def api_feed_topics():
 
 @app.route('/api/feeds/origins')
 @htauth.authenticated
+@uses_replica
 def api_feed_origins():
-    from dexter.models.views import DocumentsView
 
     start_date, end_date = api_date_range(request)
 
@@ -240,11 +245,12 @@ def api_feed_origins():
 
 @app.route('/api/feeds/bias')
 @htauth.authenticated
+@uses_replica
 def api_feed_bias():
     start_date, end_date = api_date_range(request)
     calc = BiasCalculator()
 
-    log.info("Loading documents for bias calculation")
+    log.info("Calculating bias scores")
     query = calc.get_query()\
             .join(Country)\
             .filter(Document.published_at >= start_date)\
@@ -252,11 +258,9 @@ def api_feed_bias():
 
     query = filter_country(query, Country.name, request.args.get('country'))
 
-    documents = query.all()
+    scores = calc.calculate_bias_scores(query, key=lambda m: (m.group_name(), m.medium_type))
 
-    log.info("Loaded %d docs" % len(documents))
-
-    scores = calc.calculate_bias_scores(documents, key=lambda d: (d.medium.group_name(), d.medium.medium_type))
+    log.info("Calculated %d bias scores" % len(scores))
 
     cells = []
     for score in scores:
@@ -274,8 +278,47 @@ def api_feed_bias():
     return jsonify(results)
 
 
+
+@app.route('/api/export/<string:dataset>.<string:format>')
+@htauth.authenticated
+def api_export(dataset, format):
+    """ Stream a dataset for a date range as CSV or NDJSON, see dexter.analysis.stream_export. """
+    if dataset not in DATASETS or format not in FORMATS:
+        abort(404)
+
+    start_date, end_date = api_date_range(request)
+    country = api_country(request.args.get('country'))
+
+    resume = request.args.get('resume')
+    if resume:
+        try:
+            resume = int(resume)
+        except ValueError:
+            abort(400, 'invalid resume id')
+
+    exporter = StreamExporter(dataset, format, start_date, end_date, country, resume=resume or None)
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+
+    # no content length, so this is sent with chunked transfer encoding
+    response = Response(stream_with_context(replica_iter(exporter.stream(compress=compress))), content_type=exporter.content_type)
+    response.headers["Content-Disposition"] = "attachment; filename=%s.%s" % (dataset, format)
+    if compress:
+        response.headers["Content-Encoding"] = 'gzip'
+        response.headers["Vary"] = 'Accept-Encoding'
+    return response
+
+
+@app.route('/metrics')
+@htauth.authenticated
+def metrics():
+    """ Ingestion metrics for all workers, for Prometheus to scrape. """
+    response = make_response(IngestionMetrics.collect().to_prometheus())
+    response.headers["Content-Type"] = 'text/plain; version=0.0.4'
+    return response
+
 @app.route('/api/feeds/metadata')
 @htauth.authenticated
+@uses_replica
 def api_feed_metadata():
     data = {}
 
@@ -331,7 +374,6 @@ def get_sources_feed(start_date, end_date, keys=None, group=None, source_type=No
     Get a rollup of sources over a period, where 'keys' is a list
     of keys to group them by.
     """
-    from dexter.models.views import DocumentSourcesView, DocumentsView, DocumentPlacesView
 
     if group and group not in ['political-parties', 'groups']:
         abort(404)
@@ -397,6 +439,10 @@ def get_sources_feed(start_date, end_date, keys=None, group=None, source_type=No
     return results
 
 def filter_country(query, col, country=None):
+    return query.filter(col == api_country(country))
+
+def api_country(country=None):
+    """ The country with code +country+, or the user's country, aborting if it's invalid. """
     if not country:
         if current_user and current_user.is_authenticated():
             country = current_user.country
@@ -408,5 +454,5 @@ def filter_country(query, col, country=None):
     if not country:
         abort(400, 'invalid country')
 
-    return query.filter(col == country)
+    return country
 
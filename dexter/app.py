@@ -35,21 +35,18 @@ def log_attach_user_id(sender, **extra):
 request_started.connect(log_attach_user_id, app)
 
 
-# setup templates and haml
-from flask.ext.mako import MakoTemplates, _lookup, render_template
-import haml
-MakoTemplates(app)
-app.config['MAKO_PREPROCESSOR'] = haml.preprocessor
-app.config['MAKO_TRANSLATE_EXCEPTIONS'] = False
-app.config['MAKO_DEFAULT_FILTERS'] = ['decode.utf8']
+# NOTE: this sets up what both the web app and Celery workers need. Things
+# that only the web app needs, such as templates and views, are setup in
+# dexter.core, and document processing is setup in dexter.worker.
 
-# CSRF protection
-from flask_wtf.csrf import CsrfProtect
-CsrfProtect(app)
+# Database, with heavy reads optionally sent to a replica, see dexter.replica
+from .replica import RoutingSQLAlchemy
+db = RoutingSQLAlchemy(app)
 
-# Database
-from flask.ext.sqlalchemy import SQLAlchemy
-db = SQLAlchemy(app)
+# optional per-request SQL profiling, and profiling of requests for admins
+from .profiling import setup_sql_profiling, setup_code_profiling
+setup_sql_profiling(app)
+setup_code_profiling(app)
 
 
 # Mail
@@ -57,11 +54,9 @@ from flask_mail import Mail
 mail = Mail(app)
 
 
-# htpasswd-based basic auth for API access
-from flask.ext import htauth
-app.config['HTAUTH_HTPASSWD_PATH'] = './resources/nginx/htpasswd'
-app.config['HTAUTH_REALM'] = 'Dexter'
-htauth.HTAuth(app)
+# server-side cache
+from .cache import setup_cache
+setup_cache(app)
 
 
 # file attachments
@@ -69,7 +64,10 @@ from .attachments import setup_attachments
 setup_attachments(app)
 
 # celery tasks
+from celery import Celery
+celery_app = Celery('dexter', include=['dexter.tasks', 'dexter.app'])
 if env == 'production':
-    from celery import Celery
-    celery_app = Celery('dexter', include=['dexter.tasks', 'dexter.app'])
     celery_app.config_from_object('dexter.config.celeryconfig')
+else:
+    # there's no broker outside of production, so run tasks immediately, in-process
+    celery_app.conf.update(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
@@ -4,10 +4,8 @@ from flask import request, url_for, flash, redirect, make_response, jsonify, abo
 from flask.ext.mako import render_template
 from flask.ext.security import roles_accepted, current_user, login_required
 
-from wand.exceptions import WandError
-
 from .app import app
-from .models import db, Document, Issue, DocumentPlace, DocumentAttachment, DocumentTag, Investment, Phases, Sectors, \
+from .models import db, Document, Issue, DocumentPlace, DocumentAttachment, DocumentTag, Tag, Investment, Phases, Sectors, \
     InvestmentOrigins, InvestmentType, Currencies, Industries, Involvements1, Involvements2, Involvements3, \
     ValueUnits, Provinces
 from .models.document import DocumentForm
@@ -371,8 +369,11 @@ def edit_article_analysis(id):
                 # below. So, run it after the commit. It sucks that we don't do this all
                 # in one transaction. We should use a different form mechanism
                 # that updates everything
-                document.relearn_source_affiliations()
-                db.session.commit()
+                if document.relearn_source_affiliations():
+                    db.session.commit()
+
+                    from dexter.tasks import schedule_relearn_affiliations
+                    schedule_relearn_affiliations()
 
                 flash('Analysis updated.')
 
@@ -513,16 +514,14 @@ def create_article_attachment():
             if not DocumentAttachment.is_acceptable(upload):
                 raise ValueError('Only image and PDF attachments are supported')
 
-            try:
-                attachment = DocumentAttachment.from_upload(upload, current_user)
-            except WandError as e:
-                log.warn("Couldn't process attachment: %s, %s: %s" % (upload.mimetype, upload.filename, e.message),
-                         exc_info=e)
-                raise ValueError('Only image and PDF attachments are supported')
-
+            # this returns a pending attachment that's processed in the background
+            attachment = DocumentAttachment.from_upload(upload, current_user, background=True)
             db.session.add(attachment)
             db.session.commit()
 
+            from dexter.tasks import process_attachment
+            process_attachment.delay(attachment.id)
+
             return jsonify({'attachment': attachment.to_json()})
 
         raise ValueError("Need a file attachment")
@@ -530,18 +529,23 @@ def create_article_attachment():
         return (make_response(e.message), 400, [])
 
 
+@app.route('/articles/attachments/<int:id>')
+@login_required
+@roles_accepted('monitor', 'fdi')
+def show_article_attachment(id):
+    attachment = DocumentAttachment.query.get_or_404(id)
+    return jsonify({'attachment': attachment.to_json()})
+
+
 @app.route('/articles/add-tag', methods=['POST'])
 @login_required
 @roles_accepted('monitor', 'fdi')
 def add_article_tags():
-    tags = DocumentTag.split(request.form.get('tag', '').strip())
-    doc_ids = DocumentTag.split(request.form.get('doc_ids', ''))
-    docs = Document.query.filter(Document.id.in_(doc_ids))
-
-    if tags and tags:
-        for doc in docs:
-            for tag in tags:
-                doc.tags.add(tag)
+    tags = set(t for t in DocumentTag.split(request.form.get('tag', '').strip()) if t)
+    doc_ids = [int(i) for i in DocumentTag.split(request.form.get('doc_ids', '')) if i.isdigit()]
+
+    if tags and doc_ids:
+        Tag.add_to_documents(tags, doc_ids)
     db.session.commit()
     return '', 200
 
@@ -550,13 +554,10 @@ def add_article_tags():
 @login_required
 @roles_accepted('monitor', 'fdi')
 def remove_article_tags():
-    tags = DocumentTag.split(request.form.get('tag', '').strip())
-    doc_ids = DocumentTag.split(request.form.get('doc_ids', ''))
-    docs = Document.query.filter(Document.id.in_(doc_ids))
-
-    if tags and tags:
-        for doc in docs:
-            for tag in tags:
-                doc.tags.discard(tag)
+    tags = set(t for t in DocumentTag.split(request.form.get('tag', '').strip()) if t)
+    doc_ids = [int(i) for i in DocumentTag.split(request.form.get('doc_ids', '')) if i.isdigit()]
+
+    if tags and doc_ids:
+        Tag.remove_from_documents(tags, doc_ids)
     db.session.commit()
     return '', 200
@@ -1,6 +1,8 @@
+import os
 import re
 import logging
-from cStringIO import StringIO
+import threading
+import time
 
 from flask.ext.uploads import patch_request_class
 
@@ -8,8 +10,6 @@ from sqlalchemy_imageattach.context import (pop_store_context, push_store_contex
 from sqlalchemy_imageattach.stores.fs import HttpExposedFileSystemStore as BaseHttpExposedFileSystemStore
 from sqlalchemy_imageattach.stores.s3 import S3Store as BaseS3Store, DEFAULT_MAX_AGE
 
-from boto.s3.connection import S3Connection, Key, Bucket, S3ResponseError
-
 log = logging.getLogger(__name__)
 
 pushed = False
@@ -74,6 +74,133 @@ def setup_store(app):
     return store
 
 
+class URLCache(object):
+    """
+    Caches the URLs of stored files by key, so that pages listing many
+    attachments don't sign a new URL for each one on every render.
+
+    A URL that expires is re-generated once less than `margin` seconds of its
+    validity remain, so that the URLs handed out are always good for a while.
+    URLs that don't expire are cached forever.
+    """
+    def __init__(self, validity_secs=None, margin=None, max_size=10000):
+        self.validity_secs = validity_secs
+        if margin is None and validity_secs:
+            margin = max(60, validity_secs // 10)
+        self.margin = margin or 0
+        self.max_size = max_size
+
+        # key -> (url, time after which it must be re-generated)
+        self.urls = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, generate):
+        """ The URL for +key+, calling +generate+ to make a new one if
+        there isn't a fresh one in the cache. """
+        now = time.time()
+        with self.lock:
+            entry = self.urls.get(key)
+            if entry and (entry[1] is None or now < entry[1]):
+                return entry[0]
+
+        url = generate()
+        if self.validity_secs:
+            refresh_at = now + self.validity_secs - self.margin
+        else:
+            refresh_at = None
+
+        with self.lock:
+            if len(self.urls) >= self.max_size:
+                self.prune(now)
+            self.urls[key] = (url, refresh_at)
+
+        return url
+
+    def discard(self, key):
+        with self.lock:
+            self.urls.pop(key, None)
+
+    def prune(self, now):
+        self.urls = dict((k, v) for k, v in self.urls.iteritems() if v[1] is None or now < v[1])
+        if len(self.urls) >= self.max_size:
+            self.urls.clear()
+
+
+class RangedReader(object):
+    """
+    A read-only file-like object that reads a stored file in chunks of
+    `chunk_size` bytes as they're needed, rather than all at once.
+
+    +fetch+ is called with a start and (exclusive) end offset and must return
+    those bytes of the file, which is +size+ bytes long.
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, fetch, size, chunk_size=CHUNK_SIZE, close=None):
+        self.fetch = fetch
+        self.size = size
+        self.chunk_size = chunk_size
+        self.on_close = close
+
+        self.pos = 0
+        self.closed = False
+        # the most recently fetched chunk, and its offset
+        self.buffer = ''
+        self.buffer_start = 0
+
+    def read(self, n=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+        end = self.size if n is None or n < 0 else min(self.size, self.pos + n)
+        parts = []
+        while self.pos < end:
+            offset = self.pos - self.buffer_start
+            if not (0 <= offset < len(self.buffer)):
+                # read large requests in one go, small ones a chunk at a time
+                self.buffer_start = self.pos
+                self.buffer = self.fetch(self.pos, min(self.size, self.pos + max(end - self.pos, self.chunk_size)))
+                if not self.buffer:
+                    break
+                offset = 0
+
+            part = self.buffer[offset:offset + end - self.pos]
+            parts.append(part)
+            self.pos += len(part)
+
+        return ''.join(parts)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+
+    def tell(self):
+        return self.pos
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.buffer = ''
+            if self.on_close:
+                self.on_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class S3Store(BaseS3Store):
     NON_IMAGE_RE = re.compile('/0x0\.[a-z0-9]{3,4}$', re.IGNORECASE)
 
@@ -94,26 +221,47 @@ class S3Store(BaseS3Store):
         super(S3Store, self).__init__(bucket, access_key, secret_key, max_age, prefix, *args, **kwargs)
 
         self.acl = acl
-        self.conn = S3Connection(access_key, secret_key)
-        self.bucket = Bucket(self.conn, bucket)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.bucket_name = bucket
         self.url_validity_secs = url_validity_secs
+        self.url_cache = URLCache(url_validity_secs)
+        self._s3_bucket = None
+
+    @property
+    def s3_bucket(self):
+        # boto is slow to import, so only connect when we first need to
+        if self._s3_bucket is None:
+            from boto.s3.connection import S3Connection, Bucket
+            self._s3_bucket = Bucket(S3Connection(self.access_key, self.secret_key), self.bucket_name)
+        return self._s3_bucket
 
     def put_file(self, file, object_type, object_id, width, height, mimetype, reproducible):
         key = self.get_key_obj(object_type, object_id, width, height, mimetype)
         self.upload_file(key, file, mimetype, rrs=reproducible)
+        self.url_cache.discard(key.name)
 
     def get_file(self, *args, **kwargs):
-        fp = StringIO()
-        self.get_key_obj(*args, **kwargs).get_contents_to_file(fp)
-        fp.seek(0)
-        return fp
+        """ A file-like object that reads the file from S3 using ranged requests. """
+        name = self.get_key(*args, **kwargs)
+        key = self.s3_bucket.get_key(name)
+        if key is None:
+            raise IOError("No such file in S3: %s" % name)
+
+        def fetch(start, end):
+            return key.get_contents_as_string(headers={'Range': 'bytes=%d-%d' % (start, end - 1)})
+
+        return RangedReader(fetch, key.size)
 
     def get_url(self, *args, **kwargs):
-        key = self.get_key_obj(*args, **kwargs)
-        return key.generate_url(self.url_validity_secs)
+        name = self.get_key(*args, **kwargs)
+        return self.url_cache.get(name, lambda: self.get_key_obj(*args, **kwargs).generate_url(self.url_validity_secs))
 
     def delete_file(self, *args, **kwargs):
+        from boto.exception import S3ResponseError
+
         key = self.get_key_obj(*args, **kwargs)
+        self.url_cache.discard(key.name)
         try:
             key.delete()
         except S3ResponseError as e:
@@ -148,10 +296,32 @@ class S3Store(BaseS3Store):
         return key
 
     def get_key_obj(self, *args, **kwargs):
-        return Key(self.bucket, self.get_key(*args, **kwargs))
+        from boto.s3.key import Key
+        return Key(self.s3_bucket, self.get_key(*args, **kwargs))
 
 
 class HttpExposedFileSystemStore(BaseHttpExposedFileSystemStore):
+    def __init__(self, *args, **kwargs):
+        super(HttpExposedFileSystemStore, self).__init__(*args, **kwargs)
+        # these URLs never expire
+        self.url_cache = URLCache()
+
+    def get_file(self, *args, **kwargs):
+        """ A file-like object that reads the file in chunks, like the S3 store. """
+        f = super(HttpExposedFileSystemStore, self).get_file(*args, **kwargs)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+        def fetch(start, end):
+            f.seek(start)
+            return f.read(end - start)
+
+        return RangedReader(fetch, size, close=f.close)
+
+    def get_url(self, *args, **kwargs):
+        key = '/'.join(str(p) for p in self.get_path(*args, **kwargs))
+        return self.url_cache.get(key, lambda: super(HttpExposedFileSystemStore, self).get_url(*args, **kwargs))
+
     # we override this method so we can hack in support for non-file images
     def get_path(self, object_type, object_id, *args, **kwargs):
         if isinstance(object_id, basestring):
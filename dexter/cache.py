@@ -0,0 +1,58 @@
+import hashlib
+import logging
+
+from werkzeug.contrib.cache import FileSystemCache, SimpleCache, NullCache
+
+log = logging.getLogger(__name__)
+
+cache = None
+
+
+def setup_cache(app):
+    """ Setup the server-side cache for expensive results that can be shared
+    between users and requests, such as dashboard summaries.
+
+    CACHE_TYPE is one of:
+
+     - filesystem: shared between processes, stored in CACHE_DIR
+     - simple: in-memory, per process
+     - null: no caching at all
+    """
+    global cache
+
+    cache_type = app.config.get('CACHE_TYPE', 'simple')
+    timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 10 * 60)
+
+    if cache_type == 'filesystem':
+        path = app.config.get('CACHE_DIR', '/tmp/dexter-cache')
+        log.info("Caching in %s" % path)
+        cache = FileSystemCache(path, default_timeout=timeout)
+
+    elif cache_type == 'simple':
+        cache = SimpleCache(default_timeout=timeout)
+
+    elif cache_type == 'null':
+        cache = NullCache()
+
+    else:
+        raise ValueError("Cache type should be one of 'filesystem', 'simple' or 'null', not '%s'" % cache_type)
+
+    return cache
+
+
+def make_cache_key(prefix, *parts):
+    """ Build a cache key from a prefix and a collection of hashable, repr-able parts. """
+    m = hashlib.md5()
+    for part in parts:
+        m.update(repr(part))
+    return '%s:%s' % (prefix, m.hexdigest())
+
+
+def cached(key, func, timeout=None):
+    """ Get the value for `key` from the cache, or calculate it by calling `func`
+    and cache the result. """
+    value = cache.get(key)
+    if value is None:
+        value = func()
+        cache.set(key, value, timeout=timeout)
+    return value
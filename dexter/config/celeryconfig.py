@@ -19,6 +19,12 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TIMEZONE = 'Africa/Johannesburg'
 CELERY_ENABLE_UTC = True
 
+# uploads are processed by their own worker, see the Procfile, so that
+# they don't wait behind the feed backlog
+CELERY_ROUTES = {
+    'dexter.tasks.process_attachment': {'queue': 'attachments'},
+}
+
 CELERYBEAT_SCHEDULE = {
     'fetch-yesterdays-feeds': {
         'schedule': crontab(hour=3, minute=0),
@@ -28,6 +34,20 @@ CELERYBEAT_SCHEDULE = {
         'schedule': crontab(hour=6, minute=0),
         'task': 'dexter.tasks.back_process_feeds',
     },
+    # after yesterday's feeds have been processed
+    'snapshot-mine': {
+        'schedule': crontab(hour=7, minute=0),
+        'task': 'dexter.tasks.snapshot_mine',
+    },
+    # catch any queued relearning that wasn't scheduled
+    'relearn-affiliations': {
+        'schedule': crontab(minute=30),
+        'task': 'dexter.tasks.relearn_affiliations',
+    },
+    'find-duplicate-people': {
+        'schedule': crontab(hour=1, minute=0, day_of_week='sunday'),
+        'task': 'dexter.tasks.find_duplicate_people',
+    },
     'backfill-taxonomies': {
         'schedule': crontab(hour=21, minute=0),
         'task': 'dexter.tasks.backfill_taxonomies',
@@ -1,5 +1,23 @@
 from .app import app
 
+# setup templates and haml
+from flask.ext.mako import MakoTemplates
+import haml
+MakoTemplates(app)
+app.config['MAKO_PREPROCESSOR'] = haml.preprocessor
+app.config['MAKO_TRANSLATE_EXCEPTIONS'] = False
+app.config['MAKO_DEFAULT_FILTERS'] = ['decode.utf8']
+
+# CSRF protection
+from flask_wtf.csrf import CsrfProtect
+CsrfProtect(app)
+
+# htpasswd-based basic auth for API access
+from flask.ext import htauth
+app.config['HTAUTH_HTPASSWD_PATH'] = './resources/nginx/htpasswd'
+app.config['HTAUTH_REALM'] = 'Dexter'
+htauth.HTAuth(app)
+
 # load admin interface
 from dexter.admin.admin import admin_instance
 admin_instance.init_app(app)
@@ -7,18 +25,5 @@ admin_instance.init_app(app)
 import dexter.assets
 import dexter.routes
 
-
-# setup extraction
-from .processing.extractors.alchemy import AlchemyExtractor
-from .processing.extractors.calais import CalaisExtractor
-from .processing.extractors.watson import WatsonExtractor
-
-AlchemyExtractor.API_KEY = app.config.get('ALCHEMY_API_KEY')
-CalaisExtractor.API_KEY = app.config.get('CALAIS_API_KEY')
-WatsonExtractor.WATSON_PASSWORD = app.config.get('WATSON_PASSWORD')
-WatsonExtractor.WATSON_USERNAME = app.config.get('WATSON_USERNAME')
-
-
-# setup crawlers
-from .processing import DocumentProcessorNT
-DocumentProcessorNT.FEED_PASSWORD = app.config.get('NEWSTOOLS_FEED_PASSWORD')
+# setup extraction and crawlers
+import dexter.worker
@@ -1,4 +1,5 @@
 from itertools import groupby
+from collections import Counter
 from datetime import datetime, timedelta
 import re
 
@@ -6,14 +7,16 @@ from dexter.app import app
 from flask import request, make_response, jsonify, session
 from flask.ext.mako import render_template
 from flask.ext.security import roles_accepted, current_user, login_required
-from sqlalchemy.sql import func, distinct, or_, desc
+from sqlalchemy.sql import func, distinct, or_, and_, desc, select
 from sqlalchemy.orm import joinedload, lazyload
 from sqlalchemy_fulltext import FullTextSearch
 import sqlalchemy_fulltext.modes as FullTextMode
 
 from dexter.models import *  # noqa
-from dexter.models.document import DocumentAnalysisProblem, DocumentTag
+from dexter.models.document import DocumentAnalysisProblem, Tag
 from dexter.models.user import default_country_id
+from dexter.cache import cached, make_cache_key
+from dexter.replica import uses_replica
 
 from wtforms import validators, HiddenField, TextField, SelectMultipleField, BooleanField
 from .forms import Form, SelectField, MultiCheckboxField, RadioField
@@ -78,6 +81,7 @@ def monitor_dashboard():
 @app.route('/activity')
 @login_required
 @roles_accepted('monitor')
+@uses_replica
 def activity():
     per_page = 100
 
@@ -94,10 +98,7 @@ def activity():
 
     elif form.format.data == 'places-json':
         # places in json format
-        query = Document.query.options(joinedload('places').joinedload('place'))
-        query = form.filter_query(query)
-
-        return jsonify(DocumentPlace.summary_for_docs(query.all()))
+        return jsonify(places_summary(form))
 
     elif form.format.data == 'xlsx' and current_user.admin:
         # excel spreadsheet
@@ -151,12 +152,7 @@ def activity():
         doc_groups.append([date, list(group)])
 
     # tags
-    tag_summary = db.session\
-        .query(DocumentTag.tag, func.count(1).label('count'))\
-        .filter(DocumentTag.doc_id.in_(doc_ids))\
-        .group_by(DocumentTag.tag)\
-        .order_by(desc('count'), DocumentTag.tag)\
-        .all()
+    tag_summary = Tag.summary_for_docs(doc_ids)
 
     try:
         session[str(current_user.id)]['search'] = request.url
@@ -175,23 +171,39 @@ def activity():
 @app.route('/activity/map')
 @login_required
 @roles_accepted('monitor')
+@uses_replica
 def activity_map():
     form = ActivityForm(request.args)
 
     if form.format.data == 'places-json':
         # places in json format
-        query = Document.query.options(joinedload('places').joinedload('place'))
-        query = form.filter_query(query)
+        return jsonify(places_summary(form))
 
-        return jsonify(DocumentPlace.summary_for_docs(query.all()))
+    elif form.format.data == 'places-geojson':
+        # the place heirarchy as GeoJSON points
+        return jsonify(Place.geojson())
 
     return render_template('dashboard/map.haml',
                            form=form)
 
 
+def places_summary(form):
+    """ Summary of places mentioned in the documents matching this form,
+    cached for the form's filters. """
+    try:
+        top = min(int(request.args.get('top', 0)), 100)
+    except ValueError:
+        top = 0
+
+    return cached(
+        form.cache_key('places-summary', top),
+        lambda: DocumentPlace.summary_for_query(form.filter_query(db.session.query(Document.id)), top_documents=top))
+
+
 @app.route('/activity/sources')
 @login_required
 @roles_accepted('monitor')
+@uses_replica
 def activity_sources():
     form = ActivityForm(request.args)
 
@@ -212,6 +224,7 @@ def activity_sources():
 @app.route('/activity/mentions')
 @login_required
 @roles_accepted('monitor')
+@uses_replica
 def activity_mentions():
     form = ActivityForm(request.args)
 
@@ -240,13 +253,30 @@ def activity_topics():
 @login_required
 @roles_accepted('monitor')
 def activity_topics_detail():
+    # Clustering happens in the background and is memoised for the set
+    # of documents. Until it's done, this returns the clustering's progress
+    # as json, with a 202 status. The first request (without poll=1)
+    # retries a clustering that previously failed.
     form = ActivityForm(request.args)
+    doc_ids = form.document_ids()
 
-    ta = TopicAnalyser(doc_ids=form.document_ids())
-    ta.find_topics()
-    ta.save()
+    clustering, new = TopicClustering.find_or_create(doc_ids, retry_failed=not request.args.get('poll'))
     db.session.commit()
 
+    if new:
+        from dexter.tasks import cluster_topics
+        from dexter.profiling import profile_requested
+        cluster_topics.delay(clustering.id, profile=profile_requested())
+
+    if clustering.status == TopicClustering.FAILED:
+        return jsonify(clustering.as_dict()), 500
+
+    if clustering.status != TopicClustering.DONE:
+        return jsonify(clustering.as_dict()), 202
+
+    ta = TopicAnalyser(doc_ids=doc_ids)
+    ta.load_topics(clustering.result)
+
     return render_template('dashboard/topics_detail.haml',
                            topic_analyser=ta)
 
@@ -254,6 +284,7 @@ def activity_topics_detail():
 @app.route('/activity/taxonomies')
 @login_required
 @roles_accepted('monitor')
+@uses_replica
 def activity_taxonomies():
     form = ActivityForm(request.args)
     taxonomies = DocumentTaxonomy.summary_for_docs(form.document_ids())
@@ -283,15 +314,13 @@ class ActivityForm(Form):
     def __init__(self, *args, **kwargs):
         super(ActivityForm, self).__init__(*args, **kwargs)
 
-        from .models.document import DocumentTag
-
         self.user_id.choices = [['', '(any)'], ['-', '(none)']] + [
             [str(u.id), u.short_name()] for u in sorted(User.query.all(), key=lambda u: u.short_name())]
 
         self.medium_id.choices = [(str(m.id), m.name) for m in Medium.query.order_by(Medium.name).all()]
         self.analysis_nature_id.choices = [[str(n.id), n.name] for n in AnalysisNature.all()]
         self.natures = AnalysisNature.all()
-        self.tags.choices = [t[0] for t in db.session.query(DocumentTag.tag.distinct()).order_by(DocumentTag.tag)]
+        self.tags.choices = Tag.names()
 
         # only admins can see all countries
         if current_user.admin:
@@ -374,6 +403,28 @@ class ActivityForm(Form):
     def document_ids(self):
         return [d[0] for d in self.filter_query(db.session.query(Document.id)).all()]
 
+    def cache_key(self, prefix, *extra):
+        """ A cache key for results that depend only on this form's filters,
+        normalised so that equivalent filters share a key. The date ranges
+        are included as they're interpreted, so that defaults are taken into account.
+        """
+        filters = []
+        for field in self:
+            if field.name in ('format', 'csrf_token'):
+                continue
+
+            data = field.data
+            if isinstance(data, (list, tuple)):
+                data = tuple(sorted(str(d) for d in data))
+            elif isinstance(data, basestring):
+                data = data.strip()
+            filters.append((field.name, data))
+
+        filters.append(('dates', self.created_from, self.created_to, self.published_from, self.published_to))
+        filters.sort()
+
+        return make_cache_key(prefix, filters, *extra)
+
     def filter_query(self, query):
         query = query.filter(Document.analysis_nature_id == self.analysis_nature_id.data)
 
@@ -415,8 +466,7 @@ class ActivityForm(Form):
                 .filter(DocumentSource.person_id == self.source_person_id.data)
 
         if self.problems.data:
-            for code in self.problems.data:
-                query = DocumentAnalysisProblem.lookup(code).filter_query(query)
+            query = DocumentAnalysisProblem.filter_query_for(self.get_problems(), query)
 
         if self.flagged.data:
             query = query.filter(Document.flagged == True)  # noqa
@@ -432,8 +482,8 @@ class ActivityForm(Form):
 
         if self.tags.data:
             tags = set(f for f in re.split('\s*,\s*', self.tags.data) if f)
-            for tag in tags:
-                query = query.filter(Document.tags.contains(tag))
+            if tags:
+                query = Tag.filter_query(query, tags)
 
         return query
 
@@ -461,14 +511,21 @@ class ActivityForm(Form):
 
 
 class ActivityChartHelper:
+    """
+    Builds the activity charts for the documents matching a form.
+
+    Rather than running an aggregate query per chart, we stream the few
+    per-document columns we need in a single query and build all the
+    histograms and counters in one pass.
+    """
     def __init__(self, form):
         self.form = form
-
-        # we use these to filter our queries, rather than trying to pull
-        # complex filter logic into our view queries
-        self.doc_ids = [d[0] for d in form.filter_query(db.session.query(Document.id)).all()]
+        self.problems = DocumentAnalysisProblem.all()
+        self.tallied = False
 
     def chart_data(self):
+        self.tally()
+
         return {
             'charts': {
                 'created': self.created_chart(),
@@ -481,36 +538,113 @@ class ActivityChartHelper:
                 'markers': self.markers_chart(),
             },
             'summary': {
-                'documents': len(self.doc_ids)
+                'documents': self.n_documents
             }
         }
 
-    def created_chart(self):
+    def query(self):
+        """ A query for the per-document columns that the charts need,
+        filtered by the form. Problems come from each document's problems bitmask.
+        """
+        sources = DocumentSource.__table__.alias()
+        fairness = DocumentFairness.__table__.alias()
+
+        n_quoted = select([func.count(sources.c.id)])\
+            .where(and_(sources.c.doc_id == Document.id, sources.c.quoted == 1))\
+            .as_scalar()
+
+        fairness_ids = select([func.group_concat(distinct(fairness.c.fairness_id))])\
+            .where(fairness.c.doc_id == Document.id)\
+            .as_scalar()
+
         query = db.session.query(
-            func.date_format(Document.created_at, '%Y/%m/%d').label('t'),
-            func.count(Document.id),
-        ).group_by('t')
+            Document.id,
+            Document.created_at,
+            Document.published_at,
+            Document.created_by_user_id,
+            func.ifnull(Document.checked_by_user_id, Document.created_by_user_id),
+            Document.country_id,
+            Document.medium_id,
+            Document.flagged,
+            Document.url,
+            n_quoted,
+            fairness_ids,
+            Document.problems)
+
+        return self.form.filter_query(query).yield_per(1000)
+
+    def tally(self):
+        if self.tallied:
+            return
+
+        self.n_documents = 0
+        self.created = Counter()
+        self.published = Counter()
+        # created_by_user_id -> [user_id, count], see users_chart
+        self.users = {}
+        self.countries = Counter()
+        self.media = Counter()
+        self.fairness = Counter()
+        self.problem_counts = [0] * len(self.problems)
+        self.flagged = 0
+        self.with_url = 0
+        self.quoted_docs = 0
+        self.quoted_sources = 0
+
+        # the form's filters may join in rows that duplicate documents
+        seen = set()
+
+        for row in self.query():
+            if row[0] in seen:
+                continue
+            seen.add(row[0])
+
+            (doc_id, created_at, published_at, created_by_id, user_id, country_id,
+             medium_id, flagged, url, n_quoted, fairness_ids, problems) = row
+
+            self.n_documents += 1
+            self.created[created_at.strftime('%Y/%m/%d')] += 1
+            self.published[published_at.strftime('%Y/%m/%d')] += 1
+            self.users.setdefault(created_by_id, [user_id, 0])[1] += 1
+            self.countries[country_id] += 1
+            self.media[medium_id] += 1
+
+            if fairness_ids:
+                for fairness_id in set(fairness_ids.split(',')):
+                    self.fairness[int(fairness_id)] += 1
+
+            if problems:
+                for i, p in enumerate(self.problems):
+                    if problems & p.mask:
+                        self.problem_counts[i] += 1
+
+            if flagged:
+                self.flagged += 1
+
+            if url:
+                self.with_url += 1
+
+            if n_quoted:
+                self.quoted_docs += 1
+                self.quoted_sources += n_quoted
+
+        self.tallied = True
 
+    def created_chart(self):
         return {
-            'values': dict(self.filter(query).all())
+            'values': dict(self.created)
         }
 
     def published_chart(self):
-        query = db.session.query(
-            func.date_format(Document.published_at, '%Y/%m/%d').label('t'),
-            func.count(Document.id),
-        ).group_by('t')
-
         return {
-            'values': dict(self.filter(query).all())
+            'values': dict(self.published)
         }
 
     def users_chart(self):
-        query = db.session.query(
-            func.ifnull(Document.checked_by_user_id, Document.created_by_user_id),
-            func.count(Document.id),
-        ).group_by(Document.created_by_user_id)
-        rows = self.filter(query).all()
+        # documents are grouped by the user who created them, but labelled by
+        # the user who checked them (if any), just as MySQL does for
+        # "SELECT IFNULL(checked_by_user_id, created_by_user_id) ... GROUP BY created_by_user_id"
+        rows = self.users.values()
         users = dict((u.id, u.short_name()) for u in User.query.filter(User.id.in_(r[0] for r in rows)))
 
         return {
@@ -518,99 +652,49 @@ class ActivityChartHelper:
         }
 
     def countries_chart(self):
-        query = db.session.query(
-            Document.country_id,
-            func.count(Document.id),
-        ).group_by(Document.country_id)
-        rows = self.filter(query).all()
-        countries = dict((c.id, c.name) for c in Country.query.filter(Country.id.in_(r[0] for r in rows)))
+        countries = dict((c.id, c.name) for c in Country.query.filter(Country.id.in_(self.countries.keys())))
 
         return {
-            'values': dict((countries.get(r[0], 'None'), r[1]) for r in rows)
+            'values': dict((countries.get(k, 'None'), v) for k, v in self.countries.iteritems())
         }
 
     def fairness_chart(self):
-        query = db.session.query(
-            Fairness.name.label('t'),
-            func.count(distinct(DocumentFairness.doc_id))
-        )\
-            .join(DocumentFairness)\
-            .join(Document, DocumentFairness.doc_id == Document.id)\
-            .group_by('t')
-
-        rows = self.filter(query).all()
-        counts = dict(rows)
+        names = dict(db.session.query(Fairness.id, Fairness.name))
+        counts = dict((names[k], v) for k, v in self.fairness.iteritems())
         counts.setdefault('Fair', 0)
 
         # missing documents are considered fair
-        counts['Fair'] += len(self.doc_ids) - sum(counts.itervalues())
+        counts['Fair'] += self.n_documents - sum(counts.itervalues())
 
         return {
             'values': counts
         }
 
     def media_chart(self):
-        query = db.session.query(Medium.name, func.count(Document.id))\
-            .join(Document)\
-            .group_by(Medium.name)
-        rows = self.filter(query).all()
+        media = Medium.query.all()
+        names = dict((m.id, m.name) for m in media)
 
         return {
-            'values': dict(rows),
-            'types': dict([m.name, m.medium_type] for m in Medium.query.all())
+            'values': dict((names[k], v) for k, v in self.media.iteritems()),
+            'types': dict([m.name, m.medium_type] for m in media)
         }
 
     def problems_chart(self):
-        counts = {}
-
-        for p in DocumentAnalysisProblem.all():
-            query = db.session.query(func.count(distinct(Document.id)))
-            query = self.filter(p.filter_query(query))
-            counts[p.short_desc] = query.scalar()
-
         return {
-            'values': counts
+            'values': dict((p.short_desc, n) for p, n in zip(self.problems, self.problem_counts))
         }
 
     def markers_chart(self):
         counts = {}
 
-        # flagged
-        query = self.filter(
-            db.session.query(func.count(Document.id))
-            .filter(Document.flagged == True))  # noqa
-        counts['flagged'] = query.scalar()
-
-        # with URL
-        query = self.filter(
-            db.session.query(func.count(Document.id))
-            .filter(Document.url != None, Document.url != ''))  # noqa
-        counts['with-url'] = query.scalar()
-
-        # without URL
-        query = self.filter(
-            db.session.query(func.count(Document.id))
-            .filter(or_(Document.url == None, Document.url == '')))  # noqa
-        counts['without-url'] = query.scalar()
-
-        # average people sources per document
-        subq = self.filter(
-            db.session
-            .query(func.count(DocumentSource.doc_id).label('count'))
-            .join(Document, DocumentSource.doc_id == Document.id)
-            .filter(DocumentSource.quoted == 1)
-            .group_by(DocumentSource.doc_id))\
-            .subquery('cnt')
-
-        n = float(db.session
-                  .query(func.avg(subq.c.count))
-                  .select_from(subq)
-                  .scalar() or 0)
+        counts['flagged'] = self.flagged
+        counts['with-url'] = self.with_url
+        counts['without-url'] = self.n_documents - self.with_url
+
+        # average people sources per document, for documents with people sources
+        n = float(self.quoted_sources) / self.quoted_docs if self.quoted_docs else 0.0
         counts['average-sources-per-document'] = round(n, 2)
 
         return {
             'values': counts
         }
-
-    def filter(self, query):
-        return query.filter(Document.id.in_(self.doc_ids))
@@ -12,7 +12,7 @@ from sqlalchemy_fulltext import FullTextSearch
 import sqlalchemy_fulltext.modes as FullTextMode
 
 from dexter.models import *  # noqa
-from dexter.models.document import DocumentAnalysisProblem, DocumentTag
+from dexter.models.document import DocumentAnalysisProblem, Tag
 from dexter.models.user import default_country_id
 
 from wtforms import validators, HiddenField, TextField, SelectMultipleField, BooleanField
@@ -22,10 +22,12 @@ from .analysis import SourceAnalyser, TopicAnalyser, XLSXExportBuilder, Children
 
 from utils import paginate
 from dexter.utils import client_cache_for
+from dexter.replica import uses_replica
 
 @app.route('/fdi')
 @login_required
 @roles_accepted('fdi')
+@uses_replica
 def fdi_home():
     per_page = 100
 
@@ -73,12 +75,7 @@ def fdi_home():
         doc_groups.append([date, list(group)])
 
     # tags
-    tag_summary = db.session \
-        .query(DocumentTag.tag, func.count(1).label('count')) \
-        .filter(DocumentTag.doc_id.in_(doc_ids)) \
-        .group_by(DocumentTag.tag) \
-        .order_by(desc('count'), DocumentTag.tag) \
-        .all()
+    tag_summary = Tag.summary_for_docs(doc_ids)
     try:
         session[str(current_user.id)]['search'] = request.url
     except:
@@ -147,15 +144,13 @@ class FDI(Form):
     def __init__(self, *args, **kwargs):
         super(FDI, self).__init__(*args, **kwargs)
 
-        from .models.document import DocumentTag
-
         self.user_id.choices = [['', '(any)'], ['-', '(none)']] + [
             [str(u.id), u.short_name()] for u in sorted(User.query.all(), key=lambda u: u.short_name())]
 
         self.medium_id.choices = [(str(m.id), m.name) for m in Medium.query.order_by(Medium.name).all()]
         self.analysis_nature_id.choices = [[str(n.id), n.name] for n in AnalysisNature.all()]
         self.natures = AnalysisNature.all()
-        self.tags.choices = [t[0] for t in db.session.query(DocumentTag.tag.distinct()).order_by(DocumentTag.tag)]
+        self.tags.choices = Tag.names()
 
         # only admins can see all countries
         if current_user.admin:
@@ -279,8 +274,7 @@ class FDI(Form):
                 .filter(DocumentSource.person_id == self.source_person_id.data)
 
         if self.problems.data:
-            for code in self.problems.data:
-                query = DocumentAnalysisProblem.lookup(code).filter_query(query)
+            query = DocumentAnalysisProblem.filter_query_for(self.get_problems(), query)
 
         if self.flagged.data:
             query = query.filter(Document.flagged == True)  # noqa
@@ -296,8 +290,8 @@ class FDI(Form):
 
         if self.tags.data:
             tags = set(f for f in re.split('\s*,\s*', self.tags.data) if f)
-            for tag in tags:
-                query = query.filter(Document.tags.contains(tag))
+            if tags:
+                query = Tag.filter_query(query, tags)
 
         return query
 
@@ -425,12 +419,17 @@ class ActivityChartHelper:
         }
 
     def problems_chart(self):
-        counts = {}
-
-        for p in DocumentAnalysisProblem.all():
-            query = db.session.query(func.count(distinct(Document.id)))
-            query = self.filter(p.filter_query(query))
-            counts[p.short_desc] = query.scalar()
+        problems = DocumentAnalysisProblem.all()
+        counts = dict((p.short_desc, 0) for p in problems)
+
+        # count documents with each combination of problems, and add them up per problem
+        query = db.session.query(Document.problems, func.count(Document.id))\
+            .filter(Document.problems != 0)\
+            .group_by(Document.problems)
+        for mask, n in self.filter(query).all():
+            for p in problems:
+                if mask & p.mask:
+                    counts[p.short_desc] += n
 
         return {
             'values': counts
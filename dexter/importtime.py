@@ -0,0 +1,117 @@
+"""
+Report how long it takes to import a module, and which of the modules it
+imports are the slowest, to keep the startup time of web and Celery
+worker processes in check.
+
+    $ python -m dexter.importtime dexter.worker --budget 5
+
+This exits with a non-zero status if importing takes longer than the budget.
+Use `python app.py import_times` to run it from the manage script.
+"""
+
+import __builtin__
+import argparse
+import resource
+import sys
+import time
+
+
+class ImportTimer(object):
+    """ Times imports by wrapping `__import__`.
+
+    For each module that is loaded for the first time, this records the
+    cumulative time taken to load it and the modules it imports, and the
+    time taken by the module itself.
+    """
+    def __init__(self):
+        # module name -> [cumulative seconds, self seconds]
+        self.times = {}
+        # seconds spent importing children, for each import in progress
+        self.stack = []
+        self.original = None
+
+    def install(self):
+        self.original = __builtin__.__import__
+        __builtin__.__import__ = self.timed_import
+
+    def uninstall(self):
+        __builtin__.__import__ = self.original
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        names = self.candidates(name, globals, level)
+        if fromlist:
+            # from package import submodule
+            names.extend('%s.%s' % (n, item) for n in list(names) for item in fromlist if item != '*')
+        loaded = set(n for n in names if sys.modules.get(n) is not None)
+        self.stack.append(0.0)
+        start = time.time()
+
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+
+            # failed implicit relative imports leave None in sys.modules
+            names = [n for n in names if n not in loaded and sys.modules.get(n) is not None]
+            if names:
+                self.times[names[0]] = [elapsed, elapsed - children]
+
+    def candidates(self, name, globals, level):
+        """ The full names that an import might refer to, relative imports first. """
+        names = [name] if name else []
+        if level != 0 and globals:
+            package = globals.get('__package__')
+            if not package:
+                package = globals.get('__name__', '')
+                if '__path__' not in globals:
+                    package = package.rsplit('.', 1)[0]
+            if package:
+                names.insert(0, '%s.%s' % (package, name) if name else package)
+        return names
+
+    def slowest(self, n=20, by_self=True):
+        """ List of (name, cumulative, self) tuples for the +n+ slowest modules. """
+        key = (lambda p: p[1][1]) if by_self else (lambda p: p[1][0])
+        items = sorted(self.times.iteritems(), key=key, reverse=True)[:n]
+        return [(name, cumulative, own) for name, (cumulative, own) in items]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time importing a module")
+    parser.add_argument('module', help="the module to import, such as dexter.worker")
+    parser.add_argument('--budget', type=float, default=None, help="fail if importing takes longer than this many seconds")
+    parser.add_argument('--top', type=int, default=20, help="number of slow modules to list")
+    args = parser.parse_args(argv)
+
+    timer = ImportTimer()
+    start = time.time()
+    timer.install()
+    try:
+        __import__(args.module)
+    finally:
+        timer.uninstall()
+    elapsed = time.time() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print "Imported %s in %.2fs, %d modules loaded, peak memory %.1f MB" % (
+        args.module, elapsed, len(sys.modules), maxrss / 1024.0)
+    print
+    print "%-50s %10s %10s" % ('Slowest modules', 'self ms', 'total ms')
+    for name, cumulative, own in timer.slowest(args.top):
+        print "%-50s %10.1f %10.1f" % (name, own * 1000, cumulative * 1000)
+
+    if args.budget is not None and elapsed > args.budget:
+        print
+        print "Importing %s took %.2fs, over the budget of %.2fs" % (args.module, elapsed, args.budget)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,9 +11,13 @@ class UserIdFilter(logging.Filter):
     This filter adds a userid parameter to the logging context.
     """
     def filter(self, record):
-        record.userid = 'userid:%s' % getattr(self._storage, 'flask_userid', '-')
+        record.userid = 'userid:%s' % self.get_userid()
         return record
 
     @classmethod
     def set_userid(cls, userid):
         cls._storage.flask_userid = userid
+
+    @classmethod
+    def get_userid(cls):
+        return getattr(cls._storage, 'flask_userid', '-')
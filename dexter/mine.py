@@ -12,22 +12,30 @@ from dexter.app import app
 from dexter.models import *  # noqa
 from dexter.forms import Form, RadioField
 from dexter.analysis import SourceAnalyser, MediaAnalyser
+from dexter.analysis.mine import MineWindow, SnapshotMediaAnalyser, SnapshotSourceAnalyser
 from dexter.utils import client_cache_for
+from dexter.replica import uses_replica
 
 
 @app.route('/mine/')
 @login_required
 @roles_accepted('monitor', 'miner')
 @client_cache_for(minutes=10)
+@uses_replica
 def mine_home():
     form = MineForm(request.args)
 
-    ma = MediaAnalyser(doc_ids=form.document_ids(overview=True))
-    ma.analyse()
+    overview, snapshot = form.snapshots()
+    if snapshot:
+        ma = SnapshotMediaAnalyser(overview.data)
+        sa = SnapshotSourceAnalyser(snapshot.data)
+    else:
+        ma = MediaAnalyser(doc_ids=form.document_ids(overview=True))
+        ma.analyse()
 
-    sa = SourceAnalyser(doc_ids=form.document_ids())
-    sa.analyse()
-    sa.load_utterances()
+        sa = SourceAnalyser(doc_ids=form.document_ids())
+        sa.analyse()
+        sa.load_utterances()
 
     return render_template('mine/index.haml',
                            form=form,
@@ -39,18 +47,27 @@ def mine_home():
 @login_required
 @roles_accepted('monitor', 'miner')
 @client_cache_for(minutes=10)
+@uses_replica
 def mine_person(id):
     person = Person.query.get_or_404(id)
     form = MineForm(request.args)
 
-    sa = SourceAnalyser(doc_ids=form.document_ids())
-    sa.analyse()
-    sa.load_utterances([person])
+    overview, snapshot = form.snapshots()
+    if snapshot:
+        sa = SnapshotSourceAnalyser(snapshot.data)
+    else:
+        sa = SourceAnalyser(doc_ids=form.document_ids())
+        sa.analyse()
 
-    source = sa.analysed_people.get(person.id)
+    source = sa.source_for(person)
     if not source:
         return jsonify({'row': '', 'utterances': ''})
 
+    if sa.doc_ids is None:
+        # only the top people's utterances are in the snapshot
+        sa.doc_ids = form.document_ids()
+    sa.load_utterances([person])
+
     row = render_template('mine/_source.haml', i=-1, source=source)
     utterances = render_template("mine/_quotations.haml", i=-1, source=source, source_analyser=sa)
 
@@ -64,11 +81,16 @@ def mine_person(id):
 @login_required
 @roles_accepted('monitor', 'miner')
 @client_cache_for(minutes=10)
+@uses_replica
 def mine_people():
     """ All the people that are in the documents covered by this span. """
     form = MineForm(request.args)
 
-    sa = SourceAnalyser(doc_ids=form.document_ids())
+    overview, snapshot = form.snapshots()
+    if snapshot:
+        sa = SnapshotSourceAnalyser(snapshot.data)
+    else:
+        sa = SourceAnalyser(doc_ids=form.document_ids())
     sa.load_people_sources()
 
     return jsonify({
@@ -84,26 +106,21 @@ class MineForm(Form):
     # free text search
     q = TextField('Search', [validators.Optional()])
 
-    nature_id = AnalysisNature.ANCHOR_ID
-
     def __init__(self, *args, **kwargs):
         super(MineForm, self).__init__(*args, **kwargs)
         self.country = current_user.country
         self.yesterday = date.today() - timedelta(days=1)
 
     @property
-    def published_from(self):
+    def days(self):
         try:
-            days = int(self.period.data)
-        except ValueError:
-            days = 7
-        days = days
-
-        return (self.yesterday - timedelta(days=days)).strftime('%Y-%m-%d 00:00:00')
+            return int(self.period.data)
+        except (TypeError, ValueError):
+            return 7
 
     @property
-    def published_to(self):
-        return (self.yesterday - timedelta(days=1)).strftime('%Y-%m-%d 23:59:59')
+    def window(self):
+        return MineWindow(self.country, self.days, self.yesterday)
 
     def document_ids(self, overview=False):
         return [d[0] for d in self.filter_query(db.session.query(Document.id), overview=overview).all()]
@@ -114,17 +131,7 @@ class MineForm(Form):
             return Medium.query.get(self.medium_id.data)
 
     def filter_query(self, query, overview=False):
-        query = query.filter(
-            Document.analysis_nature_id == self.nature_id,
-            Document.country == self.country,
-        )
-
-        if not overview and self.medium:
-            query = query.filter(Document.medium == self.medium)
-
-        query = query.filter(
-            Document.published_at >= self.published_from,
-            Document.published_at <= self.published_to)
+        query = self.window.filter_query(query, medium=None if overview else self.medium)
 
         if self.source_person_id.data:
             query = query\
@@ -136,3 +143,15 @@ class MineForm(Form):
             query = query.filter(FullTextSearch(self.q.data, Document, FullTextMode.NATURAL))
 
         return query
+
+    def snapshots(self):
+        """ The (all media, this medium) snapshots that cover this form, or (None, None)
+        if there aren't any or the form has filters that need a live analysis. """
+        if self.source_person_id.data or self.q.data:
+            return None, None
+
+        overview = MineSnapshot.find(self.country, self.days, None, self.yesterday)
+        if not overview or not self.medium:
+            return overview, overview
+
+        return overview, MineSnapshot.find(self.country, self.days, self.medium, self.yesterday)
@@ -0,0 +1,163 @@
+"""
+Near-duplicate detection for text using MinHash signatures of word shingles,
+with locality-sensitive hashing (LSH) to find candidate matches without comparing
+every pair of texts.
+
+The similarity of two texts is the Jaccard similarity of their sets of shingles
+(runs of consecutive words), which MinHash signatures estimate cheaply. LSH splits
+signatures into bands and only compares texts that share at least one identical band,
+which makes grouping texts roughly linear in the number of texts.
+
+See http://infolab.stanford.edu/~ullman/mmds/ch3.pdf
+"""
+
+from __future__ import division
+
+import re
+import random
+import zlib
+from collections import defaultdict
+from itertools import izip
+
+from unidecode import unidecode
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text, size=3):
+    """ The set of `size`-word shingles in `text`, ignoring case, diacritics
+    and punctuation. Texts shorter than `size` words are a single shingle.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'ignore')
+    words = WORD_RE.findall(unidecode(text or u'').lower())
+
+    if len(words) <= size:
+        return set([' '.join(words)]) if words else set()
+
+    return set(' '.join(words[i:i + size]) for i in xrange(len(words) - size + 1))
+
+
+def similarity(sig1, sig2):
+    """ Estimated Jaccard similarity of the texts with these two signatures, from 0 to 1. """
+    return sum(1 for a, b in izip(sig1, sig2) if a == b) / len(sig1)
+
+
+class MinHasher(object):
+    """ Calculates MinHash signatures for sets of shingles. Signatures
+    are only comparable if they're built by hashers with the same `num_perm`
+    and `seed`, and are stable across processes, so they can be stored.
+    """
+    def __init__(self, num_perm=64, seed=1):
+        rnd = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(rnd.randint(1, MERSENNE_PRIME - 1), rnd.randint(0, MERSENNE_PRIME - 1))
+                             for _ in xrange(num_perm)]
+
+    def signature(self, shingles):
+        """ A tuple of `num_perm` integers. """
+        hashes = [zlib.crc32(s) & MAX_HASH for s in shingles]
+        if not hashes:
+            return tuple([MAX_HASH] * self.num_perm)
+
+        return tuple(min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes)
+                     for a, b in self.permutations)
+
+
+def lsh_bands(threshold, num_perm):
+    """ Choose the number of (bands, rows) to split a signature into, so that
+    texts with a similarity of about `threshold` have an even chance of sharing
+    a band and so being candidates.
+    """
+    best = None
+    for rows in xrange(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class LSHIndex(object):
+    """ An index of MinHash signatures which finds the keys of signatures that
+    are likely to be similar to a given signature.
+    """
+    def __init__(self, threshold=0.5, num_perm=64):
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        self.buckets = [defaultdict(list) for _ in xrange(self.bands)]
+
+    def _bands(self, sig):
+        for i in xrange(self.bands):
+            yield self.buckets[i], sig[i * self.rows:(i + 1) * self.rows]
+
+    def add(self, key, sig):
+        for bucket, band in self._bands(sig):
+            bucket[band].append(key)
+
+    def remove(self, key, sig):
+        for bucket, band in self._bands(sig):
+            keys = bucket.get(band)
+            if keys and key in keys:
+                keys.remove(key)
+                if not keys:
+                    del bucket[band]
+
+    def candidates(self, sig):
+        """ Keys of signatures that share at least one band with `sig`,
+        in the order they were added. """
+        seen = set()
+        found = []
+        for bucket, band in self._bands(sig):
+            for key in bucket.get(band, ()):
+                if key not in seen:
+                    seen.add(key)
+                    found.append(key)
+        return found
+
+
+class NearDuplicateGrouper(object):
+    """ Groups texts into groups of near-duplicates.
+
+    Each group is represented by the first text added to it. A new text joins
+    the group whose representative it is most similar to, if that similarity
+    is at least `threshold`, otherwise it starts a new group.
+
+        >>> grouper = NearDuplicateGrouper(threshold=0.6)
+        >>> [grouper.add(t) for t in texts]
+        [0, 0, 1, ...]
+    """
+    def __init__(self, threshold=0.6, num_perm=64, shingle_size=3, seed=1):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm, seed)
+        self.index = LSHIndex(threshold, num_perm)
+        self.signatures = []
+
+    def signature(self, text):
+        return self.hasher.signature(shingles(text, self.shingle_size))
+
+    def find(self, sig):
+        """ The group that a text with this signature belongs to, or None. """
+        best = None
+        best_score = self.threshold
+
+        for group in self.index.candidates(sig):
+            score = similarity(sig, self.signatures[group])
+            if score >= best_score:
+                best, best_score = group, score
+
+        return best
+
+    def add(self, text):
+        """ Add a text and return the index of its group. """
+        sig = self.signature(text)
+
+        group = self.find(sig)
+        if group is None:
+            group = len(self.signatures)
+            self.signatures.append(sig)
+            self.index.add(group, sig)
+
+        return group
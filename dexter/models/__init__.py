@@ -1,12 +1,12 @@
 from dexter.app import db
-from .document import Document, DocumentType, DocumentTag
+from .document import Document, DocumentType, DocumentTag, Tag
 from .entity import DocumentEntity, Entity
 from .keyword import DocumentKeyword
 from .topic import Topic, DocumentTaxonomy
 from .utterance import Utterance
 from .medium import Medium
 from .source import DocumentSource, SourceFunction
-from .person import Person, Gender, Race
+from .person import Person, Gender, Race, PendingAffiliationRelearn, PersonMergeCandidate
 from .author import Author, AuthorType
 from .location import Location
 from .issue import Issue
@@ -18,7 +18,9 @@ from .children import SourceRole, SourceAge
 from .principle import Principle
 from .attachment import DocumentAttachment, AttachmentImage
 from .country import Country
-from .cluster import Cluster, ClusteredDocument
+from .cluster import Cluster, ClusteredDocument, TopicClustering
+from .snapshot import MineSnapshot
+from .syndication import DocumentFingerprint, DocumentSyndication
 from .fdi import Investment, InvestmentType, \
     Sectors, Phases, Currencies, InvestmentOrigins, InvestmentLocations, Involvements1, Involvements2, Involvements3,\
     Industries, ValueUnits, Provinces
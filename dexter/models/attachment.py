@@ -1,5 +1,6 @@
 import datetime
 import io
+import tempfile
 from cStringIO import StringIO
 
 from sqlalchemy import (
@@ -19,7 +20,6 @@ from sqlalchemy.orm.session import Session
 from sqlalchemy_imageattach.entity import Image, image_attachment
 from sqlalchemy_imageattach.context import current_store
 from werkzeug.utils import secure_filename
-from wand.image import Image as WandImage
 
 from ..app import db
 
@@ -41,14 +41,23 @@ class DocumentAttachment(db.Model):
     document.
     
     We'll clean up stranded attachments periodically.
+
+    Converting PDFs and generating thumbnails is slow, so uploads are stored
+    as-is and processed in the background by the `process_attachment` task.
+    Until that's done, the attachment is PENDING and has no image.
     """
     __tablename__ = "attachments"
     log = logging.getLogger(__name__)
 
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
     id        = Column(Integer, primary_key=True)
 
     filename  = Column(String(256), nullable=False)
     mimetype  = Column(String(256), nullable=False)
+    status    = Column(String(10), nullable=False, default=DONE, server_default=DONE)
     document_id = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), index=True)
 
     created_by_user_id = Column(Integer, ForeignKey('users.id'), index=True)
@@ -62,68 +71,135 @@ class DocumentAttachment(db.Model):
 
     THUMBNAIL_HEIGHT = 100
 
+    # PDFs are rasterised at this resolution, in dpi...
+    PDF_RESOLUTION = 150
+    # ...and then scaled down to fit within this many pixels
+    PDF_MAX_SIZE = 2000
+
     _deleted_attachments = set()
 
     def generate_thumbnails(self):
         self.image.generate_thumbnail(height=self.THUMBNAIL_HEIGHT)
 
 
-    def set_data(self, data):
-        """ Set the data for this attachment from a file-like object. """
-        if self.mimetype == PDF:
-            if self.id is None:
-                db.session.add(self)
-                db.session.flush()
+    @property
+    def is_done(self):
+        return self.status == self.DONE
 
-            # save pdf to s3
-            filename = '%d/%s' % (self.id, self.filename)
-            current_store.put_file(data, 'document-attachment', filename, 0, 0, self.mimetype, False)
-            data.seek(0)
+    @property
+    def upload_filename(self):
+        """ The name the uploaded file is stored under. """
+        return '%d/%s' % (self.id, self.filename)
+
+    def store_upload(self, data):
+        """ Store the uploaded file, a file-like object, as-is so that it can be
+        processed later with `process_upload`. """
+        if self.id is None:
+            db.session.add(self)
+            db.session.flush()
+
+        current_store.put_file(data, 'document-attachment', self.upload_filename, 0, 0, self.mimetype, False)
+        self.status = self.PENDING
+
+    def process_upload(self):
+        """ Set the data for this attachment from the stored upload. Once
+        that's committed, call `discard_upload`. """
+        data = current_store.get_file('document-attachment', self.upload_filename, 0, 0, self.mimetype)
+        try:
+            self.set_data(data, stored=True)
+        finally:
+            data.close()
+
+    def discard_upload(self):
+        """ Delete the stored upload of a processed image, which is served from
+        the attachment image instead. The upload is needed to process the image
+        again, so only do this once the image has been committed. """
+        if self.mimetype != PDF and self.is_done:
+            current_store.delete_file('document-attachment', self.upload_filename, 0, 0, self.mimetype)
+
+    def discard_images(self, images):
+        """ Delete the stored files of +images+, such as those generated for this
+        attachment in a transaction that was then rolled back. """
+        for image in images:
+            try:
+                current_store.delete(image)
+            except Exception as e:
+                self.log.warn("Couldn't delete image file for %s: %s" % (image, e))
+
+    def set_data(self, data, stored=False):
+        """ Set the data for this attachment from a file-like object. If +stored+
+        is True, the data is the upload that has already been stored. """
+        if self.mimetype == PDF:
+            if not stored:
+                # save pdf to s3
+                self.store_upload(data)
+                data.seek(0)
 
-            # convert to an image for use with thumbnails
             self.log.info("Converting PDF to image")
-            with WandImage(file=data, resolution=300) as img:
-                img.format = 'png'
-                data = StringIO()
-                img.save(file=data)
-                data.seek(0)
+            data = self.rasterise_pdf(data)
             self.log.info("Converted")
 
         self.image.from_file(data)
         db.session.flush()
         self.generate_thumbnails()
+        self.status = self.DONE
+
+    def rasterise_pdf(self, data):
+        """ Convert the first page of the PDF in +data+ to a PNG, returning
+        a file-like object. """
+        from wand.image import Image as WandImage
+
+        # ImageMagick only reads a single page if we name it, which needs a file
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as f:
+            f.write(data.read())
+            f.flush()
+
+            with WandImage(filename=f.name + '[0]', resolution=self.PDF_RESOLUTION) as img:
+                # the '>' only ever shrinks the image
+                img.transform(resize='%dx%d>' % (self.PDF_MAX_SIZE, self.PDF_MAX_SIZE))
+                img.format = 'png'
+                png = StringIO()
+                img.save(file=png)
+                png.seek(0)
+
+        return png
 
 
     @property
     def thumbnail_url(self):
+        if not self.is_done:
+            return None
         return self.image.find_thumbnail(height=self.THUMBNAIL_HEIGHT).locate()
 
     @property
     def preview_url(self):
+        if not self.is_done:
+            return None
         return self.image.original.locate()
 
     @property
     def download_url(self):
-        if self.mimetype == PDF:
-            filename = '%d/%s' % (self.id, self.filename)
-            return current_store.get_url('document-attachment', filename, 0, 0, self.mimetype)
+        if self.mimetype == PDF or not self.is_done:
+            return current_store.get_url('document-attachment', self.upload_filename, 0, 0, self.mimetype)
 
         return self.image.original.locate()
 
 
     def size_str(self):
+        if not self.is_done:
+            return None
         return '%d,%d' % self.image.original.size
 
 
     def delete_file(self):
-        if self.mimetype == PDF:
-            filename = '%d/%s' % (self.id, self.filename)
-            return current_store.delete_file('document-attachment', filename, 0, 0, self.mimetype)
+        if self.mimetype == PDF or not self.is_done:
+            return current_store.delete_file('document-attachment', self.upload_filename, 0, 0, self.mimetype)
 
 
     def to_json(self):
         return {
             'id': self.id,
+            'status': self.status,
             'url': self.preview_url,
             'thumbnail_url': self.thumbnail_url,
             'download_url': self.download_url,
@@ -140,9 +216,12 @@ class DocumentAttachment(db.Model):
 
 
     @classmethod
-    def from_upload(cls, upload, user=None, document=None):
+    def from_upload(cls, upload, user=None, document=None, background=False):
         """
         Create a new attachment from an uploaded file, a `werkzeug.FileStorage` object.
+
+        If +background+ is True, the upload is only stored, and the caller must
+        queue the `process_attachment` task once the attachment is committed.
         """
         attachment = DocumentAttachment()
         attachment.document = document
@@ -152,8 +231,11 @@ class DocumentAttachment(db.Model):
         if user and user.is_authenticated():
             attachment.created_by = user
 
-        # set the data and generate thumbnails
-        attachment.set_data(upload.stream)
+        if background:
+            attachment.store_upload(upload.stream)
+        else:
+            # set the data and generate thumbnails
+            attachment.set_data(upload.stream)
 
         return attachment
 
@@ -1,4 +1,6 @@
 import hashlib
+import json
+from datetime import timedelta
 
 from sqlalchemy import (
     Column,
@@ -9,7 +11,9 @@ from sqlalchemy import (
     func,
     event,
     )
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import relationship, backref, deferred
+from sqlalchemy.dialects.mysql import LONGTEXT
 
 from ..app import db
 
@@ -54,18 +58,26 @@ class Cluster(db.Model):
         return m.hexdigest()
 
     @classmethod
-    def find_or_create(cls, fingerprint=None, docs=None):
-        """ Find an existing cluster that has these documents, or create one. """
+    def find_or_create(cls, fingerprint=None, docs=None, doc_ids=None):
+        """ Find an existing cluster that has these documents, or create one.
+        The documents can be given either as `docs` or, to avoid loading them,
+        as `doc_ids`. """
+        if doc_ids is None and docs:
+            doc_ids = [d.id for d in docs]
+
         if not fingerprint:
-            if not docs:
-                raise ValueError("Need one of fingerprint or docs")
-            fingerprint = cls.make_fingerprint(d.id for d in docs)
+            if not doc_ids:
+                raise ValueError("Need one of fingerprint, docs or doc_ids")
+            fingerprint = cls.make_fingerprint(doc_ids)
 
         cluster = cls.query.filter(cls.fingerprint == fingerprint).first()
         if cluster is None:
             cluster = cls()
-            cluster.members = [ClusteredDocument(document=d) for d in docs]
-            cluster.recalculate_fingerprint()
+            if docs:
+                cluster.members = [ClusteredDocument(document=d) for d in docs]
+            else:
+                cluster.members = [ClusteredDocument(doc_id=i) for i in doc_ids]
+            cluster.fingerprint = fingerprint
 
         return cluster
 
@@ -85,3 +97,116 @@ class ClusteredDocument(db.Model):
 
     def __repr__(self):
         return "<ClusteredDocument id=%s, cluster=%s, document=%s>" % (self.id, self.cluster, self.document,)
+
+
+class TopicClustering(db.Model):
+    """
+    The result of clustering a set of documents into topics, which takes a while
+    and so is done in the background. A clustering is identified by the
+    fingerprint of the set of documents it clusters (see `Cluster.make_fingerprint`),
+    so that clustering the same documents again re-uses the earlier result.
+    """
+    __tablename__ = "topic_clusterings"
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id           = Column(Integer, primary_key=True)
+    fingerprint  = Column(String(32), index=True, nullable=False, unique=True)
+    status       = Column(String(10), nullable=False, default=PENDING)
+    # percentage complete
+    progress     = Column(Integer, nullable=False, default=0)
+    # comma-separated ids of the documents being clustered
+    doc_id_list  = deferred(Column(LONGTEXT, nullable=False))
+    # json-encoded results, see TopicAnalyser.topics_as_dict
+    raw_result   = deferred(Column(LONGTEXT))
+    created_at   = Column(DateTime(timezone=True), index=True, unique=False, nullable=False, server_default=func.now())
+    updated_at   = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.current_timestamp())
+
+    @property
+    def doc_ids(self):
+        return [int(i) for i in self.doc_id_list.split(',') if i]
+
+    @property
+    def result(self):
+        return json.loads(self.raw_result) if self.raw_result else None
+
+    @result.setter
+    def result(self, value):
+        self.raw_result = json.dumps(value)
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'progress': self.progress,
+        }
+
+    def __repr__(self):
+        return "<TopicClustering id=%s, status=%s, fingerprint=%s>" % (self.id, self.status, self.fingerprint)
+
+    # a pending or running clustering that hasn't changed for this long has
+    # lost its task, such as when its worker died, and is queued again
+    STALE_AFTER = timedelta(minutes=30)
+
+    @classmethod
+    def find_or_create(cls, doc_ids, retry_failed=False):
+        """ Find the clustering for these documents, or create a new pending one.
+
+        Returns a (clustering, new) tuple, where new is True if the clustering
+        is new (or is a failed or stale clustering being retried) and must be
+        queued to run.
+        """
+        fingerprint = Cluster.make_fingerprint(doc_ids)
+
+        clustering = cls.query.filter(cls.fingerprint == fingerprint).first()
+        if clustering is None:
+            clustering = cls()
+            clustering.fingerprint = fingerprint
+            clustering.doc_id_list = ','.join(str(i) for i in sorted(doc_ids))
+            clustering.status = cls.PENDING
+            clustering.progress = 0
+
+            try:
+                with db.session.begin_nested():
+                    db.session.add(clustering)
+                return clustering, True
+            except IntegrityError:
+                # a concurrent request created it first; a locking read
+                # sees it even though this transaction began before it did
+                clustering = cls.query\
+                    .filter(cls.fingerprint == fingerprint)\
+                    .with_for_update()\
+                    .one()
+
+        if retry_failed and clustering.status == cls.FAILED:
+            clustering.status = cls.PENDING
+            clustering.progress = 0
+            return clustering, True
+
+        if clustering.status in (cls.PENDING, cls.RUNNING) and clustering.restart_if_stale():
+            return clustering, True
+
+        return clustering, False
+
+    def restart_if_stale(self):
+        """ Reset this clustering to pending if it hasn't changed for `STALE_AFTER`.
+        Returns True if it was reset and so must be queued again. """
+        cutoff = db.session.query(func.now()).scalar() - self.STALE_AFTER
+
+        # only one of many concurrent requests gets to reset it
+        reset = TopicClustering.query\
+            .filter(
+                TopicClustering.id == self.id,
+                TopicClustering.status.in_([self.PENDING, self.RUNNING]),
+                TopicClustering.updated_at < cutoff)\
+            .update({
+                'status': self.PENDING,
+                'progress': 0,
+                'updated_at': func.now(),
+            }, synchronize_session=False)
+
+        if reset:
+            db.session.expire(self, ['status', 'progress', 'updated_at'])
+        return bool(reset)
@@ -2,6 +2,7 @@ from __future__ import division
 
 import re
 import datetime
+from collections import defaultdict
 
 from unidecode import unidecode
 
@@ -10,6 +11,7 @@ from wtforms.fields.html5 import URLField
 
 from sqlalchemy import (
     Column,
+    Index,
     DateTime,
     ForeignKey,
     Integer,
@@ -18,8 +20,13 @@ from sqlalchemy import (
     func,
     Boolean,
     event,
+    and_,
+    desc,
+    select,
+    update,
 )
 from sqlalchemy.orm import relationship, backref, deferred
+from sqlalchemy.orm.session import Session
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy_fulltext import FullText
@@ -99,8 +106,10 @@ class Document(FullText, db.Model):
     principle_violated_id  = Column(Integer, ForeignKey('principles.id'))
 
     flagged              = Column(Boolean, index=True)
+    # bitmask of analysis problems, see DocumentAnalysisProblem
+    problems             = Column(Integer, index=True, nullable=False, default=0, server_default='0')
     notes                = Column(String(1024))
-    raw_tags             = relationship("DocumentTag", lazy=False, cascade='all, delete-orphan', passive_deletes=True, order_by='DocumentTag.tag', collection_class=set)
+    raw_tags             = relationship("DocumentTag", lazy=False, cascade='all, delete-orphan', passive_deletes=True, collection_class=set)
     tags                 = association_proxy('raw_tags', 'tag')
 
     # Associations
@@ -232,22 +241,23 @@ class Document(FullText, db.Model):
         return user.admin or self.created_by is None or self.created_by == user
 
     def relearn_source_affiliations(self):
-        """ Update the default affiilations for people sources linked to this
-        document.
+        """ Queue the people sources linked to this document whose affiliations
+        differ from their default affiliations, so that their default affiliations
+        are relearned in the background. See `Person.relearn_pending_affiliations`.
+
+        Returns True if anyone was queued.
         """
-        self.log.info("Relearning source affiliations %s" % self)
+        from .person import PendingAffiliationRelearn
 
         people = set()
         for source in (s for s in self.sources if s.person):
             if source.affiliation is not None and source.affiliation != source.person.affiliation:
-                people.add(source.person)
-
-        self.log.debug("Relearning source affiliations for %s", people)
+                people.add(source.person.id)
 
-        for person in people:
-            person.relearn_affiliation()
+        self.log.debug("Queuing source affiliations for relearning %s", people)
+        PendingAffiliationRelearn.enqueue(people)
 
-        self.log.info("Source affiliation relearning done")
+        return bool(people)
 
     def analysis_problems(self):
         """ A list of problems (possibly empty) for critical things
@@ -318,6 +328,57 @@ def document_text_set(target, value, oldvalue, initiator):
     target.word_count = count_words(value)
 
 
+@event.listens_for(Session, 'after_flush')
+def find_documents_with_changed_problems(session, flush_context):
+    """ Note the documents that were saved, or whose sources were saved,
+    so that we can recompute their problems once the flush is done. """
+    from .source import DocumentSource
+
+    doc_ids = session.info.setdefault('problem_doc_ids', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Document) and obj not in session.deleted:
+            doc_ids.add(obj.id)
+        elif isinstance(obj, DocumentSource) and obj.doc_id is not None:
+            doc_ids.add(obj.doc_id)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def update_document_problems(session, flush_context):
+    doc_ids = session.info.pop('problem_doc_ids', None)
+    if not doc_ids:
+        return
+
+    DocumentAnalysisProblem.update_documents(session.connection(), doc_ids=doc_ids)
+
+    # the database has the new problems
+    for doc_id in doc_ids:
+        doc = session.identity_map.get(session.identity_key(Document, doc_id))
+        if doc is not None:
+            session.expire(doc, ['problems'])
+
+
+@event.listens_for(Session, 'after_flush')
+def find_changed_tags(session, flush_context):
+    """ Note the tags that were added to or removed from documents,
+    so that we can recount them once the flush is done. """
+    tag_ids = session.info.setdefault('changed_tag_ids', set())
+    for obj in session.new | session.deleted:
+        if isinstance(obj, DocumentTag) and obj.tag_id is not None:
+            tag_ids.add(obj.tag_id)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def update_tag_counts(session, flush_context):
+    tag_ids = session.info.pop('changed_tag_ids', None)
+    if tag_ids:
+        Tag.update_counts(tag_ids, connection=session.connection())
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_changed_tags(session, previous_transaction):
+    session.info.pop('changed_tag_ids', None)
+
+
 def count_words(s):
     """ Count number of words in s """
     if s is None:
@@ -358,7 +419,7 @@ class DocumentForm(Form):
 
         super(DocumentForm, self).__init__(*args, **kwargs)
 
-        from . import Medium, DocumentType, AnalysisNature, Country, DocumentTag
+        from . import Medium, DocumentType, AnalysisNature, Country, Tag
 
         self.medium_id.choices = [['', '(none)']] + Medium.for_select_widget()
         self.document_type_id.choices = [[str(t.id), t.name] for t in DocumentType.query.order_by(DocumentType.name).all()]
@@ -367,7 +428,7 @@ class DocumentForm(Form):
 
         if self.tags.data is not None and not isinstance(self.tags.data, basestring):
             self.tags.data = ','.join(self.tags.data)
-        self.tags.choices = [t[0] for t in db.session.query(DocumentTag.tag.distinct()).order_by(DocumentTag.tag)]
+        self.tags.choices = Tag.names()
 
     def validate_tags(self, field):
         field.data = set(t for t in DocumentTag.split(field.data) if t)
@@ -437,18 +498,159 @@ class DocumentType(db.Model):
         return types
 
 
+class Tag(db.Model):
+    """
+    A tag that can be added to documents. Tag names are unique, and each
+    tag keeps a count of the documents it's on, see `update_counts`.
+    """
+    __tablename__ = 'tags'
+
+    id        = Column(Integer, primary_key=True)
+    name      = Column(String(200), nullable=False, unique=True)
+    doc_count = Column(Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return "<Tag name='%s'>" % (self.name.encode('utf-8'),)
+
+    @classmethod
+    def names(cls):
+        """ Names of all tags in use, for tag choices. """
+        return [t[0] for t in db.session.query(cls.name).filter(cls.doc_count > 0).order_by(cls.name)]
+
+    @classmethod
+    def find_or_create(cls, names):
+        """ A dict from each of +names+ to its Tag, creating new tags as needed.
+
+        New tags are inserted straight away with INSERT IGNORE, so that two
+        requests adding the same new tag at once don't fail. """
+        names = set(names)
+        tags = {}
+
+        with db.session.no_autoflush:
+            if names:
+                tags = cls.fetch(names)
+
+            missing = names - set(tags.iterkeys())
+            if missing:
+                db.session.execute(cls.__table__.insert().prefix_with('IGNORE'),
+                                   [{'name': n} for n in sorted(missing)])
+                # a locking read sees tags that another transaction has
+                # committed since this one began
+                tags.update(cls.fetch(missing, lock=True))
+
+        return tags
+
+    @classmethod
+    def fetch(cls, names, lock=False):
+        """ A dict from each of +names+ to its existing Tag. """
+        # the database matches names case-insensitively, ignoring trailing spaces
+        wanted = defaultdict(list)
+        for n in names:
+            wanted[n.lower().rstrip()].append(n)
+
+        query = cls.query.filter(cls.name.in_(names))
+        if lock:
+            query = query.with_for_update(read=True)
+
+        tags = {}
+        for tag in query:
+            for n in wanted[tag.name.lower().rstrip()]:
+                tags[n] = tag
+        return tags
+
+    @classmethod
+    def filter_query(cls, query, names):
+        """ Filter +query+ to documents that have all of the tags in +names+,
+        using a single grouped semi-join on the (tag_id, doc_id) index. """
+        tag_ids = [t[0] for t in db.session.query(cls.id).filter(cls.name.in_(names))]
+        if len(tag_ids) < len(set(n.lower() for n in names)):
+            # some tags don't exist, so no documents have them all
+            return query.filter(Document.id == None)  # noqa
+
+        doc_ids = db.session.query(DocumentTag.doc_id)\
+            .filter(DocumentTag.tag_id.in_(tag_ids))\
+            .group_by(DocumentTag.doc_id)\
+            .having(func.count(DocumentTag.tag_id) == len(tag_ids))
+        return query.filter(Document.id.in_(doc_ids.subquery()))
+
+    @classmethod
+    def summary_for_docs(cls, doc_ids):
+        """ List of (tag name, count) tuples for the tags on the documents
+        with ids +doc_ids+, most common first. """
+        return db.session\
+            .query(cls.name, func.count(1).label('count'))\
+            .join(DocumentTag, DocumentTag.tag_id == cls.id)\
+            .filter(DocumentTag.doc_id.in_(doc_ids))\
+            .group_by(cls.name)\
+            .order_by(desc('count'), cls.name)\
+            .all()
+
+    @classmethod
+    def add_to_documents(cls, names, doc_ids):
+        """ Add the tags in +names+ to the documents with ids +doc_ids+, in bulk. """
+        tags = cls.find_or_create(names).values()
+        db.session.flush()
+        tag_ids = [t.id for t in tags]
+
+        table = DocumentTag.__table__
+        existing = set(db.session.query(DocumentTag.doc_id, DocumentTag.tag_id)
+                       .filter(DocumentTag.doc_id.in_(doc_ids), DocumentTag.tag_id.in_(tag_ids)))
+        rows = [{'doc_id': doc_id, 'tag_id': tag_id}
+                for doc_id in doc_ids for tag_id in tag_ids
+                if (doc_id, tag_id) not in existing]
+        if rows:
+            db.session.execute(table.insert(), rows)
+            cls.update_counts(tag_ids)
+
+    @classmethod
+    def remove_from_documents(cls, names, doc_ids):
+        """ Remove the tags in +names+ from the documents with ids +doc_ids+, in bulk. """
+        tag_ids = [t[0] for t in db.session.query(cls.id).filter(cls.name.in_(names))]
+        if tag_ids:
+            table = DocumentTag.__table__
+            db.session.execute(table.delete().where(and_(
+                table.c.doc_id.in_(doc_ids),
+                table.c.tag_id.in_(tag_ids))))
+            cls.update_counts(tag_ids)
+
+    @classmethod
+    def update_counts(cls, tag_ids=None, connection=None):
+        """ Recount the documents with the tags with ids +tag_ids+, or all tags. """
+        tags = cls.__table__
+        doc_tags = DocumentTag.__table__
+        count = select([func.count(doc_tags.c.id)]).where(doc_tags.c.tag_id == tags.c.id).as_scalar()
+
+        stmt = update(tags).values(doc_count=count)
+        if tag_ids is not None:
+            stmt = stmt.where(tags.c.id.in_(tag_ids))
+        (connection or db.session).execute(stmt)
+
+
 class DocumentTag(db.Model):
-    """ Free-form tags added to a document. """
+    """ A tag on a document. """
     __tablename__ = 'document_tags'
+    __table_args__ = (
+        Index('ix_document_tags_tag_id_doc_id', 'tag_id', 'doc_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     doc_id = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), index=True)
-    tag = Column(String(200), nullable=False)
+    tag_id = Column(Integer, ForeignKey('tags.id', ondelete='CASCADE', name='fk_document_tags_tag_id'), nullable=False)
+
+    tag_obj = relationship(Tag, lazy=False)
 
     def __init__(self, tag=None):
         if tag:
             self.tag = tag
 
+    @property
+    def tag(self):
+        return self.tag_obj.name
+
+    @tag.setter
+    def tag(self, name):
+        self.tag_obj = Tag.find_or_create([name])[name]
+
     @classmethod
     def split(cls, tags):
         return re.split('\s*,\s*', tags)
@@ -83,13 +83,19 @@ class Entity(db.Model):
         return e
 
     @classmethod
-    def bulk_get(self, pairs):
+    def bulk_get(self, pairs, lock=False):
         """ For a collection of (group, name) pairs, fetch matching entities in
         bulk, returning a map from (group, name) pairs to the entity. Both
-        group and name are lowercased in the resulting map. """
+        group and name are lowercased in the resulting map.
+
+        If +lock+ is True, the entities are read with a shared lock, which
+        also finds entities committed since this transaction began. """
         entities = {}
         filters = [and_(Entity.group == p[0], Entity.name == p[1]) for p in pairs]
-        for e in Entity.query.filter(or_(*filters)).all():
+        query = Entity.query.filter(or_(*filters))
+        if lock:
+            query = query.with_for_update(read=True)
+        for e in query.all():
             entities[(e.group.lower(), e.name.lower())] = e
         return entities
 
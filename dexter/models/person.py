@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime, timedelta
+from itertools import groupby
 import logging
 
 from sqlalchemy import (
@@ -8,11 +9,13 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Integer,
+    Float,
     String,
     func,
     desc,
+    case,
 )
-from sqlalchemy.orm import relationship, joinedload, lazyload
+from sqlalchemy.orm import relationship
 from wtforms import SelectField, BooleanField
 from flask.ext.login import current_user
 
@@ -106,6 +109,9 @@ class Person(db.Model):
 
         return [(affiliations[r[0]], r[1]) for r in rows]
 
+    # how far back we look when relearning affiliations
+    RELEARN_PERIOD = timedelta(days=7)
+
     def relearn_affiliation(self):
         """ Relearn this person's affiliation, based on a time-decaying
         weighted average of affiliation mappings taken from document
@@ -118,88 +124,216 @@ class Person(db.Model):
         All dates are based on document publication dates.
 
         Returns True if the affiliation was updated, False otherwise.
+
+        See `relearn_affiliations` to relearn affiliations for many people at once.
         """
-        from . import DocumentSource, Document
+        from . import DocumentSource, Document, Affiliation
 
         now = datetime.utcnow()
-        days_ago = now - timedelta(days=7)
+        days_ago = now - self.RELEARN_PERIOD
 
-        sources = DocumentSource.query\
+        occurrences = db.session.query(
+            DocumentSource.affiliation_id,
+            Document.published_at)\
             .join(Document, Document.id == DocumentSource.doc_id)\
-            .options(
-                lazyload('*'),
-                joinedload(DocumentSource.affiliation),
-                joinedload(DocumentSource.document).load_only("published_at"),
-            )\
             .filter(Document.published_at >= days_ago)\
             .filter(DocumentSource.person_id == self.id)\
-            .filter(DocumentSource.affiliation != None)\
+            .filter(DocumentSource.affiliation_id != None)\
             .order_by(Document.published_at)\
             .all()  # noqa
 
-        self.log.debug("Relearning affiliations from %d occurrences since %s" % (len(sources), days_ago))
+        self.log.debug("Relearning affiliations from %d occurrences since %s" % (len(occurrences), days_ago))
 
-        weights = {}
+        affiliation_id = learn_affiliation(self.affiliation_id, occurrences, now, days_ago)
+        if affiliation_id != self.affiliation_id:
+            affiliation = Affiliation.query.get(affiliation_id)
+            self.log.info("Learned new affiliation for %s: was=%s, now=%s" % (self, self.affiliation, affiliation))
+            self.affiliation = affiliation
+            return True
 
-        # exponential decay. An affiliation from today is worth
-        # only half that tomorrow, a half again the day after, etc.
-        # Cap the weight at 100 so that we don't get overflow.
-        weight = lambda d: 1.0 / (2 ** min(100.0, (now - d).days))
+        return False
 
-        # current affiliation
-        if self.affiliation:
-            weights[self.affiliation] = weight(days_ago)
+    @classmethod
+    def relearn_affiliations(cls, person_ids=None):
+        """ Relearn the affiliations of the people with ids in +person_ids+, or of
+        everyone who has been a source recently if +person_ids+ is None. This is the
+        same as calling `relearn_affiliation` for each person, but it fetches
+        all recent affiliations in one streamed query and updates people in bulk.
 
-        # accumulate weights for affiliations gathered over the last
-        # period
-        for source in sources:
-            weights[source.affiliation] = \
-                weights.get(source.affiliation, 0) + \
-                weight(source.document.published_at)
+        Returns the number of people whose affiliations were updated.
+        """
+        from . import DocumentSource, Document
 
-        self.log.debug("Affiliation weights for %s: %s" % (self, weights))
+        now = datetime.utcnow()
+        days_ago = now - cls.RELEARN_PERIOD
+
+        if person_ids is not None:
+            person_ids = list(set(person_ids))
+            if not person_ids:
+                return 0
+
+        query = db.session.query(
+            DocumentSource.person_id,
+            Person.affiliation_id,
+            DocumentSource.affiliation_id,
+            Document.published_at)\
+            .join(Document, Document.id == DocumentSource.doc_id)\
+            .join(Person, Person.id == DocumentSource.person_id)\
+            .filter(Document.published_at >= days_ago)\
+            .filter(DocumentSource.affiliation_id != None)\
+            .order_by(DocumentSource.person_id, Document.published_at)  # noqa
 
-        if weights:
-            affiliation, _ = max(weights.items(), key=lambda pair: pair[1])
+        if person_ids is not None:
+            query = query.filter(DocumentSource.person_id.in_(person_ids))
 
-            if affiliation != self.affiliation:
-                self.log.info("Learned new affiliation for %s: was=%s, now=%s" % (self, self.affiliation, affiliation))
-                self.affiliation = affiliation
-                return True
+        # new affiliation id -> person ids
+        changes = {}
+        people = 0
 
-        return False
+        for person_id, rows in groupby(query.yield_per(1000), key=lambda r: r[0]):
+            rows = list(rows)
+            current_id = rows[0][1]
+            people += 1
+
+            affiliation_id = learn_affiliation(current_id, [(r[2], r[3]) for r in rows], now, days_ago)
+            if affiliation_id != current_id:
+                changes.setdefault(affiliation_id, []).append(person_id)
+
+        count = 0
+        for affiliation_id, ids in changes.iteritems():
+            for i in xrange(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                Person.query\
+                    .filter(Person.id.in_(chunk))\
+                    .update({'affiliation_id': affiliation_id}, synchronize_session=False)
+                count += len(chunk)
+
+        cls.log.info("Relearned affiliations for %d people, %d changed" % (people, count))
+        return count
+
+    @classmethod
+    def relearn_pending_affiliations(cls):
+        """ Relearn the affiliations of people queued with `PendingAffiliationRelearn.enqueue`,
+        and empty the queue. Returns the number of people whose affiliations were updated.
+        """
+        person_ids = [r[0] for r in db.session.query(PendingAffiliationRelearn.person_id)]
+        if not person_ids:
+            return 0
+
+        for i in xrange(0, len(person_ids), 500):
+            PendingAffiliationRelearn.query\
+                .filter(PendingAffiliationRelearn.person_id.in_(person_ids[i:i + 500]))\
+                .delete(synchronize_session=False)
+
+        return cls.relearn_affiliations(person_ids)
 
     def merge_into(self, dest):
         """
         Merge this person into +dest+, and delete
         this person.
         """
-        from . import Author, DocumentSource, Entity, Document
-
         if self.id is None or dest.id is None:
             raise ValueError("Both id's must be valid")
 
-        # for all documents for which we're a source, if dest
-        # is also a source then delete us
-        for doc in Document.query\
-                .join(DocumentSource)\
-                .filter(DocumentSource.person == self)\
-                .all():
-            if any(ds.person == dest for ds in doc.sources):
-                for ds in doc.sources:
-                    if ds.person == self:
-                        db.session.delete(ds)
+        # the merge is done directly in the database, so anything
+        # else in the session is stale afterwards
+        db.session.flush()
+        Person.merge_people([(self.id, dest.id)])
+        db.session.expunge(self)
+        db.session.expire_all()
 
-        for m in [Author, DocumentSource, Entity]:
-            m.query.filter(m.person_id == self.id).update({'person_id': dest.id})
+        self.log.info("Merged %s into %s" % (self, dest))
+
+    @classmethod
+    def merge_people(cls, pairs, batch_size=500):
+        """
+        Merge people in bulk. +pairs+ is a list of (duplicate_id, dest_id) tuples:
+        each duplicate is merged into its destination and then deleted.
+        Destinations that are themselves merged elsewhere are followed,
+        so that [(a, b), (b, c)] merges both a and b into c.
+
+        This works directly on the database with a handful of statements
+        per batch, so objects already in the session may be stale.
+        Returns the number of people merged.
+        """
+        from . import Author, DocumentSource, Entity
+        from .entity import sanitise_name
+
+        mapping = dict((dup, dest) for dup, dest in pairs if dup != dest)
+
+        def resolve(person_id):
+            seen = set()
+            while person_id in mapping and person_id not in seen:
+                seen.add(person_id)
+                person_id = mapping[person_id]
+            return person_id
+
+        mapping = dict((dup, resolve(dup)) for dup in mapping)
+        # ignore cycles
+        mapping = dict((dup, dest) for dup, dest in mapping.iteritems() if dup != dest)
+
+        dups = mapping.keys()
+        for i in xrange(0, len(dups), batch_size):
+            batch = dict((dup, mapping[dup]) for dup in dups[i:i + batch_size])
+            person_ids = set(batch.keys()) | set(batch.values())
+
+            # for each document, keep only one source for each destination person
+            rows = db.session.query(
+                DocumentSource.id,
+                DocumentSource.doc_id,
+                DocumentSource.person_id)\
+                .filter(DocumentSource.person_id.in_(person_ids))\
+                .order_by(DocumentSource.doc_id, DocumentSource.id)\
+                .all()
+
+            # sources of destination people come first
+            rows.sort(key=lambda r: (r[1], r[2] in batch, r[0]))
+            doc_ids = sorted(set(doc_id for _, doc_id, person_id in rows if person_id in batch))
+            seen = set()
+            delete_ids = []
+            for source_id, doc_id, person_id in rows:
+                key = (doc_id, batch.get(person_id, person_id))
+                if key in seen:
+                    if person_id in batch:
+                        delete_ids.append(source_id)
+                else:
+                    seen.add(key)
+
+            for j in xrange(0, len(delete_ids), batch_size):
+                DocumentSource.query\
+                    .filter(DocumentSource.id.in_(delete_ids[j:j + batch_size]))\
+                    .delete(synchronize_session=False)
+
+            # point everything at the destinations
+            for m in [Author, DocumentSource, Entity]:
+                m.query\
+                    .filter(m.person_id.in_(batch.keys()))\
+                    .update({'person_id': case(batch, value=m.person_id)}, synchronize_session=False)
+
+            # the bulk changes to sources skip the flush hooks that keep the documents' problems up to date
+            update_document_problems(doc_ids)
+
+            # ensure we remember the old people as aliases of the new ones
+            names = dict((sanitise_name(name), person_id) for person_id, name in
+                         db.session.query(Person.id, Person.name).filter(Person.id.in_(batch.keys())))
+            existing = Entity.bulk_get([('person', name) for name in names.iterkeys()]) if names else {}
+            for name, person_id in names.iteritems():
+                e = existing.get(('person', name.lower()))
+                if not e:
+                    e = Entity()
+                    e.group = 'person'
+                    e.name = name[0:150]
+                    db.session.add(e)
+                e.person_id = batch[person_id]
+            db.session.flush()
 
-        # ensure we remember the old person as an alias of the new one
-        e = Entity.get_or_create('person', self.name)
-        e.person = dest
+            Person.query\
+                .filter(Person.id.in_(batch.keys()))\
+                .delete(synchronize_session=False)
 
-        self.log.info("Merged %s into %s" % (self, dest))
+            cls.log.info("Merged %d people" % len(batch))
 
-        db.session.delete(self)
+        return len(dups)
 
     @classmethod
     def similarly_named_to(cls, name, threshold=0.8):
@@ -233,9 +367,13 @@ class Person(db.Model):
         to the current state.
         """
         from . import DocumentSource
-        DocumentSource.query\
-            .filter(DocumentSource.person_id == self.id)\
-            .update({'affiliation_id': self.affiliation_id})
+
+        sources = DocumentSource.query.filter(DocumentSource.person_id == self.id)
+        doc_ids = [r[0] for r in sources.with_entities(DocumentSource.doc_id).distinct()]
+        sources.update({'affiliation_id': self.affiliation_id})
+
+        # a bulk update skips the flush hooks that keep the documents' problems up to date
+        update_document_problems(doc_ids)
 
     def __repr__(self):
         return "<Person id=%s, name=\"%s\">" % (self.id, self.name.encode('utf-8'))
@@ -265,6 +403,100 @@ class Person(db.Model):
         return p
 
 
+def learn_affiliation(current_id, occurrences, now, since):
+    """ Choose an affiliation id from the +current_id+ (which may be None) and
+    a list of (affiliation_id, published_at) +occurrences+, using an exponentially
+    decaying weight based on how long ago each occurrence was. The current
+    affiliation is considered to have been set at +since+.
+    """
+    weights = {}
+
+    # exponential decay. An affiliation from today is worth
+    # only half that tomorrow, a half again the day after, etc.
+    # Cap the weight at 100 so that we don't get overflow.
+    weight = lambda d: 1.0 / (2 ** min(100.0, (now - d).days))
+
+    # current affiliation
+    if current_id is not None:
+        weights[current_id] = weight(since)
+
+    # accumulate weights for affiliations gathered over the last
+    # period
+    for affiliation_id, published_at in occurrences:
+        weights[affiliation_id] = weights.get(affiliation_id, 0) + weight(published_at)
+
+    if not weights:
+        return current_id
+
+    affiliation_id, _ = max(weights.items(), key=lambda pair: pair[1])
+    return affiliation_id
+
+
+class PendingAffiliationRelearn(db.Model):
+    """
+    A person whose affiliation must be relearned because a document they're
+    a source in has changed. Relearning is batched and done in the background,
+    see `Person.relearn_pending_affiliations`.
+    """
+    __tablename__ = "pending_affiliation_relearns"
+
+    person_id   = Column(Integer, ForeignKey('people.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    created_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    @classmethod
+    def enqueue(cls, person_ids):
+        """ Queue people for relearning, ignoring those already queued. """
+        person_ids = set(person_ids)
+        if not person_ids:
+            return
+
+        # concurrent saves can queue the same people, so rather than checking
+        # first, let the database ignore the duplicates
+        db.session.execute(
+            cls.__table__.insert().prefix_with('IGNORE'),
+            [{'person_id': person_id} for person_id in sorted(person_ids)])
+
+
+def update_document_problems(doc_ids, batch_size=500):
+    """ Recompute the problems of the documents with +doc_ids+ after their
+    sources have been changed in bulk, and expire those already loaded. """
+    from . import Document
+    from .problems import DocumentAnalysisProblem
+
+    for i in xrange(0, len(doc_ids), batch_size):
+        DocumentAnalysisProblem.update_documents(db.session.connection(), doc_ids=doc_ids[i:i + batch_size])
+
+    for doc_id in doc_ids:
+        doc = db.session.identity_map.get(db.session.identity_key(Document, doc_id))
+        if doc is not None:
+            db.session.expire(doc, ['problems'])
+
+
+class PersonMergeCandidate(db.Model):
+    """
+    A pair of people who are probably the same person, found by
+    `dexter.analysis.people.DuplicatePeopleFinder`, for an admin to review
+    and merge. The duplicate is the one with fewer sources, and would be
+    merged into the person.
+    """
+    __tablename__ = "person_merge_candidates"
+
+    id           = Column(Integer, primary_key=True)
+    person_id    = Column(Integer, ForeignKey('people.id', ondelete='CASCADE'), index=True, nullable=False)
+    duplicate_id = Column(Integer, ForeignKey('people.id', ondelete='CASCADE'), index=True, nullable=False)
+    # similarity of the two names, from 0 to 1
+    score        = Column(Float, index=True, nullable=False)
+
+    created_at   = Column(DateTime(timezone=True), index=True, unique=False, nullable=False, server_default=func.now())
+
+    # Associations
+    person       = relationship("Person", foreign_keys=[person_id])
+    duplicate    = relationship("Person", foreign_keys=[duplicate_id])
+
+    def __repr__(self):
+        return "<PersonMergeCandidate person=%s, duplicate=%s, score=%s>" % (self.person_id, self.duplicate_id, self.score)
+
+
 class PersonForm(Form):
     gender_id  = SelectField('Gender', default='')
     race_id    = SelectField('Race', default='')
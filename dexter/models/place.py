@@ -6,8 +6,13 @@ from sqlalchemy import (
     Integer,
     Float,
     String,
+    and_,
     func,
     or_,
+    select,
+    desc,
+    distinct,
+    union_all,
     )
 from sqlalchemy.orm import relationship, backref
 
@@ -15,6 +20,7 @@ import logging
 log = logging.getLogger(__name__)
 
 from ..app import db
+from ..cache import cached
 from .with_offsets import WithOffsets
 
 class Place(db.Model):
@@ -120,6 +126,87 @@ class Place(db.Model):
                 self.mainplace_name, self.subplace_name)
 
 
+    @property
+    def parent_geo_id(self):
+        """ The geo_id of the next place up the heirarchy, ignoring districts. """
+        if self.level == 'subplace':
+            return 'mainplace-%s' % self.mainplace_code
+        if self.level == 'mainplace':
+            return 'municipality-%s' % self.municipality_code
+        if self.level == 'municipality':
+            return 'province-%s' % self.province_code
+        return None
+
+    # levels that we include in GeoJSON and map summaries
+    MAP_LEVELS = ('province', 'municipality', 'mainplace')
+
+    @classmethod
+    def centroids(cls):
+        """
+        A dict from geo_id to a [lat, lng] pair for each place in `MAP_LEVELS`.
+
+        Provinces and municipalities don't have a lat/lng of their own, so we
+        approximate their centroids as the mean of their mainplaces' centroids.
+        """
+        centroids = {}
+
+        mainplaces = Place.query.filter(Place.level == 'mainplace', Place.lat != None)  # noqa
+        for p in mainplaces:
+            centroids[p.geo_id] = [p.lat, p.lng]
+
+        for level in ['province', 'municipality']:
+            code = getattr(Place, '%s_code' % level)
+            rows = db.session.query(code, func.avg(Place.lat), func.avg(Place.lng))\
+                .filter(Place.level == 'mainplace', Place.lat != None)\
+                .group_by(code)  # noqa
+
+            for code, lat, lng in rows:
+                centroids['%s-%s' % (level, code)] = ['%.6f' % lat, '%.6f' % lng]
+
+        return centroids
+
+    @classmethod
+    def geojson(cls):
+        """
+        A GeoJSON FeatureCollection of points for the place heirarchy,
+        province -> municipality -> mainplace. Each feature has its geo_id as its
+        id, and its parent's geo_id as the `parent` property.
+
+        Places never change, so this is cached for a long time.
+        """
+        return cached('places-geojson', cls._build_geojson, timeout=24 * 60 * 60)
+
+    @classmethod
+    def _build_geojson(cls):
+        centroids = cls.centroids()
+        features = []
+
+        for p in Place.query.filter(Place.level.in_(cls.MAP_LEVELS)).order_by(Place.id):
+            coords = centroids.get(p.geo_id)
+            if not coords:
+                continue
+
+            features.append({
+                'type': 'Feature',
+                'id': p.geo_id,
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [float(coords[1]), float(coords[0])],
+                },
+                'properties': {
+                    'level': p.level,
+                    'code': p.code,
+                    'name': p.name,
+                    'full_name': p.full_name,
+                    'parent': p.parent_geo_id,
+                },
+            })
+
+        return {
+            'type': 'FeatureCollection',
+            'features': features,
+        }
+
     @classmethod
     def find(cls, term):
         """
@@ -218,6 +305,7 @@ class DocumentPlace(db.Model, WithOffsets):
                         mentions[geo_id]['documents'] = []
 
                     mentions[geo_id]['documents'].append(d.id)
+                    mentions[geo_id]['document_count'] = len(mentions[geo_id]['documents'])
 
         return {
             'document_count': count,
@@ -225,6 +313,102 @@ class DocumentPlace(db.Model, WithOffsets):
             'origins': origins,
         }
 
+    @classmethod
+    def summary_for_query(cls, doc_ids, top_documents=0):
+        """
+        Generate a summary description for places in the documents selected by
+        `doc_ids`, a query of document ids, for plotting on maps.
+
+        This is the same as `summary_for_docs`, except that the counting happens
+        in the database, so it doesn't load any documents. Each mention includes
+        the ids of (at most) `top_documents` of its most relevant documents, rather
+        than all of them, and regions include approximate coordinates.
+        """
+        doc_ids = doc_ids.subquery()
+        relevant = [
+            DocumentPlace.doc_id.in_(select([doc_ids.c.id])),
+            DocumentPlace.relevant == True]  # noqa
+
+        count = db.session\
+            .query(func.count(distinct(DocumentPlace.doc_id)))\
+            .filter(*relevant)\
+            .scalar()
+
+        rows = db.session\
+            .query(DocumentPlace.place_id, func.count(distinct(DocumentPlace.doc_id)))\
+            .filter(*relevant)\
+            .group_by(DocumentPlace.place_id)\
+            .all()
+
+        places = Place.query.filter(Place.id.in_(r[0] for r in rows)).all() if rows else []
+        places = dict((p.id, p) for p in places)
+        centroids = dict((f['id'], f['geometry']['coordinates']) for f in Place.geojson()['features'])
+
+        mentions = {}
+        for place_id, n in rows:
+            place = places[place_id]
+            mention = mentions.get(place.geo_id)
+
+            if mention is None:
+                mention = mentions[place.geo_id] = place.as_dict()
+                mention['document_count'] = 0
+                mention['documents'] = []
+
+                if 'coordinates' in mention:
+                    # points store theirs as strings
+                    mention['coordinates'] = [float(c) for c in mention['coordinates']]
+                elif place.geo_id in centroids:
+                    lng, lat = centroids[place.geo_id]
+                    mention['coordinates'] = [lat, lng]
+
+            mention['document_count'] += n
+
+        if top_documents and rows:
+            # only the few most relevant documents for each place are fetched,
+            # with a LIMITed query per place, so this doesn't grow with the
+            # number of documents
+            geo_ids = dict((p.id, p.geo_id) for p in places.itervalues())
+            place_ids = [r[0] for r in rows]
+            top = []
+            for i in xrange(0, len(place_ids), cls.TOP_DOCUMENTS_BATCH):
+                top.extend(cls._top_documents(place_ids[i:i + cls.TOP_DOCUMENTS_BATCH], relevant, top_documents))
+
+            # places can share a geo_id, so merge them most relevant first
+            top.sort(key=lambda r: r[2], reverse=True)
+            for place_id, doc_id, relevance in top:
+                docs = mentions[geo_ids[place_id]]['documents']
+                if len(docs) < top_documents and doc_id not in docs:
+                    docs.append(doc_id)
+
+        return {
+            'document_count': count,
+            'mentions': mentions.values(),
+            'origins': {},
+        }
+
+    # number of places to fetch top documents for in one query
+    TOP_DOCUMENTS_BATCH = 20
+
+    @classmethod
+    def _top_documents(cls, place_ids, criteria, limit):
+        """ (place_id, doc_id, relevance) rows for the +limit+ most relevant
+        documents of each of +place_ids+, matching +criteria+. """
+        queries = []
+        for place_id in place_ids:
+            relevance = func.max(DocumentPlace.relevance).label('relevance')
+            top = select([DocumentPlace.place_id, DocumentPlace.doc_id, relevance])\
+                .where(and_(DocumentPlace.place_id == place_id, *criteria))\
+                .group_by(DocumentPlace.place_id, DocumentPlace.doc_id)\
+                .order_by(desc(relevance))\
+                .limit(limit)\
+                .alias()
+            # wrapped so that each LIMIT applies to its own place in the union
+            queries.append(select([top]))
+
+        if len(queries) == 1:
+            return db.session.execute(queries[0]).fetchall()
+        return db.session.execute(union_all(*queries)).fetchall()
+
 
 # Places we know aren't in SA, but sometimes match something in our DB
 PLACE_STOPWORDS = set(x.strip() for x in """
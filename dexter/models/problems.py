@@ -1,3 +1,5 @@
+from sqlalchemy import and_, case, exists, select, update
+
 from .analysis_nature import AnalysisNature
 
 
@@ -6,14 +8,33 @@ class DocumentAnalysisProblem(object):
     A helper class that describes a problem with a document's analysis.
     It has support for filtering SQL queries to find documents with that
     problem, describing the problem, etc.
+
+    Each problem has its own `bit` in the `Document.problems` bitmask, which
+    is recomputed from the `flag_expression` of each problem whenever a document
+    or its sources are saved (see `update_documents`). Filtering and counting
+    documents by problem then only needs that one indexed column.
     """
     _problems = {}
     natures = None
 
+    # this problem's bit in Document.problems, which must never change
+    bit = None
+
+    @property
+    def mask(self):
+        return 1 << self.bit
+
     def check(self, doc):
         raise NotImplementedError()
 
-    def filter_query(self, query):
+    def flag_expression(self):
+        """ A SQL boolean expression, correlated with the documents table,
+        which is true for documents that have this problem. This lets us
+        check for problems across many documents in a single query.
+
+        Tables other than documents are aliased, so that they're never
+        correlated away by joins added to the enclosing query.
+        """
         raise NotImplementedError()
 
     @classmethod
@@ -24,8 +45,52 @@ class DocumentAnalysisProblem(object):
 
     @classmethod
     def for_document(cls, doc):
-        return [p for p in cls.all()
-                if (not p.natures or doc.analysis_nature.nature in p.natures) and p.check(doc)]
+        if doc.problems is None:
+            # not saved yet
+            problems = [p for p in cls.all() if p.check(doc)]
+        else:
+            problems = [p for p in cls.all() if doc.problems & p.mask]
+
+        return [p for p in problems if not p.natures or doc.analysis_nature.nature in p.natures]
+
+    @classmethod
+    def filter_query_for(cls, problems, query):
+        """ Filter +query+ to documents that have all of +problems+.
+
+        Rather than a bitwise test that can't use an index, this looks for the
+        (few) possible bitmasks that include all the problems.
+        """
+        from .document import Document
+
+        required = 0
+        for p in problems:
+            required |= p.mask
+
+        n_bits = max(p.bit for p in cls.all()) + 1
+        masks = [m for m in xrange(1 << n_bits) if m & required == required]
+        return query.filter(Document.problems.in_(masks))
+
+    @classmethod
+    def mask_expression(cls):
+        """ A SQL expression for the problems bitmask of the current document. """
+        return sum(case([(p.flag_expression(), p.mask)], else_=0) for p in cls.all())
+
+    @classmethod
+    def update_documents(cls, connection, doc_ids=None, min_id=None, max_id=None):
+        """ Recompute the problems bitmask of the documents with ids +doc_ids+,
+        or with ids between +min_id+ and +max_id+ (inclusive). """
+        from .document import Document
+
+        table = Document.__table__
+        stmt = update(table).values(problems=cls.mask_expression())
+        if doc_ids is not None:
+            stmt = stmt.where(table.c.id.in_(doc_ids))
+        if min_id is not None:
+            stmt = stmt.where(table.c.id >= min_id)
+        if max_id is not None:
+            stmt = stmt.where(table.c.id <= max_id)
+
+        return connection.execute(stmt).rowcount
 
     @classmethod
     def for_select(cls):
@@ -38,6 +103,7 @@ class DocumentAnalysisProblem(object):
 
 class MissingTopic(DocumentAnalysisProblem):
     code = 'missing-topic'
+    bit = 0
     short_desc = 'missing a topic'
     long_desc  = 'This document is missing a topic.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -45,13 +111,14 @@ class MissingTopic(DocumentAnalysisProblem):
     def check(self, doc):
         return doc.topic is None
 
-    def filter_query(self, query):
+    def flag_expression(self):
         from .document import Document
-        return query.filter(Document.topic == None)  # noqa
+        return Document.topic_id == None  # noqa
 
 
 class MissingOrigin(DocumentAnalysisProblem):
     code = 'missing-origin'
+    bit = 1
     short_desc = 'missing an origin'
     long_desc  = 'This document is missing an origin.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -59,13 +126,14 @@ class MissingOrigin(DocumentAnalysisProblem):
     def check(self, doc):
         return doc.origin_location_id is None
 
-    def filter_query(self, query):
+    def flag_expression(self):
         from .document import Document
-        return query.filter(Document.origin == None)  # noqa
+        return Document.origin_location_id == None  # noqa
 
 
 class NotChildFocused(DocumentAnalysisProblem):
     code = 'unclear-child-focused'
+    bit = 2
     short_desc = 'unclear child focus'
     long_desc  = 'Not clear if this document is child focused or not.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -74,16 +142,18 @@ class NotChildFocused(DocumentAnalysisProblem):
         return (doc.analysis_nature.nature == 'children'
                 and doc.child_focus is None)
 
-    def filter_query(self, query):
+    def flag_expression(self):
         from .document import Document
-        return query\
-            .join(AnalysisNature)\
-            .filter(AnalysisNature.nature == 'children',
-                   Document.child_focus == None)  # noqa
+        natures = AnalysisNature.__table__.alias()
+        return and_(
+            Document.analysis_nature_id.in_(
+                select([natures.c.id]).where(natures.c.nature == 'children')),
+            Document.child_focus == None)  # noqa
 
 
 class SourceWithoutFunction(DocumentAnalysisProblem):
     code = 'source-without-function'
+    bit = 3
     short_desc = 'source without a function'
     long_desc  = 'This document has a source without a function.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -91,16 +161,17 @@ class SourceWithoutFunction(DocumentAnalysisProblem):
     def check(self, doc):
         return any(ds.source_type != 'child' and ds.source_function_id is None for ds in doc.sources)
 
-    def filter_query(self, query):
-        from . import DocumentSource
-        return query\
-                .join(DocumentSource)\
-                .filter(DocumentSource.source_type != 'child')\
-                .filter(DocumentSource.function == None)  # noqa
+    def flag_expression(self):
+        sources = _sources_alias()
+        return _has_source(
+            sources,
+            sources.c.source_type != 'child',
+            sources.c.source_function_id == None)  # noqa
 
 
 class SourceWithoutAffiliation(DocumentAnalysisProblem):
     code = 'source-without-affiliation'
+    bit = 4
     short_desc = 'source without an affiliation'
     long_desc  = 'This document has a source without an affiliation.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -108,16 +179,17 @@ class SourceWithoutAffiliation(DocumentAnalysisProblem):
     def check(self, doc):
         return any(ds.source_type != 'child' and ds.affiliation_id is None for ds in doc.sources)
 
-    def filter_query(self, query):
-        from . import DocumentSource
-        return query\
-                .join(DocumentSource)\
-                .filter(DocumentSource.source_type != 'child')\
-                .filter(DocumentSource.affiliation == None)  # noqa
+    def flag_expression(self):
+        sources = _sources_alias()
+        return _has_source(
+            sources,
+            sources.c.source_type != 'child',
+            sources.c.affiliation_id == None)  # noqa
 
 
 class ChildSourceWithoutAge(DocumentAnalysisProblem):
     code = 'child-source-without-age'
+    bit = 5
     short_desc = 'child source without an age'
     long_desc  = 'This document has a child source without an age.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -125,16 +197,17 @@ class ChildSourceWithoutAge(DocumentAnalysisProblem):
     def check(self, doc):
         return any(ds.source_type == 'child' and ds.source_age_id is None for ds in doc.sources)
 
-    def filter_query(self, query):
-        from . import DocumentSource
-        return query\
-                .join(DocumentSource)\
-                .filter(DocumentSource.source_type == 'child')\
-                .filter(DocumentSource.age == None)  # noqa
+    def flag_expression(self):
+        sources = _sources_alias()
+        return _has_source(
+            sources,
+            sources.c.source_type == 'child',
+            sources.c.source_age_id == None)  # noqa
 
 
 class ChildSourceWithoutRole(DocumentAnalysisProblem):
     code = 'child-source-without-role'
+    bit = 6
     short_desc = 'child source without a role'
     long_desc  = 'This document has a child source without a role.'
     natures = (AnalysisNature.CHILDREN, AnalysisNature.ELECTIONS)
@@ -142,9 +215,21 @@ class ChildSourceWithoutRole(DocumentAnalysisProblem):
     def check(self, doc):
         return any(ds.source_type == 'child' and ds.source_role_id is None for ds in doc.sources)
 
-    def filter_query(self, query):
-        from . import DocumentSource
-        return query\
-                .join(DocumentSource)\
-                .filter(DocumentSource.source_type == 'child')\
-                .filter(DocumentSource.role == None)  # noqa
+    def flag_expression(self):
+        sources = _sources_alias()
+        return _has_source(
+            sources,
+            sources.c.source_type == 'child',
+            sources.c.source_role_id == None)  # noqa
+
+
+def _sources_alias():
+    from . import DocumentSource
+    return DocumentSource.__table__.alias()
+
+
+def _has_source(sources, *criteria):
+    """ EXISTS clause for a source of the current document that matches
+    all of `criteria`. """
+    from .document import Document
+    return exists().where(and_(sources.c.doc_id == Document.id, *criteria)).correlate(Document.__table__)
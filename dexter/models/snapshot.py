@@ -0,0 +1,62 @@
+import json
+
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Integer,
+    Date,
+    DateTime,
+    func,
+    Index,
+    )
+from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.mysql import LONGTEXT
+
+from ..app import db
+
+
+class MineSnapshot(db.Model):
+    """
+    Precomputed results of the Dexter Mine analyses for the documents in a country
+    published over the last few days, optionally for just one medium.
+
+    See dexter.analysis.mine.
+    """
+    __tablename__ = "mine_snapshots"
+
+    id          = Column(Integer, primary_key=True)
+    country_id  = Column(Integer, ForeignKey('countries.id', ondelete='CASCADE'), nullable=False)
+    # length of the period, in days
+    days        = Column(Integer, nullable=False)
+    # the medium, or None for all media
+    medium_id   = Column(Integer, ForeignKey('mediums.id', ondelete='CASCADE'))
+    # the day the period is counted back from
+    yesterday   = Column(Date, nullable=False)
+    # json-encoded results, see dexter.analysis.mine
+    raw_data    = Column(LONGTEXT, nullable=False)
+    created_at  = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    country = relationship("Country")
+    medium  = relationship("Medium")
+
+    @property
+    def data(self):
+        return json.loads(self.raw_data)
+
+    @data.setter
+    def data(self, value):
+        self.raw_data = json.dumps(value, separators=(',', ':'))
+
+    def __repr__(self):
+        return "<MineSnapshot country=%s, days=%s, medium=%s, yesterday=%s>" % (
+            self.country_id, self.days, self.medium_id, self.yesterday)
+
+    @classmethod
+    def find(cls, country, days, medium, yesterday):
+        return cls.query.filter(
+            cls.country_id == country.id,
+            cls.days == days,
+            cls.medium_id == (medium.id if medium else None),
+            cls.yesterday == yesterday).first()
+
+Index('mine_snapshots_country_days_yesterday_ix', MineSnapshot.country_id, MineSnapshot.days, MineSnapshot.yesterday)
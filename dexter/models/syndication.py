@@ -0,0 +1,68 @@
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    Float,
+    String,
+    func,
+    )
+from sqlalchemy.orm import relationship, backref
+
+from ..app import db
+
+
+class DocumentFingerprint(db.Model):
+    """
+    A MinHash signature of a document's text, used to find near-duplicate
+    documents, such as the same wire story syndicated across different media.
+    See `dexter.minhash`.
+    """
+    __tablename__ = "document_fingerprints"
+
+    id           = Column(Integer, primary_key=True)
+    doc_id       = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), index=True, nullable=False, unique=True)
+    # copied from the document, so that we can load recent fingerprints without a join
+    published_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    # the signature's integers, as a string of 8-character hex values
+    raw_signature = Column(String(1024), nullable=False)
+
+    created_at   = Column(DateTime(timezone=True), index=True, unique=False, nullable=False, server_default=func.now())
+
+    # Associations
+    document     = relationship("Document", backref=backref('fingerprint', uselist=False, cascade='all, delete-orphan', passive_deletes=True))
+
+    @property
+    def signature(self):
+        return tuple(int(self.raw_signature[i:i + 8], 16) for i in xrange(0, len(self.raw_signature), 8))
+
+    @signature.setter
+    def signature(self, sig):
+        self.raw_signature = ''.join('%08x' % h for h in sig)
+
+    def __repr__(self):
+        return "<DocumentFingerprint id=%s, doc=%s>" % (self.id, self.doc_id)
+
+
+class DocumentSyndication(db.Model):
+    """
+    Links a document to the canonical document that it's a near-duplicate of,
+    usually because it's the same story syndicated across different media.
+    """
+    __tablename__ = "document_syndications"
+
+    id               = Column(Integer, primary_key=True)
+    doc_id           = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), index=True, nullable=False, unique=True)
+    canonical_doc_id = Column(Integer, ForeignKey('documents.id', ondelete='CASCADE'), index=True, nullable=False)
+    # estimated Jaccard similarity of the two texts
+    similarity       = Column(Float, nullable=False)
+
+    created_at       = Column(DateTime(timezone=True), index=True, unique=False, nullable=False, server_default=func.now())
+
+    # Associations
+    document         = relationship("Document", foreign_keys=[doc_id],
+                                    backref=backref('syndication', uselist=False, cascade='all, delete-orphan', passive_deletes=True))
+    canonical        = relationship("Document", foreign_keys=[canonical_doc_id])
+
+    def __repr__(self):
+        return "<DocumentSyndication doc=%s, canonical=%s, similarity=%s>" % (self.doc_id, self.canonical_doc_id, self.similarity)
@@ -1,66 +1,194 @@
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import MetaData, Table, Column, Integer, Float, String, Text, DateTime, ForeignKey
 
-from ..app import db
+from .document import Document
+from .source import DocumentSource
+from .fdi import Investment
 
 # NOTE: sqlalchemy doesn't easily support creating views, so that is done
-# in mysql-specific SQL in resources/mysql/views.sql. 
+# in mysql-specific SQL in resources/mysql/views.sql.
 #
-# Don't load this module during tests
+# The columns of each view are declared here, in the same order as in views.sql,
+# rather than reflected, so that importing this module doesn't need to
+# talk to the database. Keep them in sync with views.sql, and check them
+# with `python app.py check_views`.
+#
+# The views have their own metadata, so that db.create_all() and alembic
+# don't treat them as tables.
+metadata = MetaData()
 
 # helper view across documents
-DocumentsView = Table("documents_view", db.metadata, 
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentsView = Table("documents_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("article_url", String(200)),
+        Column("title", String(1024)),
+        Column("published_at", DateTime),
+        Column("published_date", String(10)),
+        Column("user_added", String(100)),
+        Column("user_analysis", String(100)),
+        Column("dexter_url", String(100)),
+        Column("country", String(50)),
+        Column("item_num", Integer),
+        Column("medium", String(100)),
+        Column("medium_type", String(100)),
+        Column("medium_group", String(100)),
+        Column("parent_org", String(100)),
+        Column("topic", String(150)),
+        Column("topic_group", String(100)),
+        Column("origin", String(100)),
+        Column("origin_group", String(100)),
+        Column("document_type", String(100)),
+        Column("author_name", String(100)),
+        Column("author_type", String(100)),
+        Column("word_count", Integer),
+        Column("basic_context", String(30)),
+        Column("causes_mentioned", String(30)),
+        Column("consequences_mentioned", String(30)),
+        Column("solutions_offered", String(30)),
+        Column("relevant_policies", String(30)),
+        Column("self_help_offered", String(30)),
+        Column("analysis_nature", String(100)),
+        Column("flagged", Integer),
+        Column("flag_notes", String(1024)))
 
 # helper view across sources
-DocumentSourcesView = Table("document_sources_view", db.metadata, 
-        Column("document_source_id", Integer, ForeignKey("document_sources.id")),
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentSourcesView = Table("document_sources_view", metadata,
+        Column("source_type", String(50)),
+        Column("source_name", String(100)),
+        Column("gender", String(50)),
+        Column("race", String(50)),
+        Column("source_age", String(50)),
+        Column("affiliation", String(100)),
+        Column("affiliation_code", String(50)),
+        Column("affiliation_group", String(100)),
+        Column("affiliation_group_code", String(50)),
+        Column("function", String(100)),
+        Column("role", String(100)),
+        Column("quoted", String(20)),
+        Column("photographed", String(20)),
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("document_source_id", Integer, ForeignKey(DocumentSource.__table__.c.id)))
 
 # helper view across utterances
-PersonUtterancesView = Table("person_utterances_view", db.metadata, 
-        Column("document_source_id", Integer, ForeignKey("document_sources.id")),
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+PersonUtterancesView = Table("person_utterances_view", metadata,
+        Column("source_type", String(50)),
+        Column("person", String(100)),
+        Column("race", String(50)),
+        Column("gender", String(50)),
+        Column("source_age", String(50)),
+        Column("affiliation", String(100)),
+        Column("affiliation_code", String(50)),
+        Column("affiliation_group", String(100)),
+        Column("affiliation_group_code", String(50)),
+        Column("function", String(100)),
+        Column("role", String(100)),
+        Column("quote", Text),
+        Column("person_id", Integer),
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("document_source_id", Integer, ForeignKey(DocumentSource.__table__.c.id)))
 
 # helper across document fairness
-DocumentFairnessView = Table("documents_fairness_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentFairnessView = Table("documents_fairness_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("fairness", String(100)),
+        Column("favour", String(100)),
+        Column("favour_code", String(50)),
+        Column("oppose", String(100)),
+        Column("oppose_code", String(50)))
 
 # helper across document keywords
-DocumentKeywordsView = Table("documents_keywords_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentKeywordsView = Table("documents_keywords_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("keyword", String(100)),
+        Column("relevance", Float),
+        Column("occurrences", Integer))
 
 # helper across document places
-DocumentPlacesView = Table("documents_places_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentPlacesView = Table("documents_places_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("province_code", String(5)),
+        Column("province_name", String(20)),
+        Column("municipality_code", String(10)),
+        Column("municipality_name", String(50)),
+        Column("level", String(15)),
+        Column("name", String(50)))
 
 # helper across document principles
-DocumentPrinciplesView = Table("documents_principles_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentPrinciplesView = Table("documents_principles_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("principle_supported", String(150)),
+        Column("principle_violated", String(150)))
 
 # helper across documents for children analysis
-DocumentChildrenView = Table("documents_children_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentChildrenView = Table("documents_children_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("child_focused", String(30)),
+        Column("secondary_victim_source", String(40)),
+        Column("secondary_victim_identified", String(40)),
+        Column("secondary_victim_victim_of_abuse", String(40)),
+        Column("secondary_victim_source_identified_abused", String(50)),
+        Column("basic_context", String(30)),
+        Column("causes_mentioned", String(30)),
+        Column("consequences_mentioned", String(30)),
+        Column("solutions_offered", String(30)),
+        Column("relevant_policies", String(30)),
+        Column("self_help_offered", String(30)))
 
 # helper across documents for issue analysis
-DocumentIssuesView = Table("documents_issues_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentIssuesView = Table("documents_issues_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("issue", String(100)))
 
 # helper across documents for taxonomy analysis
-DocumentTaxonomiesView = Table("documents_taxonomies_view", db.metadata,
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+DocumentTaxonomiesView = Table("documents_taxonomies_view", metadata,
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("label", String(200)),
+        Column("score", Float))
 
 # helper view across investments
-InvestmentsView = Table("investments_view", db.metadata,
-        Column("investment_id", Integer, ForeignKey("investments.id")),
-        Column("document_id", Integer, ForeignKey("documents.id")),
-        autoload=True, autoload_with=db.engine)
+InvestmentsView = Table("investments_view", metadata,
+        Column("investment_name", String(100)),
+        Column("published_at", String(10)),
+        Column("start_date", String(10)),
+        Column("end_date", String(10)),
+        Column("value", String(100)),
+        Column("value_rand", String(100)),
+        Column("perm_opps", Integer),
+        Column("temp_opps", Integer),
+        Column("invest_tier_1", String(50)),
+        Column("invest_tier_2", String(50)),
+        Column("invest_tier_3", String(50)),
+        Column("company", String(1024)),
+        Column("type", String(50)),
+        Column("phase", String(50)),
+        Column("phase_date", String(10)),
+        Column("origin_of_investment", String(50)),
+        Column("investment_origin_city", String(50)),
+        Column("sector_name", String(50)),
+        Column("location", String(100)),
+        Column("industry", String(50)),
+        Column("target_market", String(50)),
+        Column("gov_programs", String(1024)),
+        Column("soc_programs", String(1024)),
+        Column("motivation", String(1024)),
+        Column("notes", String(1024)),
+        Column("document_id", Integer, ForeignKey(Document.__table__.c.id)),
+        Column("investment_id", Integer, ForeignKey(Investment.__table__.c.id)))
+
+VIEWS = [DocumentsView, DocumentSourcesView, PersonUtterancesView, DocumentFairnessView,
+         DocumentKeywordsView, DocumentPlacesView, DocumentPrinciplesView, DocumentChildrenView,
+         DocumentIssuesView, DocumentTaxonomiesView, InvestmentsView]
+
+
+def check_views(engine):
+    """ Compare the columns declared for each view with those in the database.
+    Returns a list of (view name, declared column names, actual column names)
+    tuples for views that differ. """
+    differences = []
+    for view in VIEWS:
+        reflected = Table(view.name, MetaData(), autoload=True, autoload_with=engine)
+        declared = [c.name for c in view.columns]
+        actual = [c.name for c in reflected.columns]
+        if declared != actual:
+            differences.append((view.name, declared, actual))
+
+    return differences
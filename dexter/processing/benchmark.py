@@ -0,0 +1,159 @@
+from __future__ import division
+
+import logging
+import time
+from collections import defaultdict
+from functools import wraps
+
+from sqlalchemy import event
+
+from ..models import db, Document
+from .document_processor import DocumentProcessorNT
+
+
+def percentile(values, pct):
+    """ The +pct+ percentile of a sorted list of values, using the nearest rank. """
+    if not values:
+        return None
+    rank = int(round(pct / 100 * len(values) + 0.5)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class IngestionBenchmark(object):
+    """
+    Runs ingestion end to end for a day's feed, fetching the feed items and
+    processing each one, and measures throughput, the time taken by each
+    stage and the number of database queries per document.
+
+    Run this against a scratch database, with responses replayed by
+    `dexter.processing.replay`, so that results are repeatable.
+
+        >>> bench = IngestionBenchmark()
+        >>> bench.run(date(2014, 9, 7), limit=100)
+        >>> print bench.format_report()
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, processor=None):
+        self.processor = processor or DocumentProcessorNT()
+        self.timings = defaultdict(list)
+        self.queries_per_doc = []
+        self.doc_ids = []
+        self.items = 0
+        self.failed = 0
+        self.elapsed = 0.0
+        self.queries = 0
+
+        self.instrument(self.processor)
+
+    def instrument(self, dp):
+        """ Time the stages of processing a feed item. """
+        dp.newstools_crawler.crawl = self.timed('crawl', dp.newstools_crawler.crawl)
+        dp.find_syndicated = self.timed('syndication', dp.find_syndicated)
+        dp.normalise = self.timed('normalise', dp.normalise)
+        for extractor in dp.extractors:
+            extractor.extract = self.timed('extract.%s' % extractor.__class__.__name__, extractor.extract)
+
+    def timed(self, stage, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[stage].append(time.time() - start)
+        return wrapper
+
+    def count_query(self, *args):
+        self.queries += 1
+
+    def run(self, day, limit=None):
+        """ Fetch and process up to +limit+ items from the feed for +day+. """
+        event.listen(db.engine, 'before_cursor_execute', self.count_query)
+        start = time.time()
+
+        try:
+            feed_start = time.time()
+            items = []
+            for item in self.processor.fetch_daily_feed_items(day):
+                items.append(item)
+                if limit and len(items) >= limit:
+                    break
+            self.timings['feed'].append(time.time() - feed_start)
+
+            for item in items:
+                self.process(item)
+        finally:
+            self.elapsed = time.time() - start
+            event.remove(db.engine, 'before_cursor_execute', self.count_query)
+
+    def process(self, item):
+        self.items += 1
+        queries = self.queries
+        start = time.time()
+
+        try:
+            doc = self.processor.process_feed_item(item)
+            if doc:
+                self.doc_ids.append(doc.id)
+        except Exception as e:
+            self.log.warn("Error processing %s: %s" % (item['url'], e), exc_info=e)
+            self.failed += 1
+
+        self.timings['total'].append(time.time() - start)
+        self.queries_per_doc.append(self.queries - queries)
+
+    def cleanup(self):
+        """ Delete the documents created by this benchmark. """
+        if self.doc_ids:
+            for doc in Document.query.filter(Document.id.in_(self.doc_ids)):
+                db.session.delete(doc)
+            db.session.commit()
+
+    def report(self):
+        stages = {}
+        for stage, times in self.timings.iteritems():
+            times = sorted(times)
+            stages[stage] = {
+                'count': len(times),
+                'p50': percentile(times, 50),
+                'p90': percentile(times, 90),
+                'p99': percentile(times, 99),
+                'max': times[-1],
+            }
+
+        queries = sorted(self.queries_per_doc)
+
+        return {
+            'items': self.items,
+            'documents': len(self.doc_ids),
+            'failed': self.failed,
+            'elapsed': self.elapsed,
+            'items_per_sec': self.items / self.elapsed if self.elapsed else 0.0,
+            'stages': stages,
+            'queries_per_item': {
+                'mean': sum(queries) / len(queries) if queries else 0,
+                'p50': percentile(queries, 50),
+                'p90': percentile(queries, 90),
+                'max': queries[-1] if queries else None,
+            },
+        }
+
+    def format_report(self):
+        r = self.report()
+
+        lines = [
+            "Items: %d, documents: %d, failed: %d" % (r['items'], r['documents'], r['failed']),
+            "Elapsed: %.2fs, %.2f items/sec" % (r['elapsed'], r['items_per_sec']),
+            "Queries per item: mean %.1f, p50 %s, p90 %s, max %s" % (
+                r['queries_per_item']['mean'], r['queries_per_item']['p50'],
+                r['queries_per_item']['p90'], r['queries_per_item']['max']),
+            "",
+            "%-30s %6s %9s %9s %9s %9s" % ('Stage', 'Count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'),
+        ]
+        for stage, info in sorted(r['stages'].iteritems()):
+            lines.append("%-30s %6d %9.1f %9.1f %9.1f %9.1f" % (
+                stage, info['count'], info['p50'] * 1000, info['p90'] * 1000,
+                info['p99'] * 1000, info['max'] * 1000))
+
+        return "\n".join(lines)
@@ -0,0 +1,407 @@
+"""
+Bulk import of historical archives of documents.
+
+An archive is a local JSONL or CSV file with one document per line, with
+these fields:
+
+    url, title, published_at (or date), author, text, and optionally
+    calais, the cached OpenCalais response for the text
+
+The work that doesn't need the database, such as fetching OpenCalais results
+that aren't cached and fingerprinting the text, is done in a pool of worker
+processes. The main process then stores the documents in batches: entities,
+authors and the other lookups for a whole batch are resolved in a few queries,
+new entities are added with a single multi-row INSERT, and each batch is
+committed once, without autoflushing.
+
+After each batch the line number of the last item is written to a checkpoint
+file, so that an interrupted import can be resumed.
+
+    >>> importer = BulkImporter(checkpoint='archive.checkpoint')
+    >>> importer.run('archive.jsonl')
+    >>> print importer.format_report()
+"""
+
+from __future__ import division
+
+import csv
+import json
+import logging
+import os
+import time
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+
+from dateutil.parser import parse
+from unidecode import unidecode
+
+from ..models import db, Document, Entity, Author, AuthorType, DocumentType, DocumentFairness, Fairness, \
+    AnalysisNature, DocumentFingerprint
+from ..models.entity import sanitise_name
+from .document_processor import DocumentProcessorNT
+from .extractors import CalaisExtractor, SourcesExtractor, PlacesExtractor
+from .syndication import SyndicationIndex
+
+
+def read_archive(path):
+    """ Yield (line number, item) tuples for the items in a JSONL or CSV archive. """
+    with open(path) as f:
+        if path.endswith('.csv'):
+            for i, row in enumerate(csv.DictReader(f), 1):
+                yield i, dict((k, v.decode('utf-8') if v else None) for k, v in row.iteritems())
+        else:
+            for i, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield i, json.loads(line)
+
+
+def prepare_item(args):
+    """ Do the work for an archive item that doesn't need the database.
+    This runs in a worker process, so it returns a plain dict. """
+    line, item = args
+    prepared = {
+        'line': line,
+        'url': item.get('url'),
+    }
+
+    try:
+        doc = Document()
+        doc.text = item.get('text')
+        doc.normalise_text()
+
+        calais = item.get('calais')
+        if calais and not isinstance(calais, basestring):
+            calais = json.dumps(calais)
+        doc.raw_calais = calais or None
+
+        prepared.update({
+            'title': item.get('title'),
+            'published_at': parse(item.get('published_at') or item['date']),
+            'author': item.get('author'),
+            'text': doc.text,
+        })
+
+        if doc.text and 'the' in doc.text:
+            prepared['extractions'] = CalaisExtractor().fetch_data(doc)
+            prepared['raw_calais'] = doc.raw_calais
+            prepared['signature'] = SyndicationIndex.shared().signature(doc.text)
+    except Exception as e:
+        prepared['error'] = "%s: %s" % (e.__class__.__name__, e)
+
+    return prepared
+
+
+class BulkCalaisExtractor(CalaisExtractor):
+    """ Uses OpenCalais results fetched by the workers, and entities resolved
+    for the whole batch. """
+    # entities to look up in one query
+    ENTITY_CHUNK = 500
+
+    def __init__(self):
+        self.extractions = None
+        # entity_key(group, name) -> entity
+        self.entities = {}
+
+    def fetch_data(self, doc):
+        return self.extractions
+
+    def get_entity(self, group, name):
+        return self.entities[self.entity_key(group, name)]
+
+    def entity_key(self, group, name):
+        # stored as Entity.get_or_create stores them, compared as mysql compares them,
+        # ignoring trailing spaces
+        group, name = group[0:50], sanitise_name(name)[0:150]
+        return group.lower().rstrip(), unidecode(name).lower().rstrip()
+
+    def resolve_entities(self, extractions):
+        """ Find or create all the entities needed to extract from a list of
+        extractions, in a few queries. """
+        names = {}
+        for calais in extractions:
+            for group, name in self.entity_names(calais):
+                names[self.entity_key(group, name)] = (group, name)
+
+        entities = self.fetch_entities(names.values())
+        # in a consistent order, so that concurrent inserts don't deadlock
+        missing = sorted(pair for key, pair in names.iteritems() if key not in entities)
+        if missing:
+            # one multi-row INSERT for all of them, ignoring any that
+            # mysql considers the same as an existing entity, or that another
+            # process has added since we looked
+            db.session.execute(Entity.__table__.insert().prefix_with('IGNORE'),
+                               [{'group': g, 'name': n} for g, n in missing])
+            # a locking read sees entities that another process has committed
+            # since this transaction began
+            entities.update(self.fetch_entities(missing, lock=True))
+
+        self.entities = entities
+
+    def fetch_entities(self, pairs, lock=False):
+        entities = {}
+        pairs = list(pairs)
+        for i in xrange(0, len(pairs), self.ENTITY_CHUNK):
+            for e in Entity.bulk_get(pairs[i:i + self.ENTITY_CHUNK], lock=lock).itervalues():
+                entities[self.entity_key(e.group, e.name)] = e
+        return entities
+
+    def entity_names(self, calais):
+        """ The (group, name) pairs of the entities that `extract` will need. """
+        for group, group_ents in calais.get('entities', {}).iteritems():
+            group = self.normalise_name(group)
+            for ent in group_ents.itervalues():
+                if 'name' in ent and len(ent['name']) >= 2:
+                    yield group[0:50], sanitise_name(ent['name'])[0:150]
+
+        for quote in calais.get('relations', {}).get('Quotation', {}).itervalues():
+            group = self.normalise_name(quote['speaker']['_type'])
+            yield group[0:50], sanitise_name(quote['speaker']['name'])[0:150]
+
+
+class BulkSourcesExtractor(SourcesExtractor):
+    """ Loads the people once per batch. """
+    people = None
+
+    def all_people(self):
+        if self.people is None:
+            self.people = super(BulkSourcesExtractor, self).all_people()
+        return self.people
+
+
+class BulkPlacesExtractor(PlacesExtractor):
+    """ Looks up each place name once per batch. """
+    def __init__(self):
+        self.places = {}
+
+    def find_place(self, name):
+        if name not in self.places:
+            self.places[name] = super(BulkPlacesExtractor, self).find_place(name)
+        return self.places[name]
+
+
+class BulkImporter(object):
+    """
+    Imports documents from an archive, see `read_archive`.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, processor=None, batch_size=200, workers=None, checkpoint=None):
+        self.processor = processor or DocumentProcessorNT()
+        self.crawler = self.processor.newstools_crawler
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint = checkpoint
+
+        self.calais = BulkCalaisExtractor()
+        self.sources = BulkSourcesExtractor()
+        self.places = BulkPlacesExtractor()
+
+        self.counts = Counter()
+        self.elapsed = 0.0
+        self.resumed_from = 0
+
+    def run(self, path, limit=None):
+        """ Import up to +limit+ items from the archive at +path+. """
+        self.resumed_from = self.read_checkpoint()
+        items = ((line, item) for line, item in read_archive(path) if line > self.resumed_from)
+        if limit:
+            items = islice(items, limit)
+
+        start = time.time()
+        pool = Pool(self.workers)
+        try:
+            # prepare the next batch while we store this one, without
+            # reading more than that from the archive
+            chunks = iter(lambda: list(islice(items, self.batch_size)), [])
+            pending = None
+            for chunk in chunks:
+                preparing = pool.map_async(prepare_item, chunk, chunksize=10)
+                if pending:
+                    self.import_batch(pending.get())
+                    self.log_progress(start)
+                pending = preparing
+
+            if pending:
+                self.import_batch(pending.get())
+        finally:
+            pool.terminate()
+            self.elapsed = time.time() - start
+
+    def import_batch(self, batch):
+        """ Store a batch of prepared items and commit. """
+        self.counts['items'] += len(batch)
+        last_line = batch[-1]['line']
+        batch = [p for p in batch if self.check(p)]
+
+        try:
+            with db.session.no_autoflush:
+                self.resolve(batch)
+                docs = []
+                for prepared in batch:
+                    doc = self.build_document(prepared)
+                    if doc:
+                        db.session.add(doc)
+                        docs.append(doc)
+
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+
+        self.counts['processed'] += len(docs)
+        self.write_checkpoint(last_line)
+
+    def check(self, prepared):
+        if 'error' in prepared:
+            self.log.warn("Error preparing %s on line %d: %s" % (prepared['url'], prepared['line'], prepared['error']))
+            self.counts['error'] += 1
+            return False
+
+        if 'extractions' not in prepared:
+            self.log.info("Document %s doesn't have reasonable-looking text, ignoring" % prepared['url'])
+            self.counts['bad_text'] += 1
+            return False
+
+        prepared['url'] = self.processor.canonicalise_url(prepared['url'])
+        if not prepared['url']:
+            self.counts['bad_url'] += 1
+            return False
+
+        return True
+
+    def resolve(self, batch):
+        """ Look up everything the documents in this batch refer to, removing
+        documents we already have. """
+        urls = set(p['url'] for p in batch)
+        existing = set(r[0] for r in db.session.query(Document.url).filter(Document.url.in_(urls))) if urls else set()
+
+        keep = []
+        for prepared in batch:
+            if prepared['url'] in existing:
+                self.counts['duplicate'] += 1
+            else:
+                # also ignore duplicates within the archive
+                existing.add(prepared['url'])
+                keep.append(prepared)
+        batch[:] = keep
+
+        self.calais.resolve_entities(p['extractions'] for p in batch)
+        self.resolve_authors(batch)
+
+        self.document_type = DocumentType.query.filter(DocumentType.name == 'News story').one()
+        self.fair = Fairness.query.filter(Fairness.name == 'Fair').one()
+        self.analysis_nature = AnalysisNature.lookup(AnalysisNature.ANCHOR)
+        self.sources.people = None
+        self.places.places = {}
+
+    def resolve_authors(self, batch):
+        names = set(p['author'][0:100] for p in batch if p['author'] and p['author'].lower() != 'unknown')
+
+        self.authors = {}
+        if names:
+            for a in Author.query.filter(Author.name.in_(names)):
+                self.authors[a.name.lower()] = a
+
+        journalist = AuthorType.journalist()
+        for name in names:
+            if name.lower() not in self.authors:
+                self.authors[name.lower()] = Author.get_or_create(name, journalist)
+
+        self.unknown_author = Author.unknown()
+
+    def build_document(self, prepared):
+        """ Build a document from a prepared item, or return None if it should be ignored. """
+        url = prepared['url']
+        if not self.crawler.offer(url):
+            self.counts['no_medium'] += 1
+            return None
+
+        doc = Document()
+        doc.url = url
+        doc.title = prepared['title']
+        doc.published_at = prepared['published_at']
+        doc.text = prepared['text']
+        doc.raw_calais = prepared['raw_calais']
+
+        author = prepared['author']
+        if author and author.lower() != 'unknown':
+            doc.author = self.authors[author[0:100].lower()]
+        else:
+            doc.author = self.unknown_author
+
+        # medium and country
+        self.crawler.extract(doc, None)
+
+        doc.analysis_nature = self.analysis_nature
+        doc.document_type = self.document_type
+        df = DocumentFairness()
+        df.fairness = self.fair
+        doc.fairness.append(df)
+
+        self.calais.extractions = prepared['extractions']
+        self.calais.extract(doc)
+
+        # only add a document if it has sources or utterances, and
+        # sources come from utterances
+        if not doc.utterances:
+            self.counts['no_sources'] += 1
+            if doc in db.session:
+                db.session.expunge(doc)
+            return None
+
+        self.sources.extract(doc)
+        self.places.extract(doc)
+
+        fingerprint = DocumentFingerprint()
+        fingerprint.published_at = doc.published_at
+        fingerprint.signature = prepared['signature']
+        doc.fingerprint = fingerprint
+
+        return doc
+
+    def read_checkpoint(self):
+        """ The line number of the last item that was imported, or 0. """
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                return json.load(f)['line']
+        return 0
+
+    def write_checkpoint(self, line):
+        if not self.checkpoint:
+            return
+
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'line': line}, f)
+        os.rename(tmp, self.checkpoint)
+
+    def log_progress(self, start):
+        elapsed = time.time() - start
+        self.log.info("Imported %d documents from %d items in %.1fs, %.1f documents/sec" % (
+            self.counts['processed'], self.counts['items'], elapsed,
+            self.counts['processed'] / elapsed if elapsed else 0.0))
+
+    def report(self):
+        return {
+            'items': self.counts['items'],
+            'documents': self.counts['processed'],
+            'resumed_from': self.resumed_from,
+            'elapsed': self.elapsed,
+            'docs_per_sec': self.counts['processed'] / self.elapsed if self.elapsed else 0.0,
+            'outcomes': dict(self.counts),
+        }
+
+    def format_report(self):
+        report = self.report()
+        lines = [
+            "Imported %d documents from %d items in %.1fs (%.2f documents/sec)" % (
+                report['documents'], report['items'], report['elapsed'], report['docs_per_sec']),
+        ]
+        if report['resumed_from']:
+            lines.append("Resumed after line %d" % report['resumed_from'])
+        for outcome, count in sorted(report['outcomes'].iteritems()):
+            if outcome != 'items':
+                lines.append("  %-12s %8d" % (outcome, count))
+        return '\n'.join(lines)
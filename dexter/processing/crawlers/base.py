@@ -2,13 +2,17 @@ from urlparse import urlparse, urlunparse
 from dateutil.parser import parse
 
 import logging
-import requests
 
 from ...models import Medium
+from ..fetcher import Fetcher
 
 class BaseCrawler(object):
     log = logging.getLogger(__name__)
 
+    @property
+    def fetcher(self):
+        return Fetcher.shared()
+
     def offer(self, url):
         """ Can this crawler process this URL? """
         raise NotImplemented()
@@ -43,7 +47,7 @@ class BaseCrawler(object):
         """
         self.log.info("Fetching URL: " + url)
 
-        r = requests.get(url, timeout=10)
+        r = self.fetcher.get(url, timeout=10)
         # raise an HTTPError on badness
         r.raise_for_status()
 
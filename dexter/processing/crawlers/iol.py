@@ -3,7 +3,6 @@ import re
 import HTMLParser
 
 from bs4 import BeautifulSoup
-import requests
 
 from .base import BaseCrawler
 from ...models import Author, AuthorType
@@ -54,7 +53,7 @@ class IOLCrawler(BaseCrawler):
         """ Fetch document data in JSON from the IOL API """
         url = 'http://beta.iol.co.za/feed/a/' + iol_id
         self.log.info("Fetching URL: " + url)
-        r = requests.get(url, timeout=10)
+        r = self.fetcher.get(url, timeout=10)
         # raise an HTTPError on badness
         r.raise_for_status()
         return r.json()
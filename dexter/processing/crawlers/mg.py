@@ -2,7 +2,6 @@ from urlparse import urlparse, urlunparse
 import re
 
 from bs4 import BeautifulSoup
-import requests
 
 from .base import BaseCrawler
 from ...models import Entity, Author, AuthorType
@@ -28,7 +27,7 @@ class MGCrawler(BaseCrawler):
 
         self.log.info("Fetching URL: " + url)
 
-        r = requests.get(url)
+        r = self.fetcher.get(url)
         # raise an HTTPError on badness
         r.raise_for_status()
 
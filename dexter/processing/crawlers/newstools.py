@@ -1,6 +1,5 @@
 from urlparse import urlparse
 import HTMLParser
-import requests
 from dateutil.parser import parse
 import re
 import unidecode
@@ -64,7 +63,7 @@ class NewstoolsCrawler(BaseCrawler):
         return doc
 
     def fetch_text(self, url):
-        r = requests.get(url, verify=False, timeout=60)
+        r = self.fetcher.get(url, verify=False, timeout=60)
         r.raise_for_status()
         return self.unescape(r.text)
 
@@ -141,14 +140,15 @@ class NewstoolsCrawlerNT(BaseCrawler):
         self.extract(doc, None)
 
         text_url = item['text_url']
-        r_s = requests.get(text_url)
+        r_s = self.fetcher.get(text_url, timeout=60)
+        r_s.raise_for_status()
         s = str(unidecode.unidecode(HTMLParser.HTMLParser().unescape(r_s.text)))
         doc.text = re.sub(' +', ' ', s)
 
         return doc
 
     def fetch_text(self, url):
-        r = requests.get(url, verify=False, timeout=60)
+        r = self.fetcher.get(url, verify=False, timeout=60)
         r.raise_for_status()
         return self.unescape(r.text)
 
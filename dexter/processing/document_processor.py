@@ -1,12 +1,16 @@
 import time
 import logging
 
-import requests
 from requests.exceptions import HTTPError
 from sqlalchemy.sql import desc
 
-from ..models import Document, db, DocumentType, DocumentFairness, Fairness, AnalysisNature, DocumentTaxonomy
+from ..models import Document, db, DocumentType, DocumentFairness, Fairness, AnalysisNature, DocumentTaxonomy, \
+    DocumentFingerprint, DocumentSyndication
 from ..processing import ProcessingError
+from .syndication import SyndicationIndex
+from .fetcher import Fetcher
+from .feeds import parse_feed_items, response_stream
+from .metrics import IngestionMetrics
 
 from .crawlers import *  # noqa
 from .extractors import WatsonExtractor, CalaisExtractor, SourcesExtractor, PlacesExtractor
@@ -231,7 +235,7 @@ class DocumentProcessor:
 
         payload = {'PHP_AUTH_USER': self.FEED_USER, 'PHP_AUTH_PW': self.FEED_PASSWORD}
 
-        r = requests.get(self.FEED_URL % day.strftime('%d-%m-%Y'),
+        r = Fetcher.shared().get(self.FEED_URL % day.strftime('%d-%m-%Y'),
                          headers=payload,
                          verify=False,
                          timeout=60)
@@ -344,6 +348,9 @@ class DocumentProcessorNT:
             SourcesExtractor(),
             PlacesExtractor()]
 
+        self.syndication = SyndicationIndex.shared()
+        self.metrics = IngestionMetrics.shared()
+
     def process_url(self, url):
         """ Download and process an article at +url+ and return
         a Document instance. """
@@ -374,9 +381,52 @@ class DocumentProcessorNT:
 
     def process_document(self, doc):
         """ Process an existing document. """
-        self.normalise(doc)
+        with self.metrics.timer('normalise'):
+            self.normalise(doc)
         self.extract(doc)
 
+    def process_syndicated_document(self, doc, canonical, similarity):
+        """ Process a document that is a near-duplicate of `canonical`, such as
+        a syndicated copy of the same story. This re-uses the canonical document's
+        OpenCalais results, rather than calling the API again, and links
+        the two documents.
+        """
+        self.log.info("%s is a syndicated copy of %s (similarity %.2f)" % (doc, canonical, similarity))
+
+        doc.raw_calais = canonical.raw_calais
+        self.process_document(doc)
+
+        if doc.text != canonical.text:
+            # the offsets are for the canonical text, so they're unreliable
+            for u in doc.utterances:
+                u.offset = u.length = None
+            for x in doc.entities + doc.places:
+                x.offset_list = None
+
+        syndication = DocumentSyndication()
+        syndication.canonical = canonical
+        syndication.similarity = similarity
+        doc.syndication = syndication
+
+    def find_syndicated(self, sig):
+        """ Find the canonical document for a document with fingerprint `sig`,
+        if it's a near-duplicate of a recent document. Returns a (document, similarity)
+        tuple or (None, None).
+        """
+        doc_id, similarity = self.syndication.find(sig)
+        if doc_id is None:
+            return None, None
+
+        canonical = Document.query.get(doc_id)
+        if canonical is None:
+            return None, None
+
+        # link to the original, not to another copy
+        if canonical.syndication:
+            canonical = canonical.syndication.canonical
+
+        return canonical, similarity
+
     def normalise(self, doc):
         """ Run some normalisations on the document. """
         doc.normalise_text()
@@ -398,7 +448,8 @@ class DocumentProcessorNT:
     def extract(self, doc):
         """ Run extraction routines on a document. """
         for extractor in self.extractors:
-            extractor.extract(doc)
+            with self.metrics.timer('extract.%s' % extractor.__class__.__name__):
+                extractor.extract(doc)
 
     def get_or_set_entity(self, entities, entity):
         key = (entity.group.lower(), entity.name.lower())
@@ -409,63 +460,35 @@ class DocumentProcessorNT:
         return entity
 
     def fetch_daily_feed_items(self, day):
-        """ Fetch the feed for +day+ and yields the items. """
-        tree = self.fetch_daily_feeds(day)
-
-        items = tree.findall('channel/item')
-        self.log.info("Got %d items from feeds for %s" % (len(items), day))
-
-        for item in items:
-            # <item>
-            #    <url>http://citizen.co.za/afp_feed_article/yankees-pay-tribute-to-retiring-captain-jeter</url>
-            #    <publisher>Citizen</publisher>
-            #    <contenttype>news</contenttype>
-            #    <contenttypeverified>false</contenttypeverified>
-            #    <publishdate>2014-09-07 23:51:00</publishdate>
-            #    <crawldate>2014-09-08 00:03:47</crawldate>
-            #    <title>Yankees pay tribute to retiring captain Jeter</title>
-            #    <author>Unknown</author>
-            #    <text>https://www.newstools.co.za/data/texts/SFM-7IVZ63RG1MZ2XZF4OTTC.txt</text>
-            # </item>
-
-            item = {
-                'url': item.find('url').text,
-                'publishdate': item.find('publishdate').text,
-                'title': item.find('title').text,
-                'author': item.find('author').text,
-                'text_url': item.find('text').text,
-            }
-            yield item
+        """ Fetch the feed for +day+ and yield the items as they're read. """
+        return self.fetch_feed_items(self.FEED_URL % day.strftime('%d-%m-%Y'), day)
 
     def fetch_filtered_daily_feed_items(self, day, filter_parm):
-        """ Fetch the feed for +day+ and yields the items. """
-        tree = self.fetch_filtered_daily_feeds(day, filter_parm)
+        """ Fetch the filtered feed for +day+ and yield the items as they're read. """
+        return self.fetch_feed_items(self.FEED_FILTER_URL % (day.strftime('%d-%m-%Y'), filter_parm), day)
 
-        items = tree.findall('channel/item')
-        self.log.info("Got %d items from feeds for %s" % (len(items), day))
+    def fetch_feed_items(self, url, day):
+        """ Fetch the feed at +url+ and yield its items while it downloads. """
+        if self.FEED_PASSWORD is None:
+            raise ValueError("%s.FEED_PASSWORD must be set." % self.__class__.__name__)
 
-        for item in items:
-            # <item>
-            #    <url>http://citizen.co.za/afp_feed_article/yankees-pay-tribute-to-retiring-captain-jeter</url>
-            #    <publisher>Citizen</publisher>
-            #    <contenttype>news</contenttype>
-            #    <contenttypeverified>false</contenttypeverified>
-            #    <publishdate>2014-09-07 23:51:00</publishdate>
-            #    <crawldate>2014-09-08 00:03:47</crawldate>
-            #    <title>Yankees pay tribute to retiring captain Jeter</title>
-            #    <author>Unknown</author>
-            #    <text>https://www.newstools.co.za/data/texts/SFM-7IVZ63RG1MZ2XZF4OTTC.txt</text>
-            # </item>
+        start = time.time()
+        r = Fetcher.shared().get(url,
+                                 auth=(self.FEED_USER, self.FEED_PASSWORD),
+                                 verify=False,
+                                 timeout=60,
+                                 stream=True)
+        r.raise_for_status()
 
-            item = {
-                'url': item.find('url').text,
-                'publishdate': item.find('publishdate').text,
-                'title': item.find('title').text,
-                'author': item.find('author').text,
-                'text_url': item.find('text').text,
-            }
+        count = 0
+        for item in parse_feed_items(response_stream(r)):
+            count += 1
             yield item
 
+        self.log.info("Got %d items from feeds for %s" % (count, day))
+        self.metrics.observe('feed', time.time() - start)
+        self.metrics.flush(force=True)
+
     def process_feed_item(self, item):
         """ Process an item pulled from an RSS feed.
 
@@ -480,20 +503,24 @@ class DocumentProcessorNT:
             url = item['url'] = self.canonicalise_url(item['url'])
             if not url:
                 self.log.info("URL could not be parsed, ignoring: %s" % url)
+                self.metrics.count('bad_url')
                 return None
 
             existing = Document.query.filter(Document.url == url).first()
             if existing:
                 self.log.info("URL has already been processed, ignoring: %s" % url)
+                self.metrics.count('duplicate')
                 return None
 
             if not self.newstools_crawler.offer(url):
                 self.log.info("No medium for URL, ignoring: %s" % url)
+                self.metrics.count('no_medium')
                 return
 
             # this sets up basic info
             try:
-                doc = self.newstools_crawler.crawl(item)
+                with self.metrics.timer('text'):
+                    doc = self.newstools_crawler.crawl(item)
             except Exception as e:
                 self.log.error("Error fetching document: %s" % e, exc_info=e)
                 raise ProcessingError("Error fetching document: %s" % (e,))
@@ -510,73 +537,47 @@ class DocumentProcessorNT:
             if not doc.text or 'the' not in doc.text:
                 self.log.info("Document %s doesn't have reasonable-looking text, ignoring: %s..." % (url, doc.text[0:100]))
                 db.session.rollback()
+                self.metrics.count('bad_text')
                 return None
 
             doc.analysis_nature = AnalysisNature.lookup(AnalysisNature.ANCHOR)
-            self.process_document(doc)
+
+            # is it a copy of a document we've already processed?
+            with self.metrics.timer('syndication'):
+                sig = self.syndication.signature(doc.text)
+                canonical, similarity = self.find_syndicated(sig)
+            if canonical:
+                self.process_syndicated_document(doc, canonical, similarity)
+            else:
+                self.process_document(doc)
 
             # only add a document if it has sources or utterances
             if doc.sources or doc.utterances:
-                db.session.add(doc)
-                db.session.commit()
+                fingerprint = DocumentFingerprint()
+                fingerprint.published_at = doc.published_at
+                fingerprint.signature = sig
+                doc.fingerprint = fingerprint
+
+                with self.metrics.timer('commit'):
+                    db.session.add(doc)
+                    db.session.commit()
+                self.syndication.add(doc.id, doc.published_at, sig)
                 self.log.info("Successfully processed feed item: %s as document %d" % (url, doc.id))
+                self.metrics.count('syndicated' if canonical else 'processed')
                 return doc
             else:
                 db.session.rollback()
                 self.log.info("Document has no sources or utterances, ignoring: %s" % url)
+                self.metrics.count('no_sources')
                 return None
 
         except:
             db.session.rollback()
+            self.metrics.count('error')
             raise
 
-    def fetch_filtered_daily_feeds(self, day, filter_parm):
-        """ Fetch the feed for +day+ and returns an ElementTree instance. """
-        # import xml.etree.ElementTree as ET
-
-        from xml.etree import ElementTree
-        from htmlentitydefs import name2codepoint
-
-        if self.FEED_PASSWORD is None:
-            raise ValueError("%s.FEED_PASSWORD must be set." % self.__class__.__name__)
-
-        r = requests.get(self.FEED_FILTER_URL % (day.strftime('%d-%m-%Y'), filter_parm),
-                         auth=(self.FEED_USER, self.FEED_PASSWORD),
-                         verify=False,
-                         timeout=60)
-
-        r.raise_for_status()
-
-        parser = ElementTree.XMLParser()
-        parser.parser.UseForeignDTD(True)
-        parser.entity.update((x, unichr(i)) for x, i in name2codepoint.iteritems())
-        etree = ElementTree
-
-        return etree.fromstring(r.text.encode('utf-8'), parser=parser)
-
-    def fetch_daily_feeds(self, day):
-        """ Fetch the feed for +day+ and returns an ElementTree instance. """
-        # import xml.etree.ElementTree as ET
-
-        from xml.etree import ElementTree
-        from htmlentitydefs import name2codepoint
-
-        if self.FEED_PASSWORD is None:
-            raise ValueError("%s.FEED_PASSWORD must be set." % self.__class__.__name__)
-
-        r = requests.get(self.FEED_URL % day.strftime('%d-%m-%Y'),
-                         auth=(self.FEED_USER, self.FEED_PASSWORD),
-                         verify=False,
-                         timeout=60)
-
-        r.raise_for_status()
-
-        parser = ElementTree.XMLParser()
-        parser.parser.UseForeignDTD(True)
-        parser.entity.update((x, unichr(i)) for x, i in name2codepoint.iteritems())
-        etree = ElementTree
-
-        return etree.fromstring(r.text.encode('utf-8'), parser=parser)
+        finally:
+            self.metrics.flush()
 
     def backfill_taxonomies(self):
         """ Backfill taxonomies for articles.
@@ -1,7 +1,7 @@
-import requests
 import json
 
 from .base import BaseExtractor
+from ..fetcher import Fetcher
 from ...models import DocumentEntity, Entity, Utterance, DocumentTaxonomy
 
 import logging
@@ -39,7 +39,7 @@ class CalaisExtractor(BaseExtractor):
                 if 'name' not in ent or len(ent['name']) < 2:
                     continue
 
-                e = Entity.get_or_create(group, ent['name'])
+                e = self.get_entity(group, ent['name'])
 
                 de = DocumentEntity()
                 de.entity = e
@@ -65,7 +65,7 @@ class CalaisExtractor(BaseExtractor):
                 u.length = quote['instances'][0]['length']
 
             # uttering entity
-            u.entity = Entity.get_or_create(
+            u.entity = self.get_entity(
                 self.normalise_name(quote['speaker']['_type']),
                 quote['speaker']['name'])
 
@@ -74,6 +74,9 @@ class CalaisExtractor(BaseExtractor):
 
         log.info("Added %d utterances for %s" % (utterances_added, doc))
 
+    def get_entity(self, group, name):
+        return Entity.get_or_create(group, name)
+
     def extract_topics(self, doc, calais):
         added = 0
 
@@ -94,7 +97,7 @@ class CalaisExtractor(BaseExtractor):
             if not self.API_KEY:
                 raise ValueError('%s.%s.API_KEY must be defined.' % (self.__module__, self.__class__.__name__))
 
-            res = requests.post(
+            res = Fetcher.shared().post(
                 'https://api.thomsonreuters.com/permid/calais',
                 doc.text.encode('utf-8'),
                 headers={
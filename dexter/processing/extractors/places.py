@@ -32,7 +32,7 @@ class PlacesExtractor(BaseExtractor):
             if de.entity.person:
                 continue
 
-            place = Place.find(de.entity.name)
+            place = self.find_place(de.entity.name)
 
             if place:
                 dp = DocumentPlace()
@@ -52,3 +52,6 @@ class PlacesExtractor(BaseExtractor):
                     dp.relevant = True
 
         self.log.info("Added %d places for %s" % (places_added, doc))
+
+    def find_place(self, name):
+        return Place.find(name)
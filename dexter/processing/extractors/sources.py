@@ -30,7 +30,7 @@ class SourcesExtractor(BaseExtractor):
 
         tomatch = set(u.entity for u in doc.utterances if not u.entity.person)
         if tomatch:
-            people = Person.query.all()
+            people = self.all_people()
             people_by_name = {p.name: p for p in people}
 
             # we could already have found matching people during this loop,
@@ -67,6 +67,9 @@ class SourcesExtractor(BaseExtractor):
 
         self.log.info("Matched %s entities to people" % count)
 
+    def all_people(self):
+        return Person.query.all()
+
     def clean_name(self, name):
         return self.NAME_DIRTY_RE.sub('', name)
 
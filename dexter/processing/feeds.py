@@ -0,0 +1,90 @@
+"""
+Streaming parser for the Newstools daily feed.
+"""
+
+from htmlentitydefs import name2codepoint
+from StringIO import StringIO
+from xml.etree import ElementTree
+
+# the feed uses HTML entities without declaring them
+FEED_ENTITIES = dict((name, unichr(i)) for name, i in name2codepoint.iteritems())
+
+
+def parse_feed_items(stream):
+    """ Parse feed XML from a file-like +stream+ and yield a dict for each item
+    as soon as it has been read, discarding it afterwards so that memory use
+    doesn't grow with the size of the feed.
+
+    An item looks like this:
+
+        <item>
+           <url>http://citizen.co.za/afp_feed_article/yankees-pay-tribute-to-retiring-captain-jeter</url>
+           <publisher>Citizen</publisher>
+           <contenttype>news</contenttype>
+           <contenttypeverified>false</contenttypeverified>
+           <publishdate>2014-09-07 23:51:00</publishdate>
+           <crawldate>2014-09-08 00:03:47</crawldate>
+           <title>Yankees pay tribute to retiring captain Jeter</title>
+           <author>Unknown</author>
+           <text>https://www.newstools.co.za/data/texts/SFM-7IVZ63RG1MZ2XZF4OTTC.txt</text>
+        </item>
+    """
+    parser = ElementTree.XMLParser()
+    parser.parser.UseForeignDTD(True)
+    parser.entity = FEED_ENTITIES
+
+    channel = None
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end'), parser=parser):
+        if event == 'start':
+            if elem.tag == 'channel':
+                channel = elem
+            continue
+
+        if elem.tag == 'item':
+            yield {
+                'url': elem.find('url').text,
+                'publishdate': elem.find('publishdate').text,
+                'title': elem.find('title').text,
+                'author': elem.find('author').text,
+                'text_url': elem.find('text').text,
+            }
+
+            # we're done with this item
+            elem.clear()
+            if channel is not None:
+                channel.clear()
+
+
+def response_stream(r, chunk_size=64 * 1024):
+    """ A file-like object for reading the decoded body of a response, which
+    reads the body as it arrives if it hasn't been read already.
+
+    As with `r.text`, the body is decoded with the charset the server gives
+    and re-encoded as UTF-8, which is what the feed's XML declaration says it
+    is. A streamed body without a charset is passed on as it is, since
+    guessing its encoding would mean reading all of it first.
+    """
+    if r._content_consumed or r._content:
+        return StringIO(r.text.encode('utf-8'))
+
+    chunks = r.iter_content(chunk_size, decode_unicode=True)
+    return _ChunkReader(c.encode('utf-8') if isinstance(c, unicode) else c for c in chunks)
+
+
+class _ChunkReader(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
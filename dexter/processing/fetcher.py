@@ -0,0 +1,256 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from requests.structures import CaseInsensitiveDict
+
+
+class HostStats(object):
+    """ Latency and error counts for requests to a single host. """
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, duration):
+        self.requests += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'cache_hits': self.cache_hits,
+            'latency_avg': self.total_time / self.requests if self.requests else 0.0,
+            'latency_max': self.max_time,
+        }
+
+
+class Fetcher(object):
+    """
+    Fetches URLs over HTTP for crawlers and extractors.
+
+    - keeps a pooled, keep-alive session for each host
+    - retries connection errors, timeouts and 429 and 5xx responses,
+      backing off exponentially with jitter
+    - limits the number of concurrent requests to each host, and
+      waits at least `min_interval` seconds between requests to a host
+    - optionally caches GET responses on disk and re-validates
+      them with their ETag and Last-Modified headers
+    - tracks latency and errors per host, see `stats`
+
+    Use `Fetcher.shared()` to get the fetcher shared by the process.
+
+        >>> r = Fetcher.shared().get('http://mg.co.za/')
+        >>> r.raise_for_status()
+    """
+    log = logging.getLogger(__name__)
+
+    # directory to cache responses in, or None to disable caching
+    CACHE_DIR = None
+
+    # the longest a server's Retry-After can make us wait, in seconds
+    MAX_RETRY_AFTER = 120
+
+    RETRY_STATUSES = set([429, 500, 502, 503, 504])
+
+    # the fetcher shared by this process, see `shared`
+    _shared = None
+
+    def __init__(self, cache_dir=None, timeout=30, max_retries=3, backoff=1.0,
+                 max_per_host=4, min_interval=0.0, max_retry_after=MAX_RETRY_AFTER):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.max_retry_after = max_retry_after
+
+        self.sessions = {}
+        self.slots = {}
+        self.last_request = {}
+        self.stats = defaultdict(HostStats)
+        self.lock = threading.Lock()
+
+        if self.cache_dir and not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls(cache_dir=cls.CACHE_DIR, max_retry_after=cls.MAX_RETRY_AFTER)
+        return cls._shared
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def request(self, method, url, cache=True, **kwargs):
+        """ Make a request and return the response, retrying temporary errors.
+        Keyword arguments are passed to `requests.Session.request`, and `timeout`
+        defaults to the fetcher's timeout. Set +cache+ to False to ignore the
+        cache for this request.
+        """
+        host = urlparse(url).netloc.lower()
+        stats = self.stats[host]
+        kwargs.setdefault('timeout', self.timeout)
+
+        cached = None
+        # streamed responses aren't cached, since caching them would read them
+        cache = cache and self.cache_dir and method == 'GET' and not kwargs.get('stream')
+
+        if cache:
+            cached = self.load_cached(url)
+            if cached:
+                headers = dict(kwargs.get('headers') or {})
+                if cached.headers.get('etag'):
+                    headers['If-None-Match'] = cached.headers['etag']
+                if cached.headers.get('last-modified'):
+                    headers['If-Modified-Since'] = cached.headers['last-modified']
+                kwargs['headers'] = headers
+
+        attempt = 0
+        while True:
+            start = time.time()
+            try:
+                with self.slot(host):
+                    r = self.session(host).request(method, url, **kwargs)
+            except (ConnectionError, Timeout) as e:
+                stats.record(time.time() - start)
+                stats.errors += 1
+                if attempt >= self.max_retries:
+                    raise
+                self.log.warn("Error fetching %s, retrying: %s" % (url, e))
+                delay = None
+            else:
+                stats.record(time.time() - start)
+                if r.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    break
+                stats.errors += 1
+                self.log.warn("Got %s for %s, retrying" % (r.status_code, url))
+                delay = r.headers.get('retry-after')
+
+            stats.retries += 1
+            time.sleep(self.retry_delay(attempt, delay))
+            attempt += 1
+
+        if r.status_code >= 400:
+            stats.errors += 1
+
+        if cached and r.status_code == 304:
+            stats.cache_hits += 1
+            return cached
+
+        if cache and r.status_code == 200 and (r.headers.get('etag') or r.headers.get('last-modified')):
+            self.store_cached(url, r)
+
+        return r
+
+    def retry_delay(self, attempt, retry_after=None):
+        """ Seconds to wait before retrying after +attempt+ attempts. A server's
+        +retry_after+ is capped, so that it can't stall a worker for hours. """
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), self.max_retry_after)
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def session(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.sessions[host] = session
+            return session
+
+    def slot(self, host):
+        """ A context manager that holds one of the host's request slots,
+        waiting for one to become available and for the minimum interval
+        between requests to pass. """
+        return _HostSlot(self, host)
+
+    def metrics(self):
+        """ A dict from host names to dicts of latency and error metrics. """
+        return dict((host, stats.as_dict()) for host, stats in self.stats.iteritems())
+
+    def cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.md5(url).hexdigest() + '.json')
+
+    def load_cached(self, url):
+        """ Load a cached response for +url+, or None. """
+        path = self.cache_path(url)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                info = json.load(f)
+        except (IOError, ValueError) as e:
+            self.log.warn("Ignoring bad cache entry for %s: %s" % (url, e))
+            return None
+
+        r = requests.Response()
+        r.url = info['url']
+        r.status_code = 200
+        r.headers = CaseInsensitiveDict(info['headers'])
+        r.encoding = info['encoding']
+        r._content = base64.b64decode(info['content'])
+        return r
+
+    def store_cached(self, url, r):
+        path = self.cache_path(url)
+        tmp = '%s.%s' % (path, os.getpid())
+
+        with open(tmp, 'w') as f:
+            json.dump({
+                'url': r.url,
+                'headers': dict(r.headers),
+                'encoding': r.encoding,
+                'content': base64.b64encode(r.content),
+            }, f)
+        os.rename(tmp, path)
+
+
+class _HostSlot(object):
+    def __init__(self, fetcher, host):
+        self.fetcher = fetcher
+        self.host = host
+
+    def __enter__(self):
+        fetcher = self.fetcher
+
+        with fetcher.lock:
+            slots = fetcher.slots.get(self.host)
+            if slots is None:
+                slots = fetcher.slots[self.host] = threading.BoundedSemaphore(fetcher.max_per_host)
+        slots.acquire()
+        self.slots = slots
+
+        if fetcher.min_interval:
+            with fetcher.lock:
+                wait = fetcher.last_request.get(self.host, 0) + fetcher.min_interval - time.time()
+                fetcher.last_request[self.host] = time.time() + max(wait, 0)
+            if wait > 0:
+                time.sleep(wait)
+
+    def __exit__(self, *args):
+        self.slots.release()
@@ -0,0 +1,246 @@
+"""
+Timings and outcome counts for document ingestion, exposed to Prometheus.
+
+Each process records into its own `IngestionMetrics` instance, see
+`IngestionMetrics.shared()`. If `IngestionMetrics.SPOOL_DIR` is set, each
+process periodically writes a snapshot of its metrics into that directory,
+and `IngestionMetrics.collect` adds up the snapshots of all the processes
+on the machine, such as Celery workers, for the /metrics endpoint.
+
+Collecting also removes the snapshots of processes on this machine that have
+exited, and snapshots from anywhere that haven't been written to for
+`SPOOL_MAX_AGE` seconds, so that worker restarts don't fill the directory.
+Their counts then drop out of the totals, which Prometheus treats as a
+counter reset.
+
+    >>> metrics = IngestionMetrics.shared()
+    >>> with metrics.timer('normalise'):
+    ...     normalise(doc)
+    >>> metrics.count('processed')
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+INF = float('inf')
+
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, INF)
+
+
+class Histogram(object):
+    """ Counts of observed durations that fall into each bucket. """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # non-cumulative count for each bucket
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        """ List of (upper bound, count of observations <= upper bound) tuples. """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    def as_dict(self):
+        return {'counts': self.counts, 'sum': self.sum}
+
+    @classmethod
+    def from_dict(cls, info):
+        h = cls()
+        h.counts = list(info['counts'])
+        h.sum = info['sum']
+        return h
+
+
+class IngestionMetrics(object):
+    """ Per-stage timings and per-outcome counts for ingestion in this process. """
+    log = logging.getLogger(__name__)
+
+    # directory that processes write snapshots into, or None to keep them in-process
+    SPOOL_DIR = None
+
+    # snapshots that haven't been written for this long are removed, in seconds
+    SPOOL_MAX_AGE = 7 * 24 * 60 * 60
+
+    # the metrics for this process, see `shared`
+    _shared = None
+
+    def __init__(self, spool_dir=None, flush_interval=10):
+        self.spool_dir = spool_dir
+        self.flush_interval = flush_interval
+
+        self.stages = defaultdict(Histogram)
+        self.outcomes = defaultdict(int)
+        self.last_flush = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None or cls._shared.pid != os.getpid():
+            # don't share with processes we were forked into
+            cls._shared = cls(spool_dir=cls.SPOOL_DIR)
+        return cls._shared
+
+    @contextmanager
+    def timer(self, stage):
+        """ Time the body of the with-statement as +stage+. """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - start)
+
+    def observe(self, stage, duration):
+        with self.lock:
+            self.stages[stage].observe(duration)
+
+    def count(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'stages': dict((k, h.as_dict()) for k, h in self.stages.iteritems()),
+                'outcomes': dict(self.outcomes),
+            }
+
+    def merge(self, snapshot):
+        """ Add the metrics in a snapshot to these metrics. """
+        with self.lock:
+            for stage, info in snapshot['stages'].iteritems():
+                self.stages[stage].merge(Histogram.from_dict(info))
+            for outcome, count in snapshot['outcomes'].iteritems():
+                self.outcomes[outcome] += count
+
+    @property
+    def spool_path(self):
+        return os.path.join(self.spool_dir, '%s-%d.json' % (socket.gethostname(), os.getpid()))
+
+    def flush(self, force=False):
+        """ Write a snapshot to the spool directory, if there is one and
+        we haven't done so in the last `flush_interval` seconds. """
+        if not self.spool_dir or (not force and time.time() - self.last_flush < self.flush_interval):
+            return
+
+        self.last_flush = time.time()
+        try:
+            if not os.path.exists(self.spool_dir):
+                os.makedirs(self.spool_dir)
+
+            path = self.spool_path
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            # metrics must never break ingestion
+            self.log.warn("Couldn't write ingestion metrics: %s" % e)
+
+    @classmethod
+    def collect(cls, spool_dir=None):
+        """ Metrics for all processes that have written snapshots into
+        +spool_dir+, or for just this process if there's no spool directory. """
+        spool_dir = spool_dir or cls.SPOOL_DIR
+        if not spool_dir:
+            return cls.shared()
+
+        metrics = cls()
+        if os.path.exists(spool_dir):
+            for fname in sorted(os.listdir(spool_dir)):
+                if not fname.endswith('.json'):
+                    continue
+
+                path = os.path.join(spool_dir, fname)
+                if cls.is_stale(path):
+                    cls.log.info("Removing metrics snapshot of a finished process: %s" % fname)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        # another process removed it first
+                        pass
+                    continue
+
+                try:
+                    with open(path) as f:
+                        metrics.merge(json.load(f))
+                except (IOError, ValueError, KeyError) as e:
+                    cls.log.warn("Ignoring bad metrics snapshot %s: %s" % (fname, e))
+
+        return metrics
+
+    @classmethod
+    def is_stale(cls, path):
+        """ Is the snapshot at +path+ from a process on this machine that has
+        exited, or one that hasn't been written for `SPOOL_MAX_AGE` seconds? """
+        try:
+            if time.time() - os.path.getmtime(path) > cls.SPOOL_MAX_AGE:
+                return True
+        except OSError:
+            return False
+
+        host, _, pid = os.path.basename(path)[:-len('.json')].rpartition('-')
+        if host != socket.gethostname() or not pid.isdigit():
+            # we can't tell if processes elsewhere are running
+            return False
+
+        return not process_running(int(pid))
+
+    def to_prometheus(self):
+        """ These metrics in the Prometheus text exposition format. """
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP dexter_ingestion_stage_seconds Time taken by each stage of ingesting a document.',
+            '# TYPE dexter_ingestion_stage_seconds histogram',
+        ]
+
+        for stage in sorted(snapshot['stages']):
+            h = Histogram.from_dict(snapshot['stages'][stage])
+            for bound, count in h.cumulative():
+                le = '+Inf' if bound == INF else repr(float(bound))
+                lines.append('dexter_ingestion_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, le, count))
+            lines.append('dexter_ingestion_stage_seconds_sum{stage="%s"} %r' % (stage, h.sum))
+            lines.append('dexter_ingestion_stage_seconds_count{stage="%s"} %d' % (stage, h.count))
+
+        lines.extend([
+            '# HELP dexter_ingestion_items_total Feed items ingested, by outcome.',
+            '# TYPE dexter_ingestion_items_total counter',
+        ])
+        for outcome, count in sorted(snapshot['outcomes'].iteritems()):
+            lines.append('dexter_ingestion_items_total{outcome="%s"} %d' % (outcome, count))
+
+        return '\n'.join(lines) + '\n'
+
+
+def process_running(pid):
+    """ Is there a process on this machine with id +pid+? """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # it exists, but belongs to someone else
+        return e.errno == errno.EPERM
+    return True
@@ -0,0 +1,316 @@
+"""
+Re-run extractors over stored documents, such as after an extractor has
+been improved.
+
+Documents are read in batches in order of id, and each batch is re-extracted
+and committed by a process in a pool. OpenCalais extractions use the cached
+`raw_calais` of each document, so only documents that have it are included
+when a Calais aspect is chosen, and no API calls are made.
+
+Like adding a document, re-extraction only adds what's missing, so
+analysts' changes to a document are kept. Taxonomies are the exception:
+they're replaced if the OpenCalais topics differ.
+
+After each batch the id of the last document is written to a checkpoint
+file, so that an interrupted run can be resumed. In a dry run, nothing is
+written and the report shows what would have changed.
+
+    >>> engine = ReextractionEngine(['places', 'sources'], dry_run=True)
+    >>> engine.run()
+    >>> print engine.format_report()
+"""
+
+from __future__ import division
+
+import json
+import logging
+import os
+import time
+from collections import Counter, deque
+from multiprocessing import Pool, cpu_count
+
+from sqlalchemy.orm import subqueryload
+
+from ..models import db, Document
+from .bulk_import import BulkCalaisExtractor, BulkSourcesExtractor, BulkPlacesExtractor
+from .extractors import CalaisExtractor
+
+
+# aspect -> the document collections it changes, in the order they must be run
+ASPECTS = [
+    ('entities', ['entities', 'utterances']),
+    ('taxonomies', ['taxonomies']),
+    ('sources', ['utterances', 'sources']),
+    ('places', ['entities', 'places']),
+]
+ASPECT_NAMES = [a for a, _ in ASPECTS]
+
+# aspects that need OpenCalais results
+CALAIS_ASPECTS = set(['entities', 'taxonomies'])
+
+
+class Reextractor(object):
+    """ Re-extracts aspects of a batch of documents in this process. """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, aspects):
+        self.aspects = [a for a in ASPECT_NAMES if a in aspects]
+        self.calais = BulkCalaisExtractor()
+        self.sources = BulkSourcesExtractor()
+        self.places = BulkPlacesExtractor()
+
+    def reextract_batch(self, doc_ids, dry_run=False):
+        """ Re-extract the documents with +doc_ids+ and commit, or roll
+        back if +dry_run+ is True. Returns a dict of counts of changes. """
+        collections = set()
+        for aspect, names in ASPECTS:
+            if aspect in self.aspects:
+                collections.update(names)
+
+        query = Document.query.filter(Document.id.in_(doc_ids)).order_by(Document.id)
+        for name in collections:
+            query = query.options(subqueryload(name))
+        docs = query.all()
+
+        result = {
+            'documents': len(docs),
+            'changed': [],
+            'changes': Counter(),
+        }
+
+        try:
+            with db.session.no_autoflush:
+                calais = {}
+                if CALAIS_ASPECTS.intersection(self.aspects):
+                    calais = dict((doc.id, CalaisExtractor.fetch_data(self.calais, doc)) for doc in docs)
+                    if 'entities' in self.aspects:
+                        self.calais.resolve_entities(calais.itervalues())
+
+                for doc in docs:
+                    changes = self.reextract(doc, calais.get(doc.id))
+                    if changes:
+                        result['changed'].append(doc.id)
+                        result['changes'].update(changes)
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+
+        return result
+
+    def reextract(self, doc, calais=None):
+        """ Re-extract the chosen aspects of +doc+, and return a Counter
+        of the number of items added and removed. """
+        changes = Counter()
+
+        for aspect in self.aspects:
+            if aspect == 'taxonomies':
+                changes.update(self.reextract_taxonomies(doc, calais))
+                continue
+
+            names = dict(ASPECTS)[aspect]
+            before = dict((n, len(getattr(doc, n))) for n in names)
+
+            if aspect == 'entities':
+                self.calais.extract_entities(doc, calais)
+                self.calais.extract_utterances(doc, calais)
+            elif aspect == 'sources':
+                self.sources.extract(doc)
+            elif aspect == 'places':
+                self.places.extract(doc)
+
+            for n in names:
+                added = len(getattr(doc, n)) - before[n]
+                if added > 0:
+                    changes['%s.added' % n] += added
+
+        return changes
+
+    def reextract_taxonomies(self, doc, calais):
+        changes = Counter()
+
+        topics = set()
+        for topicpairs in calais.get('topics', {}).itervalues():
+            for topic in topicpairs.itervalues():
+                topics.add((topic['name'].replace('_', ' '), topic['score']))
+
+        existing = set((dt.label, dt.score) for dt in doc.taxonomies)
+        if topics != existing:
+            for dt in list(doc.taxonomies):
+                doc.taxonomies.remove(dt)
+                db.session.delete(dt)
+            self.calais.extract_topics(doc, calais)
+            changes['taxonomies.removed'] += len(existing - topics)
+            changes['taxonomies.added'] += len(topics - existing)
+
+        return changes
+
+
+def init_worker():
+    """ Give each worker process its own app context. """
+    from dexter.app import app
+    app.app_context().push()
+
+
+def reextract_batch(args):
+    """ Re-extract a batch in a worker process. """
+    doc_ids, aspects, dry_run = args
+    try:
+        result = Reextractor(aspects).reextract_batch(doc_ids, dry_run=dry_run)
+    except Exception as e:
+        logging.getLogger(__name__).error("Error re-extracting documents %d to %d: %s" % (doc_ids[0], doc_ids[-1], e), exc_info=e)
+        result = {'documents': len(doc_ids), 'changed': [], 'changes': Counter(), 'error': str(e)}
+    finally:
+        db.session.remove()
+
+    result['last_id'] = doc_ids[-1]
+    return result
+
+
+class ReextractionEngine(object):
+    """
+    Re-extracts +aspects+ of all documents with ids in the range +min_id+
+    to +max_id+, using a pool of +workers+ processes.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, aspects, dry_run=False, batch_size=100, workers=None, checkpoint=None, min_id=None, max_id=None):
+        unknown = set(aspects) - set(ASPECT_NAMES)
+        if unknown:
+            raise ValueError("Unknown aspects: %s" % ', '.join(sorted(unknown)))
+
+        self.aspects = [a for a in ASPECT_NAMES if a in aspects]
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.min_id = min_id
+        self.max_id = max_id
+
+        self.counts = Counter()
+        self.changes = Counter()
+        # ids of some changed documents, for a dry run report
+        self.changed = []
+        self.elapsed = 0.0
+        self.resumed_from = None
+
+    def run(self):
+        start = time.time()
+        last_id = self.read_checkpoint()
+        if last_id is not None:
+            self.resumed_from = last_id
+        elif self.min_id is not None:
+            last_id = self.min_id - 1
+
+        # don't share database connections with the workers
+        db.session.remove()
+        db.engine.dispose()
+
+        pool = Pool(self.workers, initializer=init_worker)
+        # keep a couple of batches queued for each worker, and finish
+        # batches in order so that the checkpoint is always safe
+        queue_size = 2 * (self.workers or cpu_count())
+        try:
+            pending = deque()
+            exhausted = False
+            while pending or not exhausted:
+                if not exhausted and len(pending) < queue_size:
+                    doc_ids = self.next_document_ids(last_id)
+                    if doc_ids:
+                        last_id = doc_ids[-1]
+                        pending.append(pool.apply_async(reextract_batch, [(doc_ids, self.aspects, self.dry_run)]))
+                    else:
+                        exhausted = True
+                    continue
+
+                self.finish_batch(pending.popleft().get())
+                self.log_progress(start)
+        finally:
+            pool.terminate()
+            self.elapsed = time.time() - start
+
+    def next_document_ids(self, last_id=None):
+        """ The ids of the next batch of documents after +last_id+. """
+        query = db.session.query(Document.id).order_by(Document.id).limit(self.batch_size)
+        if last_id is not None:
+            query = query.filter(Document.id > last_id)
+        if self.max_id is not None:
+            query = query.filter(Document.id <= self.max_id)
+        if CALAIS_ASPECTS.intersection(self.aspects):
+            query = query.filter(Document.raw_calais != None)  # noqa
+
+        ids = [r[0] for r in query]
+        # don't hold a transaction open between batches
+        db.session.rollback()
+        return ids
+
+    def finish_batch(self, result):
+        self.counts['batches'] += 1
+        self.counts['documents'] += result['documents']
+        self.counts['changed'] += len(result['changed'])
+        self.changes.update(result['changes'])
+        self.changed.extend(result['changed'][:100 - len(self.changed)])
+
+        if 'error' in result:
+            self.counts['failed_batches'] += 1
+        elif not self.dry_run and not self.counts['failed_batches']:
+            # resuming must retry failed batches
+            self.write_checkpoint(result['last_id'])
+
+    def read_checkpoint(self):
+        """ The id of the last document that was re-extracted, or None. """
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as f:
+                return json.load(f)['last_id']
+
+    def write_checkpoint(self, last_id):
+        if not self.checkpoint:
+            return
+
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'last_id': last_id, 'aspects': self.aspects}, f)
+        os.rename(tmp, self.checkpoint)
+
+    def log_progress(self, start):
+        elapsed = time.time() - start
+        self.log.info("Re-extracted %d documents in %.1fs, %.1f documents/sec, %d changed" % (
+            self.counts['documents'], elapsed,
+            self.counts['documents'] / elapsed if elapsed else 0.0,
+            self.counts['changed']))
+
+    def report(self):
+        return {
+            'aspects': self.aspects,
+            'dry_run': self.dry_run,
+            'resumed_from': self.resumed_from,
+            'documents': self.counts['documents'],
+            'changed': self.counts['changed'],
+            'failed_batches': self.counts['failed_batches'],
+            'elapsed': self.elapsed,
+            'docs_per_sec': self.counts['documents'] / self.elapsed if self.elapsed else 0.0,
+            'changes': dict(self.changes),
+            'changed_ids': self.changed,
+        }
+
+    def format_report(self):
+        report = self.report()
+        lines = [
+            "%s %s for %d documents in %.1fs (%.2f documents/sec)" % (
+                "Would re-extract" if report['dry_run'] else "Re-extracted",
+                ', '.join(report['aspects']), report['documents'], report['elapsed'], report['docs_per_sec']),
+            "%d documents %s" % (report['changed'], "would change" if report['dry_run'] else "changed"),
+        ]
+        if report['resumed_from'] is not None:
+            lines.append("Resumed after document %d" % report['resumed_from'])
+        if report['failed_batches']:
+            lines.append("%d batches failed, see the log" % report['failed_batches'])
+        for change, count in sorted(report['changes'].iteritems()):
+            lines.append("  %-20s %8d" % (change, count))
+        if report['dry_run'] and report['changed_ids']:
+            lines.append("Changed documents include: %s" % ', '.join(str(i) for i in report['changed_ids'][:20]))
+        return '\n'.join(lines)
@@ -0,0 +1,242 @@
+"""
+Record and replay the HTTP traffic of document ingestion, so that ingestion
+can be run and benchmarked repeatably without calling Newstools and OpenCalais.
+
+Recording uses a `RecordingFetcher` in place of the shared `Fetcher`, which saves
+every response into a `FixtureBundle` on disk. Replaying starts a local
+`ReplayServer` that serves the bundle's responses with a configurable latency,
+and uses a `ReplayFetcher` that sends every request to that server.
+
+    >>> bundle = FixtureBundle('fixtures/2014-09-07')
+    >>> with recording(bundle):
+    ...     process_some_items()
+    >>> with replaying(bundle, latency=0.1):
+    ...     process_some_items()
+
+`record_feed_item` makes the requests for a feed item without storing it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urlparse import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from .fetcher import Fetcher
+
+log = logging.getLogger(__name__)
+
+# headers that don't make sense to replay
+SKIP_HEADERS = set(['content-length', 'content-encoding', 'transfer-encoding', 'connection', 'keep-alive'])
+
+
+def request_key(method, url, data=None):
+    """ A key that identifies a request by its method, URL and body. """
+    m = hashlib.md5()
+    m.update(method.upper())
+    m.update(' ')
+    m.update(url.encode('utf-8') if isinstance(url, unicode) else url)
+    if data:
+        m.update('\n')
+        m.update(data.encode('utf-8') if isinstance(data, unicode) else data)
+    return m.hexdigest()
+
+
+class FixtureBundle(object):
+    """ A directory of recorded responses, with an index.json
+    file describing them and a file with the body of each. """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def add(self, method, url, data, response):
+        key = request_key(method, url, data)
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, key), 'wb') as f:
+            f.write(response.content)
+
+        self.index[key] = {
+            'method': method.upper(),
+            'url': url,
+            'host': urlparse(url).netloc.lower(),
+            'status': response.status_code,
+            'headers': dict((k, v) for k, v in response.headers.iteritems() if k.lower() not in SKIP_HEADERS),
+        }
+        self.save()
+
+    def get(self, key):
+        """ Get the (info, content) tuple for a key, or (None, None). """
+        info = self.index.get(key)
+        if info is None:
+            return None, None
+
+        with open(os.path.join(self.path, key), 'rb') as f:
+            return info, f.read()
+
+    def save(self):
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.index_path)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class RecordingFetcher(Fetcher):
+    """ A fetcher that records every response into a bundle. """
+    def __init__(self, bundle, **kwargs):
+        super(RecordingFetcher, self).__init__(**kwargs)
+        self.bundle = bundle
+        self.bundle_lock = threading.Lock()
+
+    def request(self, method, url, cache=True, **kwargs):
+        r = super(RecordingFetcher, self).request(method, url, cache=False, **kwargs)
+        with self.bundle_lock:
+            self.bundle.add(method, url, kwargs.get('data'), r)
+        return r
+
+
+class ReplayFetcher(Fetcher):
+    """ A fetcher that sends all requests to a `ReplayServer`. """
+    def __init__(self, server, **kwargs):
+        kwargs.setdefault('max_retries', 0)
+        super(ReplayFetcher, self).__init__(**kwargs)
+        self.server = server
+
+    def request(self, method, url, cache=True, **kwargs):
+        replay_url = '%s/replay/%s' % (self.server.url, request_key(method, url, kwargs.get('data')))
+        return super(ReplayFetcher, self).request(method, replay_url, cache=False, **kwargs)
+
+
+class ReplayServer(object):
+    """ A local HTTP server that serves the responses in a bundle.
+
+    Each response is delayed by +latency+ seconds, or by the latency given
+    for the response's original host in the +host_latency+ dict. Requests
+    that weren't recorded get a 404.
+    """
+    def __init__(self, bundle, latency=0.0, host_latency=None, port=0):
+        self.bundle = bundle
+        self.latency = latency
+        self.host_latency = host_latency or {}
+        self.port = port
+        self.httpd = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def start(self):
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', self.port), _ReplayHandler)
+        self.httpd.replay = self
+
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        log.info("Replaying %d responses at %s" % (len(self.bundle), self.url))
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        replay = self.server.replay
+
+        # consume any request body
+        length = int(self.headers.getheader('content-length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        info, content = replay.bundle.get(self.path.rsplit('/', 1)[-1])
+        if info is None:
+            info, content = {'status': 404, 'headers': {}, 'host': None}, 'Not recorded'
+
+        time.sleep(replay.host_latency.get(info['host'], replay.latency))
+
+        self.send_response(info['status'])
+        for k, v in info['headers'].iteritems():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+def record_feed_item(processor, item):
+    """ Make the requests that ingesting the feed item +item+ with +processor+
+    would make, so that they can be recorded, without storing anything.
+
+    Unlike `DocumentProcessorNT.process_feed_item`, this doesn't skip
+    items whose documents are already in the database.
+    """
+    from ..models import db
+    from .extractors import CalaisExtractor
+
+    try:
+        url = item['url'] = processor.canonicalise_url(item['url'])
+        if not url or not processor.newstools_crawler.offer(url):
+            return
+
+        doc = processor.newstools_crawler.crawl(item)
+        if doc.text and 'the' in doc.text:
+            # the request body is the normalised text, as when processing
+            doc.normalise_text()
+            CalaisExtractor().fetch_data(doc)
+    finally:
+        # crawling can add authors
+        db.session.rollback()
+
+
+@contextmanager
+def recording(bundle):
+    """ Record all requests made through the shared fetcher into +bundle+. """
+    original = Fetcher._shared
+    Fetcher._shared = RecordingFetcher(bundle)
+    try:
+        yield Fetcher._shared
+    finally:
+        Fetcher._shared = original
+
+
+@contextmanager
+def replaying(bundle, latency=0.0, host_latency=None):
+    """ Replay all requests made through the shared fetcher from +bundle+. """
+    server = ReplayServer(bundle, latency, host_latency)
+    server.start()
+
+    original = Fetcher._shared
+    Fetcher._shared = ReplayFetcher(server)
+    try:
+        yield Fetcher._shared
+    finally:
+        Fetcher._shared = original
+        server.stop()
@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime, timedelta
+
+from ..minhash import MinHasher, LSHIndex, shingles, similarity
+from ..models import db, DocumentFingerprint
+
+
+class SyndicationIndex(object):
+    """
+    An in-memory index of the fingerprints of recently published documents,
+    used to find near-duplicates of a new document before we extract anything
+    from it.
+
+    The fingerprints are stored in the database, so that all workers can share
+    them. Each worker process keeps its own index, which it tops up with new
+    fingerprints from the database before each lookup and from which it drops
+    documents published before the sliding window.
+    """
+    log = logging.getLogger(__name__)
+
+    NUM_PERM = 64
+    SHINGLE_SIZE = 3
+
+    # the index shared by processors in this process, see `shared`
+    _shared = None
+
+    def __init__(self, window=timedelta(days=7), threshold=0.85):
+        self.window = window
+        self.threshold = threshold
+
+        self.hasher = MinHasher(self.NUM_PERM)
+        self.index = LSHIndex(threshold, self.NUM_PERM)
+        # doc_id -> (published_at, signature)
+        self.entries = {}
+        # id of the last fingerprint loaded from the database
+        self.last_id = 0
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def signature(self, text):
+        return self.hasher.signature(shingles(text, self.SHINGLE_SIZE))
+
+    def refresh(self):
+        """ Load fingerprints added since we last looked, and forget those
+        that have fallen out of the window. """
+        cutoff = datetime.utcnow() - self.window
+
+        rows = db.session.query(
+            DocumentFingerprint.id,
+            DocumentFingerprint.doc_id,
+            DocumentFingerprint.published_at,
+            DocumentFingerprint.raw_signature)\
+            .filter(DocumentFingerprint.id > self.last_id,
+                    DocumentFingerprint.published_at >= cutoff)\
+            .order_by(DocumentFingerprint.id)\
+            .yield_per(1000)
+
+        for fingerprint_id, doc_id, published_at, raw in rows:
+            self.add(doc_id, published_at, DocumentFingerprint(raw_signature=raw).signature)
+            self.last_id = fingerprint_id
+
+        old = [doc_id for doc_id, entry in self.entries.iteritems() if entry[0] < cutoff]
+        for doc_id in old:
+            self.index.remove(doc_id, self.entries.pop(doc_id)[1])
+
+        self.log.debug("Syndication index has %d documents" % len(self.entries))
+
+    def add(self, doc_id, published_at, sig):
+        if doc_id not in self.entries:
+            self.entries[doc_id] = (published_at, sig)
+            self.index.add(doc_id, sig)
+
+    def find(self, sig):
+        """ Find the id of the most similar document to the one with signature `sig`.
+        Returns a (doc_id, similarity) tuple, or (None, None). """
+        self.refresh()
+
+        best, best_score = None, -1.0
+        for doc_id in self.index.candidates(sig):
+            score = similarity(sig, self.entries[doc_id][1])
+            if score >= self.threshold and score > best_score:
+                best, best_score = doc_id, score
+
+        if best is None:
+            return None, None
+        return best, best_score
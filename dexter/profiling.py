@@ -0,0 +1,431 @@
+"""
+Opt-in profiling of requests and tasks.
+
+When SQL_PROFILING is enabled, every query run while handling a request is
+counted and timed, grouped by the shape of its statement. A statement shape
+that runs many times in one request usually means an N+1 pattern of lazy loads,
+and is logged as a warning along with the user's id.
+
+Each process also keeps a summary per endpoint and writes it into
+SQL_PROFILING_DIR after each request. Use `python app.py sql_profile` to
+combine them into a single report.
+
+Separately, an admin can profile the code run by a single request by adding
+`_profile=1` to its query string, or an `X-Profile: 1` header. The profile is
+saved into PROFILES_DIR, and can be browsed in the admin area. Tasks can
+be profiled with `profiled()`, such as a feed item queued for profiling with
+`python app.py profile_feed_item`.
+
+Requests can't be profiled by processes that use gevent, such as gunicorn's
+gevent workers, because the profile would include whatever other greenlets
+ran in the meantime. Profile a request with a sync worker instead.
+"""
+
+import cProfile
+import gc
+import json
+import logging
+import os
+import pstats
+import re
+import resource
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from StringIO import StringIO
+
+from flask import request, g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .logs import UserIdFilter
+
+log = logging.getLogger(__name__)
+
+profiler = None
+
+# where code profiles are saved, see `setup_code_profiling`
+PROFILES_DIR = None
+
+
+def setup_sql_profiling(app):
+    """ Setup SQL profiling if SQL_PROFILING is set. """
+    global profiler
+
+    if not app.config.get('SQL_PROFILING'):
+        return None
+
+    profiler = SQLProfiler(
+        app.config.get('SQL_PROFILING_DIR', '/tmp/dexter-sql-profile'),
+        app.config.get('SQL_PROFILING_N_PLUS_ONE', 10))
+    profiler.install(app)
+    log.info("Profiling SQL into %s" % profiler.summary_dir)
+
+    return profiler
+
+
+# a list of placeholders or literals, such as those in an IN clause
+_LIST_RE = re.compile(r'\(\s*(%s|\?|:\w+|\d+|\'[^\']*\')(\s*,\s*(%s|\?|:\w+|\d+|\'[^\']*\'))*\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """ Normalise an SQL statement so that statements that differ only by
+    their literals or the length of their IN lists have the same shape. """
+    shape = _SPACE_RE.sub(' ', statement).strip()
+    shape = _LIST_RE.sub('(?)', shape)
+    return _NUMBER_RE.sub('?', shape)
+
+
+class RequestProfile(object):
+    """ The queries run while handling a single request. """
+    def __init__(self, endpoint, userid):
+        self.endpoint = endpoint
+        self.userid = userid
+        self.queries = 0
+        self.db_time = 0.0
+        # shape -> [count, seconds]
+        self.shapes = defaultdict(lambda: [0, 0.0])
+
+    def record(self, statement, duration):
+        self.queries += 1
+        self.db_time += duration
+        shape = self.shapes[statement_shape(statement)]
+        shape[0] += 1
+        shape[1] += duration
+
+    def repeated(self, threshold):
+        """ List of (count, seconds, shape) tuples for shapes that
+        ran at least +threshold+ times, most frequent first. """
+        return sorted(((count, secs, shape) for shape, (count, secs) in self.shapes.iteritems() if count >= threshold),
+                      reverse=True)
+
+
+class EndpointStats(object):
+    """ Summary of the queries run by all requests to an endpoint. """
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.max_db_time = 0.0
+        self.n_plus_one = 0
+        # shape -> most repetitions in a single request
+        self.repeated_shapes = {}
+
+    def add(self, profile, repeated):
+        self.requests += 1
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        self.db_time += profile.db_time
+        self.max_db_time = max(self.max_db_time, profile.db_time)
+        if repeated:
+            self.n_plus_one += 1
+        for count, _, shape in repeated:
+            self.repeated_shapes[shape] = max(count, self.repeated_shapes.get(shape, 0))
+
+    def merge(self, info):
+        self.requests += info['requests']
+        self.queries += info['queries']
+        self.max_queries = max(self.max_queries, info['max_queries'])
+        self.db_time += info['db_time']
+        self.max_db_time = max(self.max_db_time, info['max_db_time'])
+        self.n_plus_one += info['n_plus_one']
+        for shape, count in info['repeated_shapes'].iteritems():
+            self.repeated_shapes[shape] = max(count, self.repeated_shapes.get(shape, 0))
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'max_queries': self.max_queries,
+            'mean_queries': self.queries / float(self.requests) if self.requests else 0.0,
+            'db_time': self.db_time,
+            'max_db_time': self.max_db_time,
+            'mean_db_time': self.db_time / self.requests if self.requests else 0.0,
+            'n_plus_one': self.n_plus_one,
+            'repeated_shapes': self.repeated_shapes,
+        }
+
+
+class SQLProfiler(object):
+    """ Profiles the queries run by each request handled by this process. """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, summary_dir=None, threshold=10):
+        self.summary_dir = summary_dir
+        self.threshold = threshold
+        self.endpoints = defaultdict(EndpointStats)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def install(self, app):
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        app.before_request(self.start)
+        app.teardown_request(self.finish)
+
+    @property
+    def current(self):
+        return getattr(self.local, 'profile', None)
+
+    def start(self):
+        self.local.profile = RequestProfile(request.endpoint or request.path, UserIdFilter.get_userid())
+
+    def finish(self, exc=None):
+        profile = self.current
+        if profile is None:
+            return
+        self.local.profile = None
+
+        repeated = profile.repeated(self.threshold)
+        for count, secs, shape in repeated:
+            self.log.warn("Possible N+1 in %s for userid:%s: %d queries taking %.3fs like: %s" % (
+                profile.endpoint, profile.userid, count, secs, shape[:500]))
+
+        self.log.info("SQL for %s: %d queries, %.3fs, userid:%s" % (
+            profile.endpoint, profile.queries, profile.db_time, profile.userid))
+
+        with self.lock:
+            self.endpoints[profile.endpoint].add(profile, repeated)
+        self.flush()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.current is not None:
+            conn.info.setdefault('profile_start', []).append(time.time())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = self.current
+        if profile is not None and conn.info.get('profile_start'):
+            profile.record(statement, time.time() - conn.info['profile_start'].pop())
+
+    def summary(self):
+        """ A dict from endpoints to summaries of their queries. """
+        with self.lock:
+            return dict((endpoint, stats.as_dict()) for endpoint, stats in self.endpoints.iteritems())
+
+    def flush(self):
+        """ Write this process's summary into the summary directory. """
+        if not self.summary_dir:
+            return
+
+        try:
+            if not os.path.exists(self.summary_dir):
+                os.makedirs(self.summary_dir)
+
+            path = os.path.join(self.summary_dir, '%s-%d.json' % (socket.gethostname(), os.getpid()))
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.summary(), f)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError) as e:
+            self.log.warn("Couldn't write SQL profile: %s" % e)
+
+
+def collect_summaries(summary_dir):
+    """ Combine the per-endpoint summaries written by all processes into +summary_dir+. """
+    endpoints = defaultdict(EndpointStats)
+
+    if os.path.exists(summary_dir):
+        for fname in sorted(os.listdir(summary_dir)):
+            if not fname.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(summary_dir, fname)) as f:
+                    for endpoint, info in json.load(f).iteritems():
+                        endpoints[endpoint].merge(info)
+            except (IOError, ValueError, KeyError) as e:
+                log.warn("Ignoring bad SQL profile %s: %s" % (fname, e))
+
+    return dict((endpoint, stats.as_dict()) for endpoint, stats in endpoints.iteritems())
+
+
+def setup_code_profiling(app):
+    """ Let admins profile individual requests, saving the profiles into PROFILES_DIR. """
+    global PROFILES_DIR
+    PROFILES_DIR = app.config.get('PROFILES_DIR', '/tmp/dexter-profiles')
+
+    @app.before_request
+    def start_code_profile():
+        if profile_requested():
+            if gevent_active():
+                log.warn("Not profiling %s, requests can't be profiled with gevent" % request.path)
+                return
+            g.code_profile = CodeProfile(request.endpoint or 'request', PROFILES_DIR)
+            g.code_profile.start()
+
+    @app.teardown_request
+    def finish_code_profile(exc=None):
+        code_profile = getattr(g, 'code_profile', None)
+        if code_profile:
+            g.code_profile = None
+            code_profile.stop()
+            code_profile.save()
+
+
+def profile_requested():
+    """ Has an admin asked for the current request to be profiled? """
+    if not (request.args.get('_profile') or request.headers.get('X-Profile')):
+        return False
+
+    from flask.ext.security import current_user
+    return current_user.is_authenticated() and current_user.admin
+
+
+def gevent_active():
+    """ Has gevent patched this process, so that other greenlets can run
+    in the middle of a request? """
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and 'socket' in getattr(monkey, 'saved', {})
+
+
+@contextmanager
+def profiled(name, enabled=True):
+    """ Profile the body of the with-statement, if +enabled+, and save
+    the profile as +name+.
+
+        >>> with profiled('get_feed_item', enabled=profile):
+        ...     process(item)
+    """
+    if not enabled:
+        yield
+        return
+
+    code_profile = CodeProfile(name, PROFILES_DIR or '/tmp/dexter-profiles')
+    code_profile.start()
+    try:
+        yield
+    finally:
+        code_profile.stop()
+        code_profile.save()
+
+
+def count_objects():
+    """ The number of live objects tracked by the garbage collector, by type name. """
+    counts = defaultdict(int)
+    for obj in gc.get_objects():
+        counts[type(obj).__name__] += 1
+    return counts
+
+
+class StackSampler(object):
+    """ Samples the stack every +interval+ seconds of CPU time, and counts
+    each distinct stack. Sampling relies on signals, so it only works in
+    the main thread. """
+    # the profiling timer is shared by the whole process
+    running = False
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.started = False
+
+    def start(self):
+        """ Start sampling, unless another sampler is already running. """
+        if StackSampler.running:
+            return False
+
+        StackSampler.running = self.started = True
+        signal.signal(signal.SIGPROF, self.sample)
+        # don't interrupt blocking calls, such as reading from a socket
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return True
+
+    def stop(self):
+        if self.started:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            StackSampler.running = self.started = False
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """ The samples in the collapsed-stack format used by flamegraph.pl and speedscope. """
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(self.stacks.iteritems()))
+
+
+class CodeProfile(object):
+    """ A profile of the code run between `start` and `stop`.
+
+    This samples the stack to build a flame graph, runs cProfile for exact call
+    counts, and compares the number of live objects by type and the process's
+    peak memory before and after, to find the biggest allocators.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, name, profiles_dir, interval=0.005):
+        self.name = name
+        self.profiles_dir = profiles_dir
+        self.sampler = None
+        if isinstance(threading.current_thread(), threading._MainThread):
+            self.sampler = StackSampler(interval)
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.started_at = datetime.utcnow()
+        self.objects = count_objects()
+        self.maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.start_time = time.time()
+
+        if self.sampler and not self.sampler.start():
+            self.sampler = None
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        if self.sampler:
+            self.sampler.stop()
+
+        self.elapsed = time.time() - self.start_time
+        self.maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.maxrss
+        after = count_objects()
+        self.objects = dict((k, after.get(k, 0) - self.objects.get(k, 0)) for k in set(after) | set(self.objects))
+
+    def report(self, limit=50):
+        """ Text report of the slowest functions and the biggest allocators. """
+        out = StringIO()
+        out.write("%s, %.3fs, peak memory grew by %d KB\n\n" % (self.name, self.elapsed, self.maxrss))
+
+        out.write("Live objects by type (change):\n")
+        for name, change in sorted(self.objects.iteritems(), key=lambda p: -p[1])[:limit]:
+            if change > 0:
+                out.write("  %+8d  %s\n" % (change, name))
+        out.write("\n")
+
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+
+        return out.getvalue()
+
+    def save(self):
+        """ Save this profile into the profiles directory, and return the base filename. """
+        name = '%s-%s-%d' % (self.started_at.strftime('%Y%m%dT%H%M%S'), re.sub(r'[^\w.-]', '_', self.name), os.getpid())
+
+        try:
+            if not os.path.exists(self.profiles_dir):
+                os.makedirs(self.profiles_dir)
+
+            with open(os.path.join(self.profiles_dir, name + '.txt'), 'w') as f:
+                f.write(self.report())
+
+            if self.sampler:
+                with open(os.path.join(self.profiles_dir, name + '.collapsed'), 'w') as f:
+                    f.write(self.sampler.collapsed())
+        except (IOError, OSError) as e:
+            self.log.warn("Couldn't save profile %s: %s" % (name, e))
+            return None
+
+        self.log.info("Saved profile %s" % name)
+        return name
@@ -0,0 +1,160 @@
+"""
+Send heavy read-only queries to a database replica.
+
+If SQLALCHEMY_REPLICA_URI is set, queries run inside `replica_reads()`, or by
+a function decorated with `@uses_replica`, go to the replica rather than the
+primary database. Everything else stays on the primary, including:
+
+ - anything outside of those blocks
+ - INSERT, UPDATE and DELETE statements, and SELECT ... FOR UPDATE
+ - queries later in a transaction that has already written something, so that
+   a transaction sees its own writes
+ - all queries for a while after a user has saved something, for
+   REPLICA_STICKY_SECONDS, so that they don't see stale data while the replica
+   catches up
+
+The replica has its own connection pool, sized with SQLALCHEMY_REPLICA_POOL_SIZE
+and SQLALCHEMY_REPLICA_MAX_OVERFLOW. The primary's pool is sized with the usual
+SQLALCHEMY_POOL_SIZE and SQLALCHEMY_MAX_OVERFLOW.
+
+SQL profiling, see `dexter.profiling`, listens to every engine, so queries sent
+to the replica are included in request profiles.
+
+To try it locally, point SQLALCHEMY_REPLICA_URI at a second MySQL instance
+replicating from the first, or at the same database as a stand-in.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from flask import has_request_context, session as flask_session
+from flask.ext.sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select, CompoundSelect
+from sqlalchemy.sql.dml import UpdateBase
+
+
+class RoutingSession(SignallingSession):
+    """ A session that sends reads to the replica when it's allowed to,
+    see the module documentation. """
+    def __init__(self, db, **options):
+        self.routing_db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.info.get('replica') and self.is_replica_read(clause):
+            replica = self.routing_db.get_replica_engine(self.app)
+            if replica is not None:
+                return replica
+
+        if isinstance(clause, UpdateBase):
+            # Query.update() and Query.delete() don't flush
+            self.info['wrote'] = True
+
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def is_replica_read(self, clause):
+        if self._flushing or self.info.get('wrote'):
+            return False
+
+        if isinstance(clause, Select):
+            return clause._for_update_arg is None
+
+        return isinstance(clause, CompoundSelect)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def remember_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        sticky = session.app.config.get('REPLICA_STICKY_SECONDS', 30)
+        flask_session['primary_until'] = time.time() + sticky
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def forget_write(session, previous_transaction):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy with sessions that can read from a replica. """
+    def __init__(self, *args, **kwargs):
+        self.replica_engines = {}
+        self.replica_lock = threading.Lock()
+        super(RoutingSQLAlchemy, self).__init__(*args, **kwargs)
+
+    def create_scoped_session(self, options=None):
+        options = dict(options or {})
+        scopefunc = options.pop('scopefunc', None)
+        return orm.scoped_session(partial(RoutingSession, self, **options), scopefunc=scopefunc)
+
+    def get_replica_engine(self, app=None):
+        """ The engine for the replica, or None if there isn't one. """
+        app = self.get_app(app)
+        uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+        if not uri:
+            return None
+
+        with self.replica_lock:
+            engine = self.replica_engines.get(app)
+            if engine is None:
+                options = {
+                    'echo': app.config.get('SQLALCHEMY_ECHO', False),
+                }
+                url = make_url(uri)
+                if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+                    # other pools, such as SQLite's, can't be sized
+                    options['pool_size'] = app.config.get('SQLALCHEMY_REPLICA_POOL_SIZE', 5)
+                    options['max_overflow'] = app.config.get('SQLALCHEMY_REPLICA_MAX_OVERFLOW', 10)
+                if url.drivername.startswith('mysql'):
+                    # as Flask-SQLAlchemy does for the primary
+                    options['pool_recycle'] = app.config.get('SQLALCHEMY_POOL_RECYCLE') or 7200
+                engine = self.replica_engines[app] = create_engine(uri, **options)
+
+        return engine
+
+
+def replica_allowed():
+    """ Can queries go to the replica? Not if this user has recently saved something. """
+    if has_request_context():
+        return flask_session.get('primary_until', 0) < time.time()
+    return True
+
+
+@contextmanager
+def replica_reads():
+    """ Send the read-only queries in this block to the replica, if possible. """
+    from .app import db
+
+    session = db.session()
+    previous = session.info.get('replica', False)
+    session.info['replica'] = replica_allowed()
+    try:
+        yield session
+    finally:
+        session.info['replica'] = previous
+
+
+def uses_replica(func):
+    """ Decorator that sends the read-only queries in this function to the replica. """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def replica_iter(iterable):
+    """ Iterate over +iterable+ with reads going to the replica, such as
+    for a streamed response that is generated after the view has returned. """
+    with replica_reads():
+        for item in iterable:
+            yield item
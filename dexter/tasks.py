@@ -6,9 +6,11 @@ from dateutil.parser import parse
 
 from dexter.app import celery_app as app
 from dexter.processing import DocumentProcessor, DocumentProcessorNT
+from dexter.models import db, TopicClustering, Person, DocumentAttachment
+from dexter.profiling import profiled
 
-# force configs for API keys to be set
-import dexter.core
+# force configs for API keys to be set, without loading the web interface
+import dexter.worker
 
 # This is a collection of periodic tasks for Dexter, using
 # Celery to drive task completion.
@@ -100,11 +102,12 @@ def fetch_daily_feeds(self, day):
 
 # retry every minute, for up to 24 hours.
 @app.task(bind=True, rate_limit="10/m", default_retry_delay=30, max_retries=2)
-def get_feed_item(self, item):
+def get_feed_item(self, item, profile=False):
     """ Fetch and process a document feed item. """
     try:
         dp = DocumentProcessorNT()
-        dp.process_feed_item(item)
+        with profiled('get_feed_item', enabled=profile):
+            dp.process_feed_item(item)
     except Exception as e:
         log.error("Error processing feed item: %s" % item, exc_info=e)
         self.retry()
@@ -118,3 +121,111 @@ def backfill_taxonomies():
         dp.backfill_taxonomies()
     except Exception as e:
         log.error("Error backfilling taxonomies: %s" % e.message, exc_info=e)
+
+
+@app.task
+def cluster_topics(clustering_id, profile=False):
+    """ Cluster documents into topics, for a TopicClustering. """
+    from dexter.analysis.topics import cluster_topics as run_clustering
+
+    clustering = TopicClustering.query.get(clustering_id)
+    if clustering is None or clustering.status != TopicClustering.PENDING:
+        # already done, or being done
+        return
+
+    with profiled('cluster_topics', enabled=profile):
+        run_clustering(clustering)
+
+
+@app.task(bind=True, default_retry_delay=60, max_retries=3)
+def process_attachment(self, attachment_id):
+    """ Convert an uploaded attachment to an image and generate its thumbnails. """
+    from sqlalchemy_imageattach.context import store_context
+    from wand.exceptions import WandError
+    from dexter import attachments
+
+    attachment = DocumentAttachment.query.get(attachment_id)
+    if attachment is None or attachment.status != DocumentAttachment.PENDING:
+        # deleted, or already done
+        return
+
+    with store_context(attachments.store):
+        images = []
+        try:
+            attachment.process_upload()
+            images = list(attachment.image)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # the image files were stored, but their rows weren't
+            attachment.discard_images(images)
+
+            # bad files won't get any better, but the store might
+            if not isinstance(e, WandError) and self.request.retries < self.max_retries:
+                log.warn("Error processing attachment %s, retrying: %s" % (attachment_id, e))
+                raise self.retry(exc=e)
+
+            log.error("Couldn't process attachment %s" % attachment_id, exc_info=e)
+            attachment = DocumentAttachment.query.get(attachment_id)
+            if attachment is not None:
+                attachment.status = DocumentAttachment.FAILED
+                db.session.commit()
+            return
+
+        try:
+            attachment.discard_upload()
+        except Exception as e:
+            # the attachment is fine, we're just left with an unused file
+            log.warn("Couldn't delete the upload of attachment %s: %s" % (attachment_id, e))
+
+
+# wait this long before relearning affiliations, so that a burst
+# of edits results in a single relearning job
+RELEARN_AFFILIATIONS_DELAY = 60
+
+
+def schedule_relearn_affiliations():
+    """ Schedule a task to relearn queued affiliations, unless one
+    is already scheduled. """
+    from dexter.cache import cache
+
+    if cache.add('relearn-affiliations-scheduled', True, timeout=RELEARN_AFFILIATIONS_DELAY):
+        relearn_affiliations.apply_async(countdown=RELEARN_AFFILIATIONS_DELAY)
+
+
+@app.task
+def relearn_affiliations():
+    """ Relearn the affiliations of people queued for relearning. """
+    try:
+        Person.relearn_pending_affiliations()
+        db.session.commit()
+    except Exception as e:
+        log.error("Error relearning affiliations: %s" % e.message, exc_info=e)
+        db.session.rollback()
+
+
+@app.task
+def find_duplicate_people():
+    """ Find people who are probably duplicates, for admins to merge. """
+    from dexter.analysis import DuplicatePeopleFinder
+
+    try:
+        DuplicatePeopleFinder().run()
+        db.session.commit()
+    except Exception as e:
+        log.error("Error finding duplicate people: %s" % e.message, exc_info=e)
+        db.session.rollback()
+
+
+@app.task
+def snapshot_mine():
+    """ Precompute the Dexter Mine analyses for yesterday. """
+    from dexter.analysis.mine import build_snapshots
+    from dexter.replica import replica_reads
+
+    try:
+        with replica_reads():
+            build_snapshots()
+    except Exception as e:
+        log.error("Error building mine snapshots: %s" % e.message, exc_info=e)
+        db.session.rollback()
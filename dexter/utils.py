@@ -4,8 +4,7 @@ from datetime import timedelta, datetime
 
 from flask.ext.sqlalchemy import Pagination
 from flask import abort, Response, make_response
-
-import nltk
+from unidecode import unidecode
 
 def paginate(query, page, per_page=20, error_out=True):
     if error_out and page < 1:
@@ -69,6 +68,9 @@ def levenshtein(first, second):
 
     See https://groups.google.com/forum/#!topic/nltk-users/u94RFDWbGyw
     """
+    # nltk is slow to import, and rarely needed
+    import nltk
+
     lensum = len(first) + len(second)
     ldist = nltk.edit_distance(first, second, transpositions=True)
 
@@ -78,6 +80,40 @@ def levenshtein(first, second):
     return (lensum - ldist) / lensum
 
 
+SOUNDEX_CODES = dict(
+    [(c, '1') for c in 'bfpv'] +
+    [(c, '2') for c in 'cgjkqsxz'] +
+    [(c, '3') for c in 'dt'] +
+    [('l', '4')] +
+    [(c, '5') for c in 'mn'] +
+    [('r', '6')])
+
+
+def soundex(word):
+    """
+    Return the American Soundex code of a word, such as 'R163' for 'Robert',
+    so that words that sound similar have the same code. Returns an empty
+    string if the word has no letters.
+    """
+    if isinstance(word, str):
+        word = word.decode('utf-8', 'ignore')
+    word = [c for c in unidecode(word).lower() if c.isalpha()]
+    if not word:
+        return ''
+
+    code = [word[0].upper()]
+    last = SOUNDEX_CODES.get(word[0])
+    for c in word[1:]:
+        digit = SOUNDEX_CODES.get(c)
+        if digit and digit != last:
+            code.append(digit)
+        # h and w don't separate letters with the same code, vowels do
+        if c not in 'hw':
+            last = digit
+
+    return ''.join(code)[:4].ljust(4, '0')
+
+
 # TODO: use flask-cache or something and do server-side caching too.
 def client_cache_for(**duration):
     def wrapper(f):
@@ -0,0 +1,28 @@
+"""
+Setup for document processing, without the web interface.
+
+Celery workers load this rather than dexter.core, so that they don't
+load the admin interface, assets, views and templates that they never use.
+"""
+from .app import app
+
+
+# setup extraction
+from .processing.extractors.alchemy import AlchemyExtractor
+from .processing.extractors.calais import CalaisExtractor
+from .processing.extractors.watson import WatsonExtractor
+
+AlchemyExtractor.API_KEY = app.config.get('ALCHEMY_API_KEY')
+CalaisExtractor.API_KEY = app.config.get('CALAIS_API_KEY')
+WatsonExtractor.WATSON_PASSWORD = app.config.get('WATSON_PASSWORD')
+WatsonExtractor.WATSON_USERNAME = app.config.get('WATSON_USERNAME')
+
+
+# setup crawlers
+from .processing import DocumentProcessorNT
+from .processing.fetcher import Fetcher
+from .processing.metrics import IngestionMetrics
+Fetcher.CACHE_DIR = app.config.get('HTTP_CACHE_DIR')
+Fetcher.MAX_RETRY_AFTER = app.config.get('HTTP_MAX_RETRY_AFTER', Fetcher.MAX_RETRY_AFTER)
+IngestionMetrics.SPOOL_DIR = app.config.get('METRICS_DIR')
+DocumentProcessorNT.FEED_PASSWORD = app.config.get('NEWSTOOLS_FEED_PASSWORD')
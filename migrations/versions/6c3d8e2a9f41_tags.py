@@ -0,0 +1,52 @@
+"""normalised tags with document counts
+
+Revision ID: 6c3d8e2a9f41
+Revises: 2f7c9a1e5b84
+Create Date: 2026-10-19 16:20:44.905127
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6c3d8e2a9f41'
+down_revision = '2f7c9a1e5b84'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('tags',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('doc_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.add_column('document_tags', sa.Column('tag_id', sa.Integer(), nullable=True))
+
+    # move the tag names into the tags table, dropping tags that are
+    # now duplicated on a document
+    op.execute("INSERT INTO tags (name) SELECT DISTINCT tag FROM document_tags")
+    op.execute("UPDATE document_tags dt INNER JOIN tags t ON t.name = dt.tag SET dt.tag_id = t.id")
+    op.execute("""
+        DELETE dt1 FROM document_tags dt1
+        INNER JOIN document_tags dt2 ON dt1.doc_id = dt2.doc_id AND dt1.tag_id = dt2.tag_id AND dt1.id > dt2.id
+        """)
+
+    op.alter_column('document_tags', 'tag_id', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_document_tags_tag_id_doc_id', 'document_tags', ['tag_id', 'doc_id'], unique=True)
+    op.create_foreign_key('fk_document_tags_tag_id', 'document_tags', 'tags', ['tag_id'], ['id'], ondelete='CASCADE')
+    op.drop_column('document_tags', 'tag')
+
+    op.execute("UPDATE tags SET doc_count = (SELECT COUNT(*) FROM document_tags WHERE document_tags.tag_id = tags.id)")
+
+
+def downgrade():
+    op.add_column('document_tags', sa.Column('tag', sa.String(length=200), nullable=True))
+    op.execute("UPDATE document_tags dt INNER JOIN tags t ON t.id = dt.tag_id SET dt.tag = t.name")
+    op.alter_column('document_tags', 'tag', existing_type=sa.String(length=200), nullable=False)
+
+    op.drop_constraint('fk_document_tags_tag_id', 'document_tags', type_='foreignkey')
+    op.drop_index('ix_document_tags_tag_id_doc_id', table_name='document_tags')
+    op.drop_column('document_tags', 'tag_id')
+    op.drop_table('tags')
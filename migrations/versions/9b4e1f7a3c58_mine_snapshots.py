@@ -0,0 +1,36 @@
+"""nightly mine snapshots
+
+Revision ID: 9b4e1f7a3c58
+Revises: 6c3d8e2a9f41
+Create Date: 2026-10-19 17:05:12.331846
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b4e1f7a3c58'
+down_revision = '6c3d8e2a9f41'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.create_table('mine_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('country_id', sa.Integer(), nullable=False),
+    sa.Column('days', sa.Integer(), nullable=False),
+    sa.Column('medium_id', sa.Integer(), nullable=True),
+    sa.Column('yesterday', sa.Date(), nullable=False),
+    sa.Column('raw_data', mysql.LONGTEXT(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text(u'now()'), nullable=False),
+    sa.ForeignKeyConstraint(['country_id'], ['countries.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['medium_id'], ['mediums.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('mine_snapshots_country_days_yesterday_ix', 'mine_snapshots', ['country_id', 'days', 'yesterday'], unique=False)
+
+
+def downgrade():
+    op.drop_index('mine_snapshots_country_days_yesterday_ix', table_name='mine_snapshots')
+    op.drop_table('mine_snapshots')
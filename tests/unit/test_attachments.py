@@ -1,9 +1,13 @@
 import unittest
 import datetime
+import shutil
+import tempfile
+from cStringIO import StringIO
 
+from sqlalchemy_imageattach.context import current_store
 from werkzeug.datastructures import FileStorage
 
-from dexter.attachments import HttpExposedFileSystemStore, S3Store
+from dexter.attachments import HttpExposedFileSystemStore, S3Store, URLCache, RangedReader
 from dexter.models import Document, DocumentAttachment, AttachmentImage, db, Author, Country, Medium
 from dexter.models.seeds import seed_db
 
@@ -61,3 +65,99 @@ class TestAttachments(unittest.TestCase):
         db.session.commit()
 
         self.assertEqual(0, len(doc.attachments))
+
+    def test_background_processing(self):
+        with open("tests/fixtures/smiley.png") as f:
+            upload = FileStorage(f, 'smiley.png', name='file', content_type='image/png')
+            attachment = DocumentAttachment.from_upload(upload, None, background=True)
+            db.session.commit()
+
+        self.assertEqual(DocumentAttachment.PENDING, attachment.status)
+        info = attachment.to_json()
+        self.assertEqual('pending', info['status'])
+        self.assertIsNone(info['thumbnail_url'])
+        self.assertIsNone(info['size'])
+
+        attachment.process_upload()
+        db.session.commit()
+
+        self.assertEqual(DocumentAttachment.DONE, attachment.status)
+        self.assertEqual('image/png', attachment.image.original.mimetype)
+        self.assertIsNotNone(attachment.to_json()['thumbnail_url'])
+
+    def test_upload_kept_until_committed(self):
+        with open("tests/fixtures/smiley.png") as f:
+            upload = FileStorage(f, 'smiley.png', name='file', content_type='image/png')
+            attachment = DocumentAttachment.from_upload(upload, None, background=True)
+            db.session.commit()
+
+        # the commit fails, so it must be processed again
+        attachment.process_upload()
+        db.session.rollback()
+
+        attachment.process_upload()
+        db.session.commit()
+        self.assertEqual(DocumentAttachment.DONE, attachment.status)
+
+        attachment.discard_upload()
+        self.assertRaises(IOError, current_store.get_file,
+                          'document-attachment', attachment.upload_filename, 0, 0, attachment.mimetype)
+
+    def test_task_deleted_attachment(self):
+        from dexter.tasks import process_attachment
+
+        # deleted before it could be processed
+        self.assertIsNone(process_attachment(1234))
+
+
+class TestAttachmentStores(unittest.TestCase):
+    def test_url_cache(self):
+        cache = URLCache(validity_secs=1000, margin=100)
+        urls = iter(['a', 'b'])
+        generate = lambda: next(urls)
+
+        self.assertEqual('a', cache.get('key', generate))
+        self.assertEqual('a', cache.get('key', generate))
+
+        # re-signed once it's close to expiring
+        cache.urls['key'] = ('a', 0)
+        self.assertEqual('b', cache.get('key', generate))
+
+    def test_url_cache_discard(self):
+        cache = URLCache()
+        cache.get('key', lambda: 'a')
+        cache.discard('key')
+        self.assertEqual('b', cache.get('key', lambda: 'b'))
+
+    def test_ranged_reader(self):
+        data = 'abcdefghij'
+        fetches = []
+
+        def fetch(start, end):
+            fetches.append((start, end))
+            return data[start:end]
+
+        reader = RangedReader(fetch, len(data), chunk_size=4)
+        self.assertEqual('ab', reader.read(2))
+        self.assertEqual('cd', reader.read(2))
+        self.assertEqual([(0, 4)], fetches)
+
+        self.assertEqual('efghij', reader.read())
+        self.assertEqual('', reader.read())
+
+        reader.seek(-3, 2)
+        self.assertEqual('hij', reader.read(10))
+        self.assertEqual(['abcd', 'efgh', 'ij'], list(RangedReader(fetch, len(data), chunk_size=4)))
+
+    def test_fs_store_get_file(self):
+        path = tempfile.mkdtemp()
+        try:
+            store = HttpExposedFileSystemStore(path, '/prefix')
+            store.put_file(StringIO('%PDF-1.4 test'), 'attachment', '1/foo.pdf', 0, 0, 'application/pdf', False)
+
+            with store.get_file('attachment', '1/foo.pdf', 0, 0, 'application/pdf') as f:
+                self.assertEqual(13, f.size)
+                self.assertEqual('%PDF', f.read(4))
+                self.assertEqual('-1.4 test', f.read())
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,72 @@
+import unittest
+
+from dexter.models import Document, DocumentFairness, DocumentSource, Fairness, Affiliation, db
+from dexter.models.seeds import seed_db
+from dexter.analysis import BiasCalculator
+
+from tests.fixtures import dbfixture, DocumentData
+
+
+class TestBiasCalculator(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.doc = Document.query.get(self.fx.DocumentData.simple.id)
+        self.doc2 = Document.query.get(self.fx.DocumentData.simple2.id)
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def fairness(self, name):
+        f = Fairness.query.filter(Fairness.name == name).first()
+        if not f:
+            f = Fairness(name=name)
+        return f
+
+    def test_calculate_bias_scores(self):
+        party = Affiliation(code='4.1', name='Party')
+        other = Affiliation(code='1.1', name='Other')
+
+        # doc is unfair, favouring the party
+        df = DocumentFairness()
+        df.fairness = self.fairness('Omission')
+        df.bias_favour = party
+        self.doc.fairness.append(df)
+
+        # doc2 is fair
+        df = DocumentFairness()
+        df.fairness = self.fairness('Fair')
+        self.doc2.fairness.append(df)
+
+        for aff in [party, party, other]:
+            ds = DocumentSource()
+            ds.name = 'Someone'
+            ds.source_type = 'person'
+            ds.affiliation = aff
+            self.doc.sources.append(ds)
+
+        db.session.commit()
+
+        calc = BiasCalculator()
+        scores = calc.calculate_bias_scores(calc.get_query(), key=lambda m: m.group_name())
+
+        self.assertEqual(1, len(scores))
+        score = scores[0]
+        self.assertEqual(self.doc.medium.group_name(), score.group)
+        self.assertEqual(2, score.count)
+        self.assertEqual(0.5, score.fair)
+        self.assertEqual(1, score.favour)
+        self.assertEqual(0, score.oppose)
+        self.assertEqual(0, score.discrepancy)
+
+        counts = calc.count_sources(calc.doc_ids_subquery(calc.get_query()), {self.doc.medium_id: 'group'})
+        self.assertEqual({'Party': 2}, dict(counts['group']))
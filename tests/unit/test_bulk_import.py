@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock
+
+from dexter.models import db, Document, Entity, Person, Country, Medium, DocumentType, AuthorType, Fairness, \
+    AnalysisNature
+from dexter.models.seeds import seed_db
+from dexter.processing import DocumentProcessorNT
+from dexter.processing.bulk_import import read_archive, prepare_item, BulkCalaisExtractor, BulkImporter
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def test_read_jsonl(self):
+        path = self.write('archive.jsonl',
+                          '{"url": "http://mg.co.za/a", "title": "A", "date": "2014-02-10"}\n'
+                          '\n'
+                          '{"url": "http://mg.co.za/b", "calais": {"doc": {}}}\n')
+
+        items = list(read_archive(path))
+        self.assertEqual([i for i, item in items], [1, 3])
+        self.assertEqual(items[0][1]['title'], 'A')
+        self.assertEqual(items[1][1]['calais'], {'doc': {}})
+
+    def test_read_csv(self):
+        path = self.write('archive.csv',
+                          'url,title,date,author\n'
+                          'http://mg.co.za/a,Caf\xc3\xa9,2014-02-10,\n')
+
+        items = list(read_archive(path))
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0][1]['title'], u'Caf\xe9')
+        self.assertIsNone(items[0][1]['author'])
+
+    def test_entity_names(self):
+        calais = {
+            'entities': {
+                'Person': {
+                    'a': {'name': u'Jacob Zuma', 'relevance': 0.5, 'instances': []},
+                    'b': {'name': u'X', 'relevance': 0.5, 'instances': []},
+                },
+            },
+            'relations': {
+                'Quotation': {
+                    'q': {'quotation': 'Hello', 'speaker': {'_type': 'Person', 'name': u'Jos\xe9 Smith.'}},
+                },
+            },
+        }
+
+        bx = BulkCalaisExtractor()
+        names = sorted(bx.entity_names(calais))
+        self.assertEqual(names, [('person', u'Jacob Zuma'), ('person', u'Jos\xe9 Smith')])
+        self.assertEqual(bx.entity_key('Person', u'Jos\xe9 Smith.'), ('person', 'jose smith'))
+        self.assertEqual(bx.entity_key('Person', u'Jos\xe9 Smith '), ('person', 'jose smith'))
+
+    def test_checkpoint(self):
+        importer = BulkImporter(processor=MagicMock(), checkpoint=os.path.join(self.dir, 'checkpoint'))
+        self.assertEqual(importer.read_checkpoint(), 0)
+
+        importer.write_checkpoint(42)
+        self.assertEqual(importer.read_checkpoint(), 42)
+
+
+def calais(speaker, quote):
+    """ A cached OpenCalais response quoting +speaker+. """
+    return {
+        'doc': {'info': {}},
+        'http://d.opencalais.com/pershash-1/1': {
+            '_typeGroup': 'entities',
+            '_type': 'Person',
+            'name': speaker,
+            'relevance': 0.8,
+            'instances': [{'offset': 0, 'length': len(speaker.strip())}],
+        },
+        'http://d.opencalais.com/genericHasher-1/1': {
+            '_typeGroup': 'relations',
+            '_type': 'Quotation',
+            'speaker': 'http://d.opencalais.com/pershash-1/1',
+            'quotation': quote,
+        },
+    }
+
+
+class TestImportBatch(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        for x in Country.create_defaults():
+            db.session.add(x)
+        db.session.flush()
+
+        for model in [Medium, DocumentType, AuthorType, Fairness, AnalysisNature]:
+            for x in model.create_defaults():
+                db.session.add(x)
+
+        self.zuma = Person(name='Jacob Zuma')
+        db.session.add(Entity(group='person', name='Jacob Zuma', person=self.zuma))
+        db.session.commit()
+
+        self.dir = tempfile.mkdtemp()
+        self.importer = BulkImporter(processor=DocumentProcessorNT())
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.drop_all()
+        shutil.rmtree(self.dir)
+
+    def item(self, url, speaker, author=None):
+        text = '%s said the new schools would open in January.' % speaker.strip()
+        return {
+            'url': url,
+            'title': 'Schools',
+            'date': '2014-02-10',
+            'author': author,
+            'text': text,
+            'calais': calais(speaker, 'the new schools would open in January'),
+        }
+
+    def import_archive(self, items):
+        path = os.path.join(self.dir, 'archive.jsonl')
+        with open(path, 'w') as f:
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+
+        self.importer.import_batch([prepare_item(x) for x in read_archive(path)])
+
+    def test_import_batch(self):
+        self.import_archive([
+            # mysql considers this the same as the existing entity
+            self.item('http://mg.co.za/article/2014-02-10-schools', 'Jacob Zuma ', author='Joe Bloggs'),
+            self.item('http://mg.co.za/article/2014-02-10-schools', 'Jacob Zuma'),
+            # a new entity that's named differently in two documents
+            self.item('http://mg.co.za/article/2014-02-11-more-schools', 'Cyril Ramaphosa'),
+            self.item('http://mg.co.za/article/2014-02-12-even-more-schools', 'Cyril Ramaphosa '),
+            self.item('http://example.com/schools', 'Jacob Zuma'),
+        ])
+
+        self.assertEqual(self.importer.counts['items'], 5)
+        self.assertEqual(self.importer.counts['processed'], 3)
+        self.assertEqual(self.importer.counts['duplicate'], 1)
+        self.assertEqual(self.importer.counts['no_medium'], 1)
+
+        self.assertEqual(Entity.query.filter(Entity.name == 'Cyril Ramaphosa').count(), 1)
+        self.assertEqual(Entity.query.filter(Entity.name == 'Jacob Zuma').count(), 1)
+
+        doc = Document.query.filter(Document.url == 'http://mg.co.za/article/2014-02-10-schools').one()
+        self.assertEqual(doc.medium.domain, 'mg.co.za')
+        self.assertEqual(doc.author.name, 'Joe Bloggs')
+        self.assertEqual(doc.document_type.name, 'News story')
+        self.assertEqual([df.fairness.name for df in doc.fairness], ['Fair'])
+        self.assertIsNotNone(doc.fingerprint.signature)
+        self.assertEqual(doc.utterances[0].quote, 'the new schools would open in January')
+        self.assertEqual([s.person for s in doc.sources], [self.zuma])
+
+        docs = Document.query.filter(Document.id != doc.id).all()
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(set(d.author.name for d in docs), set(['Unknown']))
+        self.assertEqual(docs[0].utterances[0].entity_id, docs[1].utterances[0].entity_id)
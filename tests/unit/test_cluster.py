@@ -1,7 +1,10 @@
 import unittest
 import datetime
 
-from dexter.models import Document, Cluster, db, Author, Medium, Country
+from mock import patch
+from sqlalchemy import func
+
+from dexter.models import Document, Cluster, TopicClustering, db, Author, Medium, Country
 from dexter.models.seeds import seed_db
 
 from tests.fixtures import dbfixture, AuthorData
@@ -71,3 +74,95 @@ class TestCluster(unittest.TestCase):
 
         cluster = db.session.query(Cluster).filter(Cluster.id == cluster.id).one()
         self.assertEqual(sorted(rest), sorted(cluster.documents))
+
+
+class TestTopicClustering(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+
+    def tearDown(self):
+        self.db.session.rollback()
+        self.db.session.remove()
+        self.db.drop_all()
+
+    def test_find_or_create(self):
+        clustering, new = TopicClustering.find_or_create([3, 1, 2])
+        self.assertTrue(new)
+        self.assertEqual(clustering.status, TopicClustering.PENDING)
+        self.assertEqual(clustering.doc_ids, [1, 2, 3])
+        db.session.commit()
+
+        clustering2, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertFalse(new)
+        self.assertEqual(clustering.id, clustering2.id)
+
+    def test_retry_failed(self):
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        clustering.status = TopicClustering.FAILED
+        db.session.commit()
+
+        # polling doesn't retry it
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertFalse(new)
+
+        clustering, new = TopicClustering.find_or_create([1, 2, 3], retry_failed=True)
+        self.assertTrue(new)
+        self.assertEqual(clustering.status, TopicClustering.PENDING)
+
+    def test_restart_stale(self):
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        clustering.status = TopicClustering.RUNNING
+        clustering.progress = 30
+        db.session.commit()
+
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertFalse(new)
+        self.assertEqual(clustering.status, TopicClustering.RUNNING)
+
+        # its worker died an hour ago
+        an_hour_ago = db.session.query(func.now()).scalar() - datetime.timedelta(hours=1)
+        db.session.execute(TopicClustering.__table__.update().values(updated_at=an_hour_ago))
+        db.session.commit()
+
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertTrue(new)
+        self.assertEqual(clustering.status, TopicClustering.PENDING)
+        self.assertEqual(clustering.progress, 0)
+        db.session.commit()
+
+        # and it's only restarted once
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertFalse(new)
+
+    def test_created_concurrently(self):
+        # start this transaction before the other request creates the clustering
+        self.assertEqual(TopicClustering.query.count(), 0)
+        db.engine.execute(TopicClustering.__table__.insert(), {
+            'fingerprint': Cluster.make_fingerprint([1, 2, 3]),
+            'doc_id_list': '1,2,3',
+            'status': TopicClustering.RUNNING,
+            'progress': 10,
+        })
+
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        self.assertFalse(new)
+        self.assertEqual(clustering.status, TopicClustering.RUNNING)
+        db.session.commit()
+        self.assertEqual(TopicClustering.query.count(), 1)
+
+    def test_task_only_runs_pending(self):
+        from dexter.tasks import cluster_topics
+
+        clustering, new = TopicClustering.find_or_create([1, 2, 3])
+        db.session.commit()
+
+        with patch('dexter.analysis.topics.cluster_topics') as run_clustering:
+            cluster_topics(clustering.id)
+            self.assertEqual(run_clustering.call_count, 1)
+
+            clustering.status = TopicClustering.DONE
+            db.session.commit()
+            cluster_topics(clustering.id)
+            self.assertEqual(run_clustering.call_count, 1)
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+import shutil
+import tempfile
+
+from mock import MagicMock, patch
+
+from dexter.profiling import CodeProfile, profiled, gevent_active
+
+
+def busy():
+    return sum(i * i for i in xrange(200000))
+
+
+class TestCodeProfile(unittest.TestCase):
+    def setUp(self):
+        self.profiles_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.profiles_dir)
+
+    def test_save(self):
+        profile = CodeProfile('show/article', self.profiles_dir, interval=0.001)
+        profile.start()
+        junk = [[i] for i in xrange(10000)]
+        for i in xrange(5):
+            busy()
+        profile.stop()
+
+        name = profile.save()
+        self.assertIn('show_article', name)
+
+        with open(os.path.join(self.profiles_dir, name + '.txt')) as f:
+            report = f.read()
+        self.assertIn('busy', report)
+        self.assertIn('list', report)
+
+        with open(os.path.join(self.profiles_dir, name + '.collapsed')) as f:
+            collapsed = f.read()
+        self.assertIn('busy', collapsed)
+        for line in collapsed.splitlines():
+            self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+        del junk
+
+    def test_disabled(self):
+        with profiled('nothing', enabled=False):
+            busy()
+        self.assertEqual([], os.listdir(self.profiles_dir))
+
+    def test_gevent_active(self):
+        with patch.dict(sys.modules, {'gevent.monkey': MagicMock(saved={'socket': {}})}):
+            self.assertTrue(gevent_active())
+
+        with patch.dict(sys.modules, {'gevent.monkey': MagicMock(saved={})}):
+            self.assertFalse(gevent_active())
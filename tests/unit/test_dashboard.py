@@ -0,0 +1,123 @@
+import unittest
+
+from mock import MagicMock, patch
+from werkzeug.datastructures import MultiDict
+
+from dexter.app import app
+from dexter.models import Document, DocumentSource, DocumentFairness, Fairness, Medium, Country, User, db
+from dexter.models.problems import DocumentAnalysisProblem
+from dexter.models.seeds import seed_db
+from dexter.dashboard import ActivityChartHelper, ActivityForm
+
+from tests.fixtures import dbfixture, DocumentData
+
+
+class SourcesForm(object):
+    """ Finds the fixture documents, joined to their sources as a source person
+    filter would, so that documents with many sources are duplicated. """
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+
+    def filter_query(self, query):
+        return query\
+            .outerjoin(DocumentSource, DocumentSource.doc_id == Document.id)\
+            .filter(Document.id.in_(self.doc_ids))
+
+
+class TestActivityChartHelper(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.doc = Document.query.get(self.fx.DocumentData.simple.id)
+        self.doc2 = Document.query.get(self.fx.DocumentData.simple2.id)
+
+        # two quoted sources, without functions or affiliations
+        for i in xrange(2):
+            self.doc.sources.append(DocumentSource(source_type='person', unnamed=True, quoted=True))
+
+        self.bias = Fairness(name='Test bias')
+        # the same fairness twice only counts once
+        for i in xrange(2):
+            self.doc.fairness.append(DocumentFairness(fairness=self.bias))
+
+        db.session.flush()
+        DocumentAnalysisProblem.update_documents(db.session.connection())
+        db.session.commit()
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def test_chart_data(self):
+        data = ActivityChartHelper(SourcesForm([self.doc.id, self.doc2.id])).chart_data()
+        charts = data['charts']
+
+        self.assertEqual(data['summary'], {'documents': 2})
+
+        self.assertEqual(charts['created']['values'], {self.doc.created_at.strftime('%Y/%m/%d'): 2})
+        self.assertEqual(charts['published']['values'], {'2012/01/01': 1, '2012/03/03': 1})
+
+        user = User.query.get(self.doc.created_by_user_id)
+        self.assertEqual(charts['users']['values'], {user.short_name(): 2})
+        self.assertEqual(charts['countries']['values'], {Country.query.get(1).name: 2})
+        self.assertEqual(charts['media']['values'], {Medium.query.get(1).name: 2})
+
+        # the other document is considered fair
+        self.assertEqual(charts['fairness']['values'], {'Test bias': 1, 'Fair': 1})
+
+        problems = charts['problems']['values']
+        self.assertEqual(problems['missing a topic'], 2)
+        self.assertEqual(problems['source without a function'], 1)
+        self.assertEqual(problems['source without an affiliation'], 1)
+        self.assertEqual(problems['child source without an age'], 0)
+
+        self.assertEqual(charts['markers']['values'], {
+            'flagged': 0,
+            'with-url': 2,
+            'without-url': 0,
+            'average-sources-per-document': 2.0,
+        })
+
+
+class TestActivityFormCacheKey(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.db.drop_all()
+
+    def cache_key(self, args, *extra):
+        with app.test_request_context('/activity'):
+            with patch('dexter.dashboard.current_user', MagicMock(admin=True)):
+                return ActivityForm(MultiDict(args)).cache_key('places-summary', *extra)
+
+    def test_equivalent_filters(self):
+        key = self.cache_key([
+            ('medium_id', '2'), ('medium_id', '1'),
+            ('published_at', ' 2014/01/01 - 2014/01/31 '),
+            ('format', 'places-json')], 10)
+
+        self.assertTrue(key.startswith('places-summary:'))
+        self.assertEqual(key, self.cache_key([
+            ('medium_id', '1'), ('medium_id', '2'),
+            ('published_at', '2014/01/01 - 2014/01/31'),
+            ('format', 'html')], 10))
+
+    def test_different_filters(self):
+        args = [('medium_id', '1'), ('published_at', '2014/01/01 - 2014/01/31')]
+        key = self.cache_key(args, 10)
+
+        self.assertNotEqual(key, self.cache_key(args, 20))
+        self.assertNotEqual(key, self.cache_key([('medium_id', '1'), ('published_at', '2014/01/01 - 2014/02/28')], 10))
+        self.assertNotEqual(key, self.cache_key(args + [('flagged', 'y')], 10))
@@ -1,7 +1,8 @@
 import unittest
 import datetime
 
-from dexter.models import Document, DocumentEntity, Entity, Utterance, DocumentKeyword, DocumentPlace, db
+from dexter.models import Document, DocumentEntity, Entity, Utterance, DocumentKeyword, DocumentPlace, DocumentSource, Tag, db
+from dexter.models.problems import DocumentAnalysisProblem
 from dexter.models.seeds import seed_db
 
 from tests.fixtures import dbfixture, DocumentData
@@ -185,3 +186,76 @@ class TestDocument(unittest.TestCase):
 
         d.text = None
         self.assertIsNone(d.word_count)
+
+    def test_problems_recomputed_on_save(self):
+        doc = self.doc
+        doc.notes = u'changed'
+        db.session.commit()
+
+        codes = set(p.code for p in DocumentAnalysisProblem.all() if doc.problems & p.mask)
+        self.assertIn('missing-topic', codes)
+        self.assertIn('missing-origin', codes)
+        self.assertNotIn('source-without-function', codes)
+
+        ds = DocumentSource()
+        ds.source_type = 'secondary'
+        ds.name = u'Joe'
+        doc.sources.append(ds)
+        db.session.commit()
+
+        problem = DocumentAnalysisProblem.lookup('source-without-function')
+        self.assertTrue(doc.problems & problem.mask)
+
+        docs = DocumentAnalysisProblem.filter_query_for([problem], Document.query).all()
+        self.assertEqual([doc.id], [d.id for d in docs])
+
+    def test_tags(self):
+        doc = self.doc
+        doc.tags.add(u'foo')
+        doc.tags.add(u'bar')
+        db.session.commit()
+
+        self.assertEqual(set([u'foo', u'bar']), set(doc.tags))
+        self.assertEqual([u'bar', u'foo'], Tag.names())
+        self.assertEqual(1, Tag.query.filter(Tag.name == u'foo').one().doc_count)
+
+        doc.tags.discard(u'foo')
+        db.session.commit()
+        self.assertEqual(0, Tag.query.filter(Tag.name == u'foo').one().doc_count)
+
+    def test_tag_created_concurrently(self):
+        # begin this transaction
+        self.assertEqual([], Tag.names())
+
+        # another request adds the same new tag and commits
+        with db.engine.begin() as conn:
+            conn.execute(Tag.__table__.insert(), [{'name': u'foo'}])
+
+        self.doc.tags.add(u'foo')
+        self.doc.tags.add(u'Bar')
+        db.session.commit()
+
+        self.assertEqual(set([u'foo', u'Bar']), set(self.doc.tags))
+        self.assertEqual(1, Tag.query.filter(Tag.name == u'foo').one().doc_count)
+        # names match as the database compares them
+        self.assertEqual(Tag.query.filter(Tag.name == u'Bar').one(), Tag.find_or_create([u'bar '])[u'bar '])
+
+    def test_bulk_tags(self):
+        doc2 = Document.query.get(self.fx.DocumentData.simple2.id)
+        doc_ids = [self.doc.id, doc2.id]
+
+        Tag.add_to_documents([u'foo'], doc_ids)
+        Tag.add_to_documents([u'bar'], [self.doc.id])
+        db.session.commit()
+
+        self.assertEqual(2, Tag.query.filter(Tag.name == u'foo').one().doc_count)
+        self.assertEqual([(u'foo', 2), (u'bar', 1)], Tag.summary_for_docs(doc_ids))
+
+        query = db.session.query(Document.id)
+        self.assertEqual(set(doc_ids), set(d[0] for d in Tag.filter_query(query, [u'foo'])))
+        self.assertEqual([self.doc.id], [d[0] for d in Tag.filter_query(query, [u'foo', u'bar'])])
+        self.assertEqual([], Tag.filter_query(query, [u'foo', u'missing']).all())
+
+        Tag.remove_from_documents([u'foo'], doc_ids)
+        db.session.commit()
+        self.assertEqual(0, Tag.query.filter(Tag.name == u'foo').one().doc_count)
@@ -0,0 +1,63 @@
+import unittest
+
+from dexter.models import Person, PersonMergeCandidate, db
+from dexter.models.seeds import seed_db
+from dexter.analysis import DuplicatePeopleFinder
+from dexter.utils import soundex
+
+from tests.fixtures import dbfixture, PersonData
+
+
+class TestDuplicatePeopleFinder(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(PersonData)
+        self.fx.setup()
+
+        self.finder = DuplicatePeopleFinder()
+
+    def tearDown(self):
+        self.db.session.rollback()
+
+        self.fx.teardown()
+        self.db.session.remove()
+        self.db.drop_all()
+
+    def test_soundex(self):
+        self.assertEqual('R163', soundex('Robert'))
+        self.assertEqual('R163', soundex('Rupert'))
+        self.assertEqual('A261', soundex('Ashcraft'))
+        self.assertEqual('Z500', soundex(u'Zuma'))
+        self.assertEqual('', soundex('.'))
+
+    def test_normalise(self):
+        self.assertEqual(['jacob', 'zuma'], self.finder.normalise('Jacob G. Zuma'))
+        self.assertEqual(['zuma'], self.finder.normalise('President Zuma'))
+
+    def test_score(self):
+        n = self.finder.normalise
+        self.assertEqual(1.0, self.finder.score(n('Jacob G. Zuma'), n('Jacob Zuma')))
+        self.assertGreaterEqual(self.finder.score(n('President Zuma'), n('Jacob Zuma')), self.finder.threshold)
+        self.assertLess(self.finder.score(n('Joe Author'), n('Jacob Zuma')), self.finder.threshold)
+
+    def test_run_and_merge(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        db.session.add(Person(name='President Zuma'))
+        db.session.flush()
+
+        self.assertEqual(1, self.finder.run())
+        candidate = PersonMergeCandidate.query.one()
+        self.assertEqual(zuma.id, candidate.person_id)
+        self.assertEqual('President Zuma', candidate.duplicate.name)
+
+        # as the admin merge action does
+        Person.merge_people([(candidate.duplicate_id, candidate.person_id)])
+        db.session.flush()
+        db.session.expire_all()
+
+        self.assertIsNone(Person.query.filter(Person.name == 'President Zuma').first())
+        self.assertEqual([], PersonMergeCandidate.query.all())
@@ -0,0 +1,67 @@
+import codecs
+import unittest
+from StringIO import StringIO
+
+from dexter.processing.feeds import parse_feed_items, response_stream
+
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0">
+<channel>
+    <title>Dexter Articles</title>
+    <item>
+        <url>http://mg.co.za/article/2014&#45;05&#45;22&#45;kitchen&#45;cabinet&#45;helps&#45;jz&#45;to&#45;rule</url>
+        <publisher>Mail &amp; Guardian</publisher>
+        <publishdate>2014-05-23 00:00:00</publishdate>
+        <title>&lsquo;Kitchen cabinet&rsquo; helps Jacob Zuma rule</title>
+        <author>Political Team</author>
+        <text>http://www.newstools.co.za/data/texts/SFM-5TC9PUI3J6XGJC4Q7WAR.txt</text>
+    </item>
+    <item>
+        <url>http://mg.co.za/article/2014-05-22-dont-miss-this-eat-listen-watch</url>
+        <publishdate>2014-05-23 00:00:00</publishdate>
+        <title>DON'T MISS THIS</title>
+        <author>M&amp;G Reporters</author>
+        <text>http://www.newstools.co.za/data/texts/SFM-9VNENUOQNCNT503VVLYE.txt</text>
+    </item>
+</channel>
+</rss>
+"""
+
+
+class FakeResponse(object):
+    _content = False
+    _content_consumed = False
+
+    def __init__(self, body=FEED, encoding=None):
+        self.body = body
+        self.encoding = encoding
+
+    def iter_content(self, size, decode_unicode=False):
+        # deliberately small chunks
+        chunks = (self.body[i:i + 10] for i in xrange(0, len(self.body), 10))
+        if decode_unicode and self.encoding:
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            chunks = (decoder.decode(c) for c in chunks)
+        return chunks
+
+
+class TestFeeds(unittest.TestCase):
+    def test_parse_feed_items(self):
+        items = list(parse_feed_items(StringIO(FEED)))
+
+        self.assertEqual(items, [
+            {'url': 'http://mg.co.za/article/2014-05-22-kitchen-cabinet-helps-jz-to-rule', 'text_url': 'http://www.newstools.co.za/data/texts/SFM-5TC9PUI3J6XGJC4Q7WAR.txt', 'author': 'Political Team', 'publishdate': '2014-05-23 00:00:00', 'title': u'\u2018Kitchen cabinet\u2019 helps Jacob Zuma rule'},
+            {'url': 'http://mg.co.za/article/2014-05-22-dont-miss-this-eat-listen-watch', 'text_url': 'http://www.newstools.co.za/data/texts/SFM-9VNENUOQNCNT503VVLYE.txt', 'author': 'M&G Reporters', 'publishdate': '2014-05-23 00:00:00', 'title': "DON'T MISS THIS"},
+        ])
+
+    def test_streamed_response(self):
+        items = list(parse_feed_items(response_stream(FakeResponse())))
+        self.assertEqual(2, len(items))
+        self.assertEqual('M&G Reporters', items[1]['author'])
+
+    def test_response_charset(self):
+        # the server's charset wins over the XML declaration, as with r.text
+        body = FEED.replace("DON'T MISS THIS", 'Caf\xe9 society')
+        items = list(parse_feed_items(response_stream(FakeResponse(body, encoding='ISO-8859-1'))))
+        self.assertEqual(u'Caf\xe9 society', items[1]['title'])
@@ -0,0 +1,70 @@
+import unittest
+import shutil
+import tempfile
+
+from mock import MagicMock
+import requests
+
+from dexter.processing.fetcher import Fetcher
+
+
+def response(status, content='', headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = content
+    r.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    r.url = 'http://example.com/'
+    return r
+
+
+class TestFetcher(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.fetcher = Fetcher(cache_dir=self.cache_dir, backoff=0)
+        self.session = MagicMock()
+        self.fetcher.sessions['example.com'] = self.session
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_retries(self):
+        self.session.request.side_effect = [response(503), response(429), response(200, 'ok')]
+
+        r = self.fetcher.get('http://example.com/')
+        self.assertEqual('ok', r.content)
+        self.assertEqual(3, self.session.request.call_count)
+
+        stats = self.fetcher.metrics()['example.com']
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(2, stats['retries'])
+
+    def test_gives_up(self):
+        self.session.request.return_value = response(500)
+
+        r = self.fetcher.get('http://example.com/')
+        self.assertEqual(500, r.status_code)
+        self.assertEqual(4, self.session.request.call_count)
+
+    def test_retry_after(self):
+        self.assertEqual(5, self.fetcher.retry_delay(0, '5'))
+        # capped
+        self.assertEqual(self.fetcher.max_retry_after, self.fetcher.retry_delay(0, '86400'))
+        # dates aren't supported, so back off as usual
+        self.assertEqual(0, self.fetcher.retry_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    def test_no_retry_on_404(self):
+        self.session.request.return_value = response(404)
+
+        self.assertEqual(404, self.fetcher.get('http://example.com/').status_code)
+        self.assertEqual(1, self.session.request.call_count)
+
+    def test_conditional_get(self):
+        self.session.request.side_effect = [response(200, 'hello', {'ETag': '"abc"'}), response(304)]
+
+        self.assertEqual('hello', self.fetcher.get('http://example.com/').content)
+
+        r = self.fetcher.get('http://example.com/')
+        self.assertEqual(200, r.status_code)
+        self.assertEqual('hello', r.content)
+        self.assertEqual('"abc"', self.session.request.call_args[1]['headers']['If-None-Match'])
+        self.assertEqual(1, self.fetcher.metrics()['example.com']['cache_hits'])
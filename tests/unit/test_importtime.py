@@ -0,0 +1,41 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from dexter.importtime import ImportTimer
+
+
+class TestImportTimer(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, 'slowpkg'))
+        with open(os.path.join(self.path, 'slowpkg', '__init__.py'), 'w') as f:
+            f.write("from . import child\n")
+        with open(os.path.join(self.path, 'slowpkg', 'child.py'), 'w') as f:
+            f.write("import time\ntime.sleep(0.05)\n")
+        sys.path.insert(0, self.path)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        for name in ['slowpkg', 'slowpkg.child']:
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.path)
+
+    def test_times(self):
+        timer = ImportTimer()
+        timer.install()
+        try:
+            import slowpkg  # noqa
+        finally:
+            timer.uninstall()
+
+        slowest = timer.slowest(2)
+        self.assertEqual('slowpkg.child', slowest[0][0])
+        self.assertGreaterEqual(slowest[0][2], 0.05)
+
+        # the package's own time excludes the child's
+        cumulative, own = timer.times['slowpkg']
+        self.assertGreaterEqual(cumulative, 0.05)
+        self.assertLess(own, 0.05)
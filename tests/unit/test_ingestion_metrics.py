@@ -0,0 +1,98 @@
+import json
+import os
+import unittest
+import shutil
+import socket
+import tempfile
+import time
+
+from dexter.processing.metrics import Histogram, IngestionMetrics
+
+
+class TestIngestionMetrics(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_histogram(self):
+        h = Histogram(buckets=(0.1, 1, float('inf')))
+        h.observe(0.05)
+        h.observe(0.1)
+        h.observe(0.5)
+        h.observe(100)
+
+        self.assertEqual([0.1, 1, float('inf')], [b for b, _ in h.cumulative()])
+        self.assertEqual([2, 3, 4], [c for _, c in h.cumulative()])
+        self.assertEqual(4, h.count)
+        self.assertAlmostEqual(100.65, h.sum)
+
+    def test_collect(self):
+        one = IngestionMetrics(spool_dir=self.spool_dir)
+        one.observe('normalise', 0.2)
+        one.count('processed')
+        one.count('duplicate')
+        one.flush(force=True)
+
+        # another process
+        two = IngestionMetrics()
+        two.observe('normalise', 0.3)
+        two.count('processed')
+        with open(os.path.join(self.spool_dir, 'other-1.json'), 'w') as f:
+            json.dump(two.snapshot(), f)
+
+        metrics = IngestionMetrics.collect(self.spool_dir)
+        self.assertEqual({'processed': 2, 'duplicate': 1}, dict(metrics.outcomes))
+        self.assertEqual(2, metrics.stages['normalise'].count)
+        self.assertAlmostEqual(0.5, metrics.stages['normalise'].sum)
+
+    def test_collect_removes_stale(self):
+        live = IngestionMetrics(spool_dir=self.spool_dir)
+        live.count('processed')
+        live.flush(force=True)
+
+        snapshot = json.dumps(live.snapshot())
+        # a process on this machine that has exited
+        dead = os.path.join(self.spool_dir, '%s-%d.json' % (socket.gethostname(), self.exited_pid()))
+        # a process on another machine that we can't check on
+        other = os.path.join(self.spool_dir, 'other-1.json')
+        # and one on another machine that stopped writing long ago
+        old = os.path.join(self.spool_dir, 'other-2.json')
+        for path in [dead, other, old]:
+            with open(path, 'w') as f:
+                f.write(snapshot)
+        an_age_ago = time.time() - IngestionMetrics.SPOOL_MAX_AGE - 60
+        os.utime(old, (an_age_ago, an_age_ago))
+
+        self.assertEqual({'processed': 2}, dict(IngestionMetrics.collect(self.spool_dir).outcomes))
+        self.assertEqual(sorted([os.path.basename(live.spool_path), 'other-1.json']), sorted(os.listdir(self.spool_dir)))
+
+    def exited_pid(self):
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+    def test_flush_interval(self):
+        metrics = IngestionMetrics(spool_dir=self.spool_dir, flush_interval=60)
+        metrics.count('processed')
+        metrics.flush()
+        metrics.count('processed')
+        metrics.flush()
+
+        self.assertEqual({'processed': 1}, dict(IngestionMetrics.collect(self.spool_dir).outcomes))
+
+    def test_to_prometheus(self):
+        metrics = IngestionMetrics()
+        metrics.observe('commit', 0.02)
+        metrics.count('no_sources')
+
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE dexter_ingestion_stage_seconds histogram', text)
+        self.assertIn('dexter_ingestion_stage_seconds_bucket{stage="commit",le="0.01"} 0', text)
+        self.assertIn('dexter_ingestion_stage_seconds_bucket{stage="commit",le="0.025"} 1', text)
+        self.assertIn('dexter_ingestion_stage_seconds_bucket{stage="commit",le="+Inf"} 1', text)
+        self.assertIn('dexter_ingestion_stage_seconds_count{stage="commit"} 1', text)
+        self.assertIn('dexter_ingestion_items_total{outcome="no_sources"} 1', text)
@@ -0,0 +1,44 @@
+import unittest
+from datetime import date
+
+from mock import MagicMock, patch
+
+from dexter.models import Person, Country
+from dexter.analysis.mine import MineWindow, SnapshotSourceAnalyser
+
+
+class TestMineWindow(unittest.TestCase):
+    def test_dates(self):
+        window = MineWindow(Country(name='South Africa'), 7, date(2014, 2, 15))
+        self.assertEqual(window.published_from, '2014-02-08 00:00:00')
+        self.assertEqual(window.published_to, '2014-02-14 23:59:59')
+
+
+class TestSnapshotSourceAnalyser(unittest.TestCase):
+    data = {
+        'n_documents': 12,
+        'days': 4,
+        'top_people': [2, 1],
+        'people': [
+            [2, 9, 100.0, [[1, 50.0], [3, 100.0]]],
+            [1, 3, 33.33, [[0, 100.0]]],
+            [3, 1, 11.11, [[4, 100.0]]],
+        ],
+        'utterances': {},
+    }
+
+    def setUp(self):
+        self.people = dict((i, Person(name='Person %d' % i, id=i)) for i in [1, 2, 3])
+
+    def test_restore(self):
+        with patch.object(SnapshotSourceAnalyser, '_lookup_people', MagicMock(return_value=self.people)):
+            sa = SnapshotSourceAnalyser(self.data)
+
+        self.assertEqual(sa.n_documents, 12)
+        self.assertEqual([s.person.id for s in sa.top_people], [2, 1])
+        self.assertEqual(sa.top_people[0].source_counts, [0, 50.0, 0, 100.0, 0])
+        self.assertEqual(sa.top_people[0].source_counts_total, 9)
+
+        source = sa.source_for(self.people[3])
+        self.assertEqual(source.source_counts, [0, 0, 0, 0, 100.0])
+        self.assertIsNone(sa.source_for(Person(name='Nobody', id=4)))
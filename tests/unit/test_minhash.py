@@ -0,0 +1,55 @@
+import unittest
+
+from dexter.minhash import shingles, similarity, MinHasher, LSHIndex, NearDuplicateGrouper
+
+
+class TestMinHash(unittest.TestCase):
+    def test_shingles(self):
+        self.assertEqual(
+            shingles(u'The quick, brown Fox!', size=2),
+            set(['the quick', 'quick brown', 'brown fox']))
+
+        self.assertEqual(shingles(u'Hi there', size=3), set(['hi there']))
+        self.assertEqual(shingles(u'', size=3), set())
+        self.assertEqual(shingles(u'Caf\xe9 society', size=2), set(['cafe society']))
+
+    def test_signature_similarity(self):
+        hasher = MinHasher(num_perm=128)
+        a = hasher.signature(shingles(u'we will not tolerate corruption in any form in this government', 2))
+        b = hasher.signature(shingles(u'"We will not tolerate corruption in any form in this government," ...', 2))
+        c = hasher.signature(shingles(u'the rand weakened against the dollar on friday morning', 2))
+
+        self.assertEqual(a, b)
+        self.assertEqual(1.0, similarity(a, b))
+        self.assertLess(similarity(a, c), 0.2)
+
+    def test_signatures_are_stable(self):
+        sig = MinHasher(num_perm=16, seed=3).signature(shingles(u'one two three four'))
+        self.assertEqual(sig, MinHasher(num_perm=16, seed=3).signature(shingles(u'one two three four')))
+
+    def test_lsh_candidates(self):
+        hasher = MinHasher()
+        index = LSHIndex(threshold=0.5)
+
+        a = hasher.signature(shingles(u'the minister said the budget would be tabled next week in parliament'))
+        b = hasher.signature(shingles(u'the minister said the budget would be tabled next week in cape town'))
+        c = hasher.signature(shingles(u'heavy rains caused flooding across the province over the weekend'))
+        index.add('a', a)
+        index.add('c', c)
+
+        self.assertEqual(['a'], index.candidates(b))
+
+        index.remove('a', a)
+        self.assertEqual([], index.candidates(b))
+
+    def test_grouper(self):
+        grouper = NearDuplicateGrouper(threshold=0.6, shingle_size=2)
+        quotes = [
+            u'We will not allow anyone to undermine the constitution of this country',
+            u'The economy is in a very difficult place right now',
+            u'we will not allow anyone to undermine the constitution of this country.',
+            u'We will not allow anybody to undermine the constitution of this country',
+            u'The economy is in a very difficult place right now, he said',
+        ]
+
+        self.assertEqual([0, 1, 0, 0, 1], [grouper.add(q) for q in quotes])
@@ -1,7 +1,8 @@
 import unittest
 import datetime
 
-from dexter.models import Document, DocumentSource, Person, Affiliation, Entity, db
+from dexter.models import Document, DocumentSource, Person, Affiliation, Entity, PendingAffiliationRelearn, db
+from dexter.models.problems import DocumentAnalysisProblem
 from dexter.models.seeds import seed_db
 
 from tests.fixtures import dbfixture, DocumentData, PersonData, EntityData
@@ -81,6 +82,93 @@ class TestDocument(unittest.TestCase):
         self.assertFalse(zuma.relearn_affiliation())
         self.assertEqual(anc, zuma.affiliation)
 
+    def test_relearn_affiliations_batch(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        joe = Person.query.get(self.fx.PersonData.joe_author.id)
+        anc = Affiliation.query.filter(Affiliation.code == '4.3').one()
+
+        doc = Document.query.get(self.fx.DocumentData.simple.id)
+        doc.published_at = datetime.datetime.utcnow()
+
+        ds = DocumentSource()
+        ds.document = doc
+        ds.person = zuma
+        ds.affiliation = anc
+        self.db.session.add(ds)
+        self.db.session.flush()
+
+        # only joe, so nothing changes
+        self.assertEqual(0, Person.relearn_affiliations([joe.id]))
+        # everyone
+        self.assertEqual(1, Person.relearn_affiliations())
+
+        self.db.session.expire_all()
+        self.assertEqual(anc, Person.query.get(zuma.id).affiliation)
+        self.assertIsNone(Person.query.get(joe.id).affiliation)
+
+    def test_relearn_source_affiliations_queues(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        anc = Affiliation.query.filter(Affiliation.code == '4.3').one()
+
+        doc = Document.query.get(self.fx.DocumentData.simple.id)
+        doc.published_at = datetime.datetime.utcnow()
+        doc.add_source(DocumentSource(person=zuma, source_type='person', affiliation=anc))
+        self.db.session.flush()
+
+        self.assertTrue(doc.relearn_source_affiliations())
+        self.db.session.flush()
+        self.assertEqual([zuma.id], [p.person_id for p in PendingAffiliationRelearn.query.all()])
+
+        self.assertEqual(1, Person.relearn_pending_affiliations())
+        self.assertEqual([], PendingAffiliationRelearn.query.all())
+
+    def test_reset_all_affiliations_updates_problems(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        anc = Affiliation.query.filter(Affiliation.code == '4.3').one()
+        problem = DocumentAnalysisProblem.lookup('source-without-affiliation')
+
+        doc = Document.query.get(self.fx.DocumentData.simple.id)
+        doc.add_source(DocumentSource(person=zuma, source_type='person'))
+        self.db.session.commit()
+        self.assertTrue(doc.problems & problem.mask)
+
+        zuma.affiliation = anc
+        zuma.reset_all_affiliations()
+        self.db.session.commit()
+
+        self.assertEqual(anc, doc.sources[0].affiliation)
+        self.assertFalse(doc.problems & problem.mask)
+
+    def test_merge_people_updates_problems(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        joe = Person.query.get(self.fx.PersonData.joe_author.id)
+        anc = Affiliation.query.filter(Affiliation.code == '4.3').one()
+        problem = DocumentAnalysisProblem.lookup('source-without-affiliation')
+
+        doc = Document.query.get(self.fx.DocumentData.simple.id)
+        doc.add_source(DocumentSource(person=zuma, source_type='person', affiliation=anc))
+        doc.add_source(DocumentSource(person=joe, source_type='person'))
+        self.db.session.commit()
+        self.assertTrue(doc.problems & problem.mask)
+
+        # joe's source, without an affiliation, is a duplicate of zuma's
+        Person.merge_people([(joe.id, zuma.id)])
+        self.db.session.commit()
+
+        self.assertEqual([zuma.id], [s.person_id for s in doc.sources])
+        self.assertFalse(doc.problems & problem.mask)
+
+    def test_enqueue_ignores_queued(self):
+        zuma = Person.query.get(self.fx.PersonData.zuma.id)
+        joe = Person.query.get(self.fx.PersonData.joe_author.id)
+
+        PendingAffiliationRelearn.enqueue([zuma.id])
+        # as another request saving the same person would
+        PendingAffiliationRelearn.enqueue([zuma.id, joe.id, zuma.id])
+        self.db.session.commit()
+
+        self.assertEqual(sorted([zuma.id, joe.id]), sorted(p.person_id for p in PendingAffiliationRelearn.query.all()))
+
     def test_merge(self):
         # we're going to merge joe into zuma
         joe = Person.query.get(self.fx.PersonData.joe_author.id)
@@ -0,0 +1,68 @@
+import unittest
+
+from dexter.models import Document, DocumentPlace, Place, db
+from dexter.models.seeds import seed_db
+
+from tests.fixtures import dbfixture, DocumentData
+
+
+class TestPlaceSummary(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.doc = Document.query.get(self.fx.DocumentData.simple.id)
+        self.doc2 = Document.query.get(self.fx.DocumentData.simple2.id)
+
+        self.province = Place(level='province', province_name='Gauteng', province_code='GT')
+        self.mainplace = Place(
+            level='mainplace', mainplace_name='Soweto', mainplace_code='798014',
+            municipality_code='JHB', province_name='Gauteng', province_code='GT',
+            lat='-26.2', lng='27.8')
+
+        self.doc.places.append(DocumentPlace(place=self.mainplace, relevance=0.9, relevant=True))
+        self.doc.places.append(DocumentPlace(place=self.province, relevance=0.2, relevant=True))
+        self.doc2.places.append(DocumentPlace(place=self.mainplace, relevance=0.5, relevant=True))
+        self.doc2.places.append(DocumentPlace(place=self.province, relevance=0.8, relevant=False))
+        db.session.commit()
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def summary(self, top_documents=0):
+        summary = DocumentPlace.summary_for_query(db.session.query(Document.id), top_documents=top_documents)
+        summary['mentions'] = dict((m['id'], m) for m in summary['mentions'])
+        return summary
+
+    def test_counts(self):
+        summary = self.summary()
+        mentions = summary['mentions']
+
+        self.assertEqual(summary['document_count'], 2)
+        self.assertEqual(sorted(mentions.keys()), ['mainplace-798014', 'province-GT'])
+
+        self.assertEqual(mentions['mainplace-798014']['document_count'], 2)
+        self.assertEqual(mentions['mainplace-798014']['coordinates'], [-26.2, 27.8])
+        self.assertEqual(mentions['mainplace-798014']['documents'], [])
+
+        # only relevant places count
+        self.assertEqual(mentions['province-GT']['document_count'], 1)
+        # regions get the centroid of their mainplaces
+        self.assertEqual(mentions['province-GT']['coordinates'], [-26.2, 27.8])
+
+    def test_top_documents(self):
+        mentions = self.summary(top_documents=1)['mentions']
+        self.assertEqual(mentions['mainplace-798014']['documents'], [self.doc.id])
+        self.assertEqual(mentions['province-GT']['documents'], [self.doc.id])
+
+        mentions = self.summary(top_documents=2)['mentions']
+        self.assertEqual(mentions['mainplace-798014']['documents'], [self.doc.id, self.doc2.id])
+        self.assertEqual(mentions['mainplace-798014']['document_count'], 2)
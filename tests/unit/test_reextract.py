@@ -0,0 +1,104 @@
+import json
+import unittest
+from collections import Counter
+
+from dexter.models import Document, Entity, db
+from dexter.models.seeds import seed_db
+from dexter.processing.reextract import Reextractor, ReextractionEngine
+
+from tests.fixtures import dbfixture, DocumentData
+
+
+class TestReextract(unittest.TestCase):
+    calais = {
+        'topics': {
+            'a': {
+                'x': {'name': 'Business_Finance', 'score': 0.9},
+                'y': {'name': 'Politics', 'score': 0.5},
+            },
+        },
+    }
+
+    def test_taxonomies(self):
+        doc = Document()
+        rx = Reextractor(['taxonomies'])
+
+        changes = rx.reextract(doc, self.calais)
+        self.assertEqual(changes, Counter({'taxonomies.added': 2}))
+        self.assertEqual(sorted(dt.label for dt in doc.taxonomies), ['Business Finance', 'Politics'])
+
+        # unchanged
+        self.assertEqual(rx.reextract(doc, self.calais), Counter())
+
+    def test_aspects(self):
+        engine = ReextractionEngine(['places', 'entities'])
+        self.assertEqual(engine.aspects, ['entities', 'places'])
+
+        self.assertRaises(ValueError, ReextractionEngine, ['people'])
+
+
+class TestReextractBatch(unittest.TestCase):
+    calais = {
+        'doc': {'info': {}},
+        'http://d.opencalais.com/pershash-1/1': {
+            '_typeGroup': 'entities',
+            '_type': 'Person',
+            'name': 'Cyril Ramaphosa',
+            'relevance': 0.8,
+            'instances': [{'offset': 0, 'length': 15}],
+        },
+        'http://d.opencalais.com/genericHasher-1/1': {
+            '_typeGroup': 'relations',
+            '_type': 'Quotation',
+            'speaker': 'http://d.opencalais.com/pershash-1/1',
+            'quotation': 'we do fun things',
+        },
+    }
+
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.doc_ids = [self.fx.DocumentData.simple.id, self.fx.DocumentData.simple2.id]
+        for doc in Document.query.filter(Document.id.in_(self.doc_ids)):
+            doc.raw_calais = json.dumps(self.calais)
+        db.session.commit()
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def test_overlapping_batches(self):
+        rx = Reextractor(['entities'])
+        fetch_entities = rx.calais.fetch_entities
+
+        def fetch_while_another_worker_commits(pairs, lock=False):
+            entities = fetch_entities(pairs, lock=lock)
+            if not lock:
+                # another worker adds the same new entity and commits
+                # after this batch has begun
+                with db.engine.begin() as conn:
+                    conn.execute(Entity.__table__.insert(), [{'group': 'person', 'name': 'Cyril Ramaphosa'}])
+            return entities
+        rx.calais.fetch_entities = fetch_while_another_worker_commits
+
+        result = rx.reextract_batch(self.doc_ids[:1])
+        self.assertEqual(result['changes']['utterances.added'], 1)
+        db.session.remove()
+
+        # a batch that needs the entity that now exists
+        result = Reextractor(['entities']).reextract_batch(self.doc_ids[1:])
+        self.assertEqual(result['changes']['utterances.added'], 1)
+        db.session.remove()
+
+        entities = Entity.query.filter(Entity.name == 'Cyril Ramaphosa').all()
+        self.assertEqual(len(entities), 1)
+        for doc in Document.query.filter(Document.id.in_(self.doc_ids)):
+            self.assertEqual([u.entity_id for u in doc.utterances], [entities[0].id])
@@ -0,0 +1,63 @@
+import unittest
+import shutil
+import tempfile
+
+import requests
+from mock import MagicMock, patch
+
+from dexter.models import Document
+from dexter.processing.fetcher import Fetcher
+from dexter.processing.replay import FixtureBundle, replaying, request_key, record_feed_item
+
+
+def response(status, content, headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = content
+    r.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    return r
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.bundle = FixtureBundle(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_request_key(self):
+        self.assertEqual(request_key('get', 'http://example.com/'), request_key('GET', u'http://example.com/'))
+        self.assertNotEqual(request_key('POST', 'http://example.com/', 'a'), request_key('POST', 'http://example.com/', 'b'))
+
+    def test_replay(self):
+        self.bundle.add('GET', 'http://example.com/feed', None, response(200, '<rss/>', {'Content-Type': 'text/xml'}))
+        self.bundle.add('POST', 'http://example.com/calais', 'text', response(200, '{}'))
+
+        # reload from disk
+        bundle = FixtureBundle(self.path)
+        self.assertEqual(2, len(bundle))
+
+        with replaying(bundle):
+            r = Fetcher.shared().get('http://example.com/feed')
+            self.assertEqual(200, r.status_code)
+            self.assertEqual('<rss/>', r.content)
+            self.assertEqual('text/xml', r.headers['content-type'])
+
+            self.assertEqual('{}', Fetcher.shared().post('http://example.com/calais', 'text').content)
+            self.assertEqual(404, Fetcher.shared().get('http://example.com/missing').status_code)
+
+    def test_record_feed_item(self):
+        processor = MagicMock()
+        processor.canonicalise_url.side_effect = lambda url: url
+        processor.newstools_crawler.crawl.return_value = Document(text=u'the first\r\nthe second')
+
+        with patch('dexter.processing.extractors.CalaisExtractor.fetch_data') as fetch_data, \
+                patch('dexter.models.db.session') as session:
+            record_feed_item(processor, {'url': 'http://mg.co.za/article/2014-09-07-a'})
+
+            # as normalised when processing
+            doc = fetch_data.call_args[0][0]
+            self.assertEqual(doc.text, u'the first\n\nthe second')
+            self.assertFalse(session.add.called)
+            self.assertTrue(session.rollback.called)
@@ -0,0 +1,48 @@
+import unittest
+
+from sqlalchemy import create_engine, select
+
+from dexter.app import app
+from dexter.models import db, Document
+from dexter.replica import replica_reads
+
+
+class TestReplicaRouting(unittest.TestCase):
+    def setUp(self):
+        app.config['SQLALCHEMY_REPLICA_URI'] = 'sqlite://'
+        self.replica = db.get_replica_engine(app)
+        self.session = db.session()
+        self.mapper = Document.__mapper__
+
+    def tearDown(self):
+        app.config.pop('SQLALCHEMY_REPLICA_URI')
+        db.replica_engines.clear()
+        db.session.remove()
+
+    def bind(self, clause):
+        return self.session.get_bind(self.mapper, clause)
+
+    def test_reads(self):
+        query = select([Document.__table__.c.id])
+
+        self.assertIs(self.bind(query), db.engine)
+        with replica_reads():
+            self.assertIs(self.bind(query), self.replica)
+            self.assertIs(self.bind(query.with_for_update()), db.engine)
+        self.assertIs(self.bind(query), db.engine)
+
+    def test_writes(self):
+        query = select([Document.__table__.c.id])
+
+        with replica_reads():
+            self.assertIs(self.bind(Document.__table__.delete()), db.engine)
+            # the transaction has written, so it must see its own writes
+            self.assertIs(self.bind(query), db.engine)
+
+            db.session.rollback()
+            self.assertIs(self.bind(query), self.replica)
+
+    def test_engine(self):
+        # SQLite's pool can't be sized
+        self.assertIsNotNone(self.replica)
+        self.assertIs(db.get_replica_engine(app), self.replica)
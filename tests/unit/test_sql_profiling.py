@@ -0,0 +1,81 @@
+import unittest
+import shutil
+import tempfile
+
+from mock import MagicMock
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from dexter.app import app
+from dexter.models import db
+from dexter.profiling import statement_shape, RequestProfile, SQLProfiler, collect_summaries
+
+
+class Connection(object):
+    def __init__(self):
+        self.info = {}
+
+
+class TestSQLProfiling(unittest.TestCase):
+    def setUp(self):
+        self.summary_dir = tempfile.mkdtemp()
+        self.profiler = SQLProfiler(self.summary_dir, threshold=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.summary_dir)
+
+    def run_query(self, conn, statement):
+        self.profiler.before_cursor_execute(conn, None, statement, None, None, False)
+        self.profiler.after_cursor_execute(conn, None, statement, None, None, False)
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            'SELECT people.id FROM people WHERE people.id IN (?) LIMIT ?',
+            statement_shape('SELECT people.id\n FROM people WHERE people.id IN (%s, %s, %s) LIMIT 10'))
+        self.assertEqual(
+            statement_shape('SELECT * FROM entities_1 WHERE id IN (1, 2)'),
+            statement_shape('SELECT * FROM entities_1 WHERE id IN (3)'))
+
+    def test_n_plus_one(self):
+        conn = Connection()
+        self.profiler.local.profile = RequestProfile('show_article', '12')
+
+        self.run_query(conn, 'SELECT * FROM documents WHERE id = %s')
+        for i in xrange(5):
+            self.run_query(conn, 'SELECT * FROM people WHERE people.id = %s')
+
+        profile = self.profiler.current
+        self.assertEqual(6, profile.queries)
+        self.assertEqual(['SELECT * FROM people WHERE people.id = %s'], [s for _, _, s in profile.repeated(3)])
+
+        self.profiler.finish()
+        self.assertIsNone(self.profiler.current)
+
+        summary = collect_summaries(self.summary_dir)
+        self.assertEqual(1, summary['show_article']['requests'])
+        self.assertEqual(6, summary['show_article']['queries'])
+        self.assertEqual(1, summary['show_article']['n_plus_one'])
+        self.assertEqual({'SELECT * FROM people WHERE people.id = %s': 5}, summary['show_article']['repeated_shapes'])
+
+    def test_outside_request(self):
+        conn = Connection()
+        self.run_query(conn, 'SELECT 1')
+        self.assertEqual({}, conn.info)
+
+    def test_replica_queries(self):
+        self.profiler.install(MagicMock())
+        app.config['SQLALCHEMY_REPLICA_URI'] = 'sqlite://'
+        try:
+            # the replica engine is created after profiling is installed
+            replica = db.get_replica_engine(app)
+
+            self.profiler.local.profile = RequestProfile('mine', '12')
+            replica.execute('SELECT 1')
+            # counted once
+            self.assertEqual(1, self.profiler.current.queries)
+            self.assertEqual(['SELECT 1'], self.profiler.current.shapes.keys())
+        finally:
+            event.remove(Engine, 'before_cursor_execute', self.profiler.before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self.profiler.after_cursor_execute)
+            app.config.pop('SQLALCHEMY_REPLICA_URI')
+            db.replica_engines.clear()
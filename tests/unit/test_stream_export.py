@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import unittest
+import zlib
+from datetime import datetime
+
+from dexter.analysis.stream_export import CSVEncoder, NDJSONEncoder, gzip_chunks
+
+
+class TestStreamExport(unittest.TestCase):
+    columns = ['document_id', 'title', 'published_at']
+    rows = [
+        (1, u'Caf\xe9 opens', datetime(2014, 2, 10, 9, 30)),
+        (2, None, datetime(2014, 2, 11)),
+    ]
+
+    def test_csv(self):
+        encode = CSVEncoder(self.columns)
+        self.assertEqual(encode.header(), 'document_id,title,published_at\r\n')
+        self.assertEqual(encode(self.rows),
+                         '1,Caf\xc3\xa9 opens,2014-02-10T09:30:00\r\n'
+                         '2,,2014-02-11T00:00:00\r\n')
+
+    def test_ndjson(self):
+        encode = NDJSONEncoder(self.columns)
+        lines = encode(self.rows).split('\n')
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], '')
+        self.assertIn('"title":"Caf\\u00e9 opens"', lines[0])
+        self.assertIn('"title":null', lines[1])
+        self.assertIn('"published_at":"2014-02-11T00:00:00"', lines[1])
+
+    def test_gzip(self):
+        chunks = ['a,b\r\n', '1,2\r\n' * 100, '3,4\r\n']
+        data = ''.join(gzip_chunks(iter(chunks)))
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS), ''.join(chunks))
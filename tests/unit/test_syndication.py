@@ -0,0 +1,149 @@
+import unittest
+from datetime import datetime, timedelta
+
+from mock import MagicMock
+
+from dexter.models import Document, DocumentEntity, Entity, Utterance, DocumentSyndication, DocumentFingerprint, db
+from dexter.models.seeds import seed_db
+from dexter.processing import DocumentProcessorNT
+from dexter.processing.syndication import SyndicationIndex
+
+from tests.fixtures import dbfixture, DocumentData
+
+
+TEXT = u'The minister said that the new schools would open in January, ' \
+       u'and that every child in the province would have a place in one of them.'
+# the same story, re-punctuated by another medium
+COPY = u'The Minister said that the new schools would open in January and ' \
+       u'that every child in the province would have a place in one of them!'
+OTHER = u'The rand weakened against the dollar on Friday morning after the ' \
+        u'central bank left interest rates unchanged for another quarter.'
+
+
+class TestSyndicationIndex(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.doc = Document.query.get(self.fx.DocumentData.simple.id)
+        self.doc2 = Document.query.get(self.fx.DocumentData.simple2.id)
+        self.index = SyndicationIndex()
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def fingerprint(self, doc, text, days_ago):
+        fingerprint = DocumentFingerprint()
+        fingerprint.published_at = datetime.utcnow() - timedelta(days=days_ago)
+        fingerprint.signature = self.index.signature(text)
+        doc.fingerprint = fingerprint
+        db.session.commit()
+
+    def test_refresh(self):
+        self.fingerprint(self.doc, TEXT, 2)
+        # outside the window
+        self.fingerprint(self.doc2, OTHER, 10)
+
+        self.index.refresh()
+        self.assertEqual(self.index.entries.keys(), [self.doc.id])
+        self.assertEqual(self.index.entries[self.doc.id][1], self.index.signature(TEXT))
+
+        # new fingerprints are added
+        db.session.delete(self.doc2.fingerprint)
+        db.session.commit()
+        self.fingerprint(self.doc2, OTHER, 1)
+
+        self.index.refresh()
+        self.assertEqual(sorted(self.index.entries.keys()), sorted([self.doc.id, self.doc2.id]))
+
+        # old ones are dropped as the window moves on
+        self.index.window = timedelta(days=1, hours=12)
+        self.index.refresh()
+        self.assertEqual(self.index.entries.keys(), [self.doc2.id])
+        self.assertEqual(self.index.index.candidates(self.index.signature(TEXT)), [])
+
+    def test_find(self):
+        self.fingerprint(self.doc, TEXT, 1)
+        self.fingerprint(self.doc2, OTHER, 1)
+
+        doc_id, similarity = self.index.find(self.index.signature(COPY))
+        self.assertEqual(doc_id, self.doc.id)
+        self.assertGreaterEqual(similarity, self.index.threshold)
+
+        self.assertEqual((None, None), self.index.find(self.index.signature(u'Something else entirely happened today.')))
+
+
+class TestSyndicatedDocument(unittest.TestCase):
+    def setUp(self):
+        self.db = db
+        self.db.drop_all()
+        self.db.create_all()
+        seed_db(db)
+
+        self.fx = dbfixture.data(DocumentData)
+        self.fx.setup()
+
+        self.canonical = Document.query.get(self.fx.DocumentData.simple.id)
+        self.canonical.text = TEXT
+        self.canonical.raw_calais = '{"doc": {}}'
+        db.session.commit()
+
+        self.dp = DocumentProcessorNT()
+        self.dp.syndication = SyndicationIndex()
+        self.dp.process_document = MagicMock(side_effect=self.extract)
+
+    def tearDown(self):
+        self.db.session.remove()
+
+        self.fx.teardown()
+        self.db.drop_all()
+
+    def extract(self, doc):
+        """ Stands in for extraction, which must use the canonical OpenCalais results. """
+        self.assertEqual(doc.raw_calais, self.canonical.raw_calais)
+
+        entity = Entity(group='person', name=u'The Minister')
+        doc.entities.append(DocumentEntity(entity=entity, relevance=0.5, count=1, offset_list='0:12'))
+        doc.utterances.append(Utterance(entity=entity, quote=u'the new schools would open', offset=30, length=26))
+
+    def test_process_syndicated_copy(self):
+        doc = Document(text=COPY)
+        self.dp.process_syndicated_document(doc, self.canonical, 0.95)
+
+        self.assertEqual(doc.syndication.canonical, self.canonical)
+        self.assertEqual(doc.syndication.similarity, 0.95)
+
+        # offsets were for the canonical text
+        self.assertIsNone(doc.entities[0].offset_list)
+        self.assertIsNone(doc.utterances[0].offset)
+        self.assertIsNone(doc.utterances[0].length)
+
+    def test_process_syndicated_same_text(self):
+        doc = Document(text=TEXT)
+        self.dp.process_syndicated_document(doc, self.canonical, 1.0)
+
+        self.assertIsNotNone(doc.syndication)
+        self.assertEqual(doc.entities[0].offset_list, '0:12')
+        self.assertEqual(doc.utterances[0].offset, 30)
+
+    def test_find_syndicated_links_to_original(self):
+        copy = Document.query.get(self.fx.DocumentData.simple2.id)
+        copy.syndication = DocumentSyndication(canonical=self.canonical, similarity=0.9)
+        copy.fingerprint = DocumentFingerprint(published_at=datetime.utcnow())
+        copy.fingerprint.signature = self.dp.syndication.signature(COPY)
+        db.session.commit()
+
+        # only the copy is in the index
+        canonical, similarity = self.dp.find_syndicated(self.dp.syndication.signature(COPY))
+        self.assertEqual(canonical, self.canonical)
+        self.assertEqual(similarity, 1.0)
+
+        self.assertEqual((None, None), self.dp.find_syndicated(self.dp.syndication.signature(OTHER)))
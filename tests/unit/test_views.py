@@ -0,0 +1,51 @@
+import os
+import re
+import unittest
+
+from dexter.models.views import VIEWS
+
+VIEWS_SQL = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'mysql', 'views.sql')
+
+
+def split_columns(select):
+    """ Split a select list on the commas that aren't inside brackets. """
+    columns, depth, current = [], 0, ''
+    for c in select:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            columns.append(current)
+            current = ''
+            continue
+        current += c
+    columns.append(current)
+    return columns
+
+
+def column_name(column):
+    column = column.strip()
+    match = re.search(r'\bas\s+`?(\w+)`?$', column, re.I)
+    if match:
+        return match.group(1)
+    return column.split('.')[-1]
+
+
+def parse_views(sql):
+    """ Dict from view name to list of column names, from the view definitions in views.sql. """
+    sql = re.sub(r'--[^\n]*', '', sql)
+    views = {}
+    for match in re.finditer(r'create or replace view (\w+) as\s+select(.*?)\sfrom\s', sql, re.S | re.I):
+        views[match.group(1)] = [column_name(c) for c in split_columns(match.group(2))]
+    return views
+
+
+class TestViews(unittest.TestCase):
+    def test_views_match_sql(self):
+        with open(VIEWS_SQL) as f:
+            expected = parse_views(f.read())
+
+        self.assertEqual(sorted(expected.keys()), sorted(v.name for v in VIEWS))
+        for view in VIEWS:
+            self.assertEqual(expected[view.name], [c.name for c in view.columns], view.name)